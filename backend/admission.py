@@ -0,0 +1,209 @@
+"""
+Controllo di ammissione per le route costose (chiamate a Gemini, sintesi vocale).
+
+Ogni classe di route ha un limite di richieste in esecuzione e una coda limitata.
+Quando il limite è raggiunto le nuove richieste attendono in coda (al massimo
+`queue_timeout` secondi); se anche la coda è piena vengono rifiutate subito con
+429 e Retry-After. Così un rallentamento del provider LLM occupa al più
+`concurrency + queue_size` richieste, invece di accumulare worker e sessioni del
+database fino a far scadere anche gli endpoint economici.
+
+Il limitatore va dichiarato come prima dipendenza della route (parametro
+`dependencies` del decoratore): le richieste in coda non hanno ancora aperto una
+sessione del database. Le route che rispondono con un corpo generato durante
+l'invio usano `admission_slot` e AdmittedStreamingResponse, così il posto resta
+occupato per tutto lo streaming.
+
+Configurazione per classe, ad esempio per "llm":
+    ADMISSION_LLM_CONCURRENCY=4, ADMISSION_LLM_QUEUE=16,
+    ADMISSION_LLM_QUEUE_TIMEOUT=10, ADMISSION_LLM_RETRY_AFTER=5
+"""
+import asyncio
+import logging
+import os
+import statistics
+import time
+from collections import deque
+from typing import Deque, Dict
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+WAIT_SAMPLES = 1000  # attese in coda usate per i percentili
+
+
+def _env(name: str, setting: str, default: str) -> str:
+    return os.getenv(f"ADMISSION_{name.upper()}_{setting}", default)
+
+
+class AdmissionLimiter:
+    """
+    Semaforo con coda limitata. Usato solo dall'event loop, quindi senza lock; i
+    futures sono creati sul loop corrente, così il limitatore non resta legato al
+    primo loop che lo usa.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float, retry_after: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+    @classmethod
+    def from_env(cls, name: str, concurrency: int, queue_size: int, queue_timeout: float, retry_after: int):
+        return cls(
+            name,
+            concurrency=int(_env(name, "CONCURRENCY", str(concurrency))),
+            queue_size=int(_env(name, "QUEUE", str(queue_size))),
+            queue_timeout=float(_env(name, "QUEUE_TIMEOUT", str(queue_timeout))),
+            retry_after=int(_env(name, "RETRY_AFTER", str(retry_after))),
+        )
+
+    def _reject(self, detail: str) -> HTTPException:
+        return HTTPException(
+            status.HTTP_429_TOO_MANY_REQUESTS, detail, headers={"Retry-After": str(self.retry_after)}
+        )
+
+    async def acquire(self):
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            self._admit(0.0)
+            return
+        if len(self._waiters) >= self.queue_size:
+            self._stats["rejected"] += 1
+            logger.warning(f"Ammissione '{self.name}': coda piena, richiesta rifiutata")
+            raise self._reject(f"Too many pending {self.name} requests, retry later")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._stats["queued"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            self._stats["timed_out"] += 1
+            logger.warning(f"Ammissione '{self.name}': attesa in coda oltre {self.queue_timeout}s")
+            raise self._reject(f"Timed out waiting for a {self.name} slot, retry later")
+        except asyncio.CancelledError:
+            # Client disconnesso: se il posto era già stato ceduto a questa richiesta, va restituito
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self._admit(time.monotonic() - started)
+
+    def _admit(self, waited: float):
+        self._stats["admitted"] += 1
+        self._waits.append(waited)
+
+    def release(self):
+        # Il posto passa direttamente al primo in coda ancora in attesa
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "active": self._active,
+            "waiting": len(self._waiters),
+            **self._stats,
+            "queue_wait_seconds": {
+                "samples": len(waits),
+                "avg": statistics.fmean(waits) if waits else None,
+                "p50": waits[len(waits) // 2] if waits else None,
+                "p95": waits[int(len(waits) * 0.95)] if waits else None,
+                "max": waits[-1] if waits else None,
+            },
+        }
+
+
+# Classi di route: generazione con Gemini e sintesi vocale
+limiters: Dict[str, AdmissionLimiter] = {
+    "llm": AdmissionLimiter.from_env("llm", concurrency=4, queue_size=16, queue_timeout=10, retry_after=5),
+    "tts": AdmissionLimiter.from_env("tts", concurrency=2, queue_size=8, queue_timeout=10, retry_after=5),
+}
+
+
+def admission(name: str):
+    """Dipendenza FastAPI che occupa un posto della classe `name` per tutta la richiesta."""
+    limiter = limiters[name]
+
+    async def dependency():
+        await limiter.acquire()
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    return dependency
+
+
+class AdmissionSlot:
+    """Posto occupato da una richiesta; `release` è idempotente."""
+
+    def __init__(self, limiter: AdmissionLimiter):
+        self.limiter = limiter
+        self.handed_off = False  # ceduto a una AdmittedStreamingResponse
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.limiter.release()
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse che tiene occupato il posto finché il corpo non è stato inviato.
+    L'uscita delle dipendenze yield avviene prima dell'invio del corpo, quindi con un
+    corpo generato in modo pigro (sintesi vocale) il posto va ceduto alla risposta.
+    """
+
+    def __init__(self, slot: AdmissionSlot, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slot = slot
+        slot.handed_off = True
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Anche se il client si disconnette o il generatore fallisce
+            self.slot.release()
+
+
+def admission_slot(name: str):
+    """Come `admission`, ma restituisce il posto alla route, che può cederlo a una AdmittedStreamingResponse."""
+    limiter = limiters[name]
+
+    async def dependency():
+        await limiter.acquire()
+        slot = AdmissionSlot(limiter)
+        try:
+            yield slot
+        finally:
+            if not slot.handed_off:
+                slot.release()
+
+    return dependency
+
+
+def admission_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in limiters.items()}
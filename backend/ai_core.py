@@ -9,6 +9,7 @@ import os
 import json
 import uuid
 import aiofiles
+from tracing import span
 
 # Carica le variabili d'ambiente dal file .env
 load_dotenv()
@@ -113,14 +114,15 @@ def process_request(request_data: ProcessRequest) -> ProcessedContent:
     - L'output "adapted_text" DEVE essere il testo completo formattato in HTML e pronto per essere renderizzato in una pagina web.
     """
 
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=generate_final_system_prompt(request_data, system_prompt),
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": ProcessedContent,
-        },
-    )
+    with span("gemini.generate_content", kind="client", **{"llm.model": "gemini-2.0-flash", "llm.task": "process_request"}):
+        response = client.models.generate_content(
+            model="gemini-2.0-flash",
+            contents=generate_final_system_prompt(request_data, system_prompt),
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": ProcessedContent,
+            },
+        )
     return response
 
 # Tag extraction
@@ -178,14 +180,15 @@ def extract_tags(article: ArticleInput) -> ArticleTags:
     Provide your output as a JSON object:
     """
 
-    response = genai.Client(api_key=GEMINI_API_KEY).models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": ArticleTags,
-        },
-    )
+    with span("gemini.generate_content", kind="client", **{"llm.model": "gemini-2.0-flash", "llm.task": "extract_tags"}):
+        response = genai.Client(api_key=GEMINI_API_KEY).models.generate_content(
+            model="gemini-2.0-flash",
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": ArticleTags,
+            },
+        )
     response_data_dict = json.loads(response.text)
     article_tags = ArticleTags(**response_data_dict)
     return article_tags
@@ -352,16 +355,18 @@ async def generate_html_from_llm(system_prompt: str, temperature: float = 0.5) -
     try:
         print(f"Invio richiesta a Gemini con temperatura: {temperature}")
         client = genai.Client(api_key=GEMINI_API_KEY)
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-preview-05-20",
-            contents=system_prompt,
-
-            config=types.GenerateContentConfig(
-            thinking_config=types.ThinkingConfig(
-                include_thoughts=True
-            ))
-        )
-        print(response)
+        with span("gemini.generate_content", kind="client", **{"llm.model": "gemini-2.5-flash-preview-05-20", "llm.task": "generate_html"}):
+            response = client.models.generate_content(
+                model="gemini-2.5-flash-preview-05-20",
+                contents=system_prompt,
+
+                config=types.GenerateContentConfig(
+                thinking_config=types.ThinkingConfig(
+                    include_thoughts=True
+                ))
+            )
+        # Solo la dimensione: la risposta completa include i pensieri del modello
+        print(f"Risposta Gemini ricevuta: {len(response.text or '')} caratteri")
         return response.text
 
     except Exception as e:
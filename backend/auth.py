@@ -0,0 +1,194 @@
+"""
+Token di sessione firmati e verifica delle password fuori dall'event loop.
+
+Token: `v1.<payload>.<firma>`, con payload JSON in base64url (sub = id utente,
+iat, exp) firmato con HMAC-SHA256. La verifica è un confronto HMAC in memoria:
+nessuna query e nessun bcrypt, quindi i client ripetono il login solo alla scadenza.
+SESSION_SECRET deve essere uguale su tutti i worker; se manca viene generato un
+segreto casuale per processo (i token non sopravvivono a un riavvio).
+
+bcrypt gira in un pool di processi dedicato (BCRYPT_WORKERS), così un picco di login
+non occupa la CPU del worker che serve le letture. Al massimo BCRYPT_MAX_PENDING
+verifiche possono essere in corso o in coda; oltre, il login risponde subito 503
+con Retry-After invece di accodarsi senza limite. I processi del pool usano il
+contesto spawn e reimportano il modulo di avvio: il server va avviato con
+`uvicorn main:app` (come nel Dockerfile).
+
+Gli endpoint di amministrazione (profiling, diagnostica) richiedono l'header
+X-Admin-Token uguale ad ADMIN_TOKEN; senza ADMIN_TOKEN sono disabilitati.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+from fastapi import Depends, Header, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+logger = logging.getLogger(__name__)
+
+SESSION_TOKEN_TTL = int(os.getenv("SESSION_TOKEN_TTL", str(7 * 24 * 3600)))
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "32"))
+BCRYPT_RETRY_AFTER = 2  # secondi suggeriti al client quando il pool è saturo
+
+_TOKEN_VERSION = "v1"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _secret() -> bytes:
+    global SESSION_SECRET
+    if not SESSION_SECRET:
+        logger.warning("SESSION_SECRET non impostato: uso un segreto casuale valido solo per questo processo.")
+        SESSION_SECRET = secrets.token_urlsafe(32)
+    return SESSION_SECRET.encode("utf-8")
+
+
+def _sign(message: str) -> str:
+    return _b64encode(hmac.new(_secret(), message.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_token(user_id: str, ttl: int = SESSION_TOKEN_TTL) -> dict:
+    now = int(time.time())
+    payload = _b64encode(json.dumps({"sub": user_id, "iat": now, "exp": now + ttl}, separators=(",", ":")).encode())
+    message = f"{_TOKEN_VERSION}.{payload}"
+    return {"access_token": f"{message}.{_sign(message)}", "token_type": "bearer", "expires_in": ttl}
+
+
+def verify_token(token: str) -> str:
+    """Restituisce l'id utente del token, o solleva InvalidToken."""
+    # compare_digest accetta solo str ASCII, e la firma è calcolata sui byte ASCII del messaggio
+    if not token.isascii():
+        raise InvalidToken("Token malformato")
+    try:
+        version, payload, signature = token.split(".")
+    except ValueError:
+        raise InvalidToken("Token malformato")
+    if version != _TOKEN_VERSION or not hmac.compare_digest(signature.encode(), _sign(f"{version}.{payload}").encode()):
+        raise InvalidToken("Firma non valida")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise InvalidToken("Token malformato")
+    if claims.get("exp", 0) < time.time():
+        raise InvalidToken("Token scaduto")
+    return claims["sub"]
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def get_current_user_id(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> str:
+    """Dipendenza FastAPI per le route che richiedono un token."""
+    if credentials is None:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Missing token", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return verify_token(credentials.credentials)
+    except InvalidToken as e:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    # Confronto sui byte: compare_digest su str non ASCII solleva TypeError
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(
+        token.encode("utf-8", "surrogateescape"), ADMIN_TOKEN.encode("utf-8", "surrogateescape")
+    )
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dipendenza FastAPI per gli endpoint /admin."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Not Found")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid admin token")
+
+
+def _checkpw(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+class PasswordVerifier:
+    def __init__(self, workers: int = BCRYPT_WORKERS, max_pending: int = BCRYPT_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"verified": 0, "failed": 0, "rejected": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+    def start(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: i processi figli non ereditano i thread (flusher, worker) del server.
+                # I processi vengono avviati subito, così il primo login non ne paga l'avvio.
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                for _ in range(self.workers):
+                    self._pool.submit(int)
+
+    def stop(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise HTTPException(
+                    status.HTTP_503_SERVICE_UNAVAILABLE, "Too many concurrent logins, retry shortly",
+                    headers={"Retry-After": str(BCRYPT_RETRY_AFTER)}
+                )
+            self._pending += 1
+        self.start()
+        started = time.perf_counter()
+        try:
+            ok = await asyncio.get_running_loop().run_in_executor(self._pool, _checkpw, plain_password, hashed_password)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._pending -= 1
+                self._stats["total_seconds"] += elapsed
+                self._stats["max_seconds"] = max(self._stats["max_seconds"], elapsed)
+        with self._lock:
+            self._stats["verified" if ok else "failed"] += 1
+        return ok
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = self._stats["verified"] + self._stats["failed"]
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                **self._stats,
+                "avg_seconds": self._stats["total_seconds"] / done if done else None,
+            }
+
+
+password_verifier = PasswordVerifier()
@@ -0,0 +1,279 @@
+"""
+Lavori in background (generazione HTML, estrazione dei tag) con arresto ordinato.
+
+Sostituisce il ThreadPoolExecutor globale di main.py. Ogni lavoro ha un tipo
+registrato e argomenti serializzabili in JSON, così può essere salvato e ripreso.
+I worker sono thread daemon: ThreadPoolExecutor attende i propri thread all'uscita
+dell'interprete, quindi un lavoro lento terrebbe vivo il processo oltre la scadenza.
+
+Allo spegnimento (lifespan) `drain`:
+1. smette di accettare lavori: quelli inviati da qui in poi vanno direttamente nel
+   checkpoint (dopo la fine dello svuotamento, in un checkpoint proprio);
+2. attende fino a BACKGROUND_DRAIN_TIMEOUT secondi che quelli in coda e in corso
+   terminino;
+3. scaduto il tempo, annulla quelli ancora in coda e scrive nel checkpoint sia
+   questi sia quelli ancora in esecuzione, con un riepilogo nel log.
+
+I thread in esecuzione non possono essere interrotti: continuano finché il processo
+resta vivo e vengono terminati con lui. Se finiscono prima, il controllo `done` del
+tipo evita di ripeterli alla ripresa; per questo un lavoro deve rendere visibile il
+proprio risultato in un passo solo (commit, os.replace), altrimenti un lavoro
+terminato a metà risulterebbe già fatto.
+
+Al riavvio `resume` rimette in coda i lavori dei checkpoint in BACKGROUND_CHECKPOINT_DIR.
+Ogni processo scrive un proprio file e lo rinomina prima di leggerlo, quindi più
+worker possono condividere la cartella.
+"""
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from tracing import SpanContext, current_context, span
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "4"))
+BACKGROUND_DRAIN_TIMEOUT = float(os.getenv("BACKGROUND_DRAIN_TIMEOUT", "25"))
+BACKGROUND_CHECKPOINT_DIR = os.getenv("BACKGROUND_CHECKPOINT_DIR", "pending_jobs")
+
+
+@dataclass
+class JobType:
+    run: Callable[..., object]
+    # Vero se il risultato del lavoro esiste già (per non ripeterlo alla ripresa)
+    done: Optional[Callable[..., bool]] = None
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    kwargs: dict
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    future: Optional[Future] = None
+    # Span della richiesta che ha creato il lavoro: lo span del lavoro ne diventa figlio
+    trace_parent: Optional[SpanContext] = None
+
+    def to_checkpoint(self, state: str) -> dict:
+        return {"kind": self.kind, "kwargs": self.kwargs, "state": state, "submitted_at": self.submitted_at}
+
+
+class DaemonThreadPool:
+    """
+    Il sottoinsieme di ThreadPoolExecutor usato qui (submit, shutdown), con thread
+    daemon: all'uscita l'interprete non li attende.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str):
+        self._queue = queue.SimpleQueue()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{thread_name_prefix}_{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        future = Future()
+        self._queue.put((future, fn, args))
+        return future
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue  # annullato mentre era in coda
+            try:
+                result = fn(*args)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    def shutdown(self, cancel_futures: bool = True):
+        """Non attende i lavori in corso: i thread escono appena li terminano."""
+        if cancel_futures:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+        for _ in self._threads:
+            self._queue.put(None)
+
+
+class BackgroundJobs:
+    def __init__(self, workers: int = BACKGROUND_WORKERS, checkpoint_dir: str = BACKGROUND_CHECKPOINT_DIR,
+                 thread_name_prefix: str = "background"):
+        self.workers = workers
+        self.checkpoint_dir = checkpoint_dir
+        self.thread_name_prefix = thread_name_prefix
+        self._types: Dict[str, JobType] = {}
+        self._jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._accepting = True
+        self._deferred: List[Job] = []  # inviati durante lo svuotamento
+        self._drained = False  # svuotamento concluso, checkpoint già scritto
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "resumed": 0}
+        self.last_drain: Optional[dict] = None
+
+    def register(self, kind: str, run: Callable[..., object], done: Optional[Callable[..., bool]] = None):
+        self._types[kind] = JobType(run, done)
+
+    def _ensure_executor(self) -> DaemonThreadPool:
+        if self._executor is None:
+            self._executor = DaemonThreadPool(self.workers, self.thread_name_prefix)
+        return self._executor
+
+    def submit(self, kind: str, **kwargs) -> Optional[Future]:
+        """Mette in coda un lavoro; durante lo svuotamento finisce nel checkpoint e restituisce None."""
+        job_type = self._types[kind]
+        with self._lock:
+            job = Job(next(self._ids), kind, kwargs, trace_parent=current_context())
+            if self._accepting:
+                self._jobs[job.id] = job
+                self._stats["submitted"] += 1
+                job.future = self._ensure_executor().submit(self._run, job, job_type)
+                return job.future
+            if not self._drained:
+                # Svuotamento in corso: finisce nel checkpoint scritto da drain
+                logger.warning(f"Lavoro {kind} ricevuto durante lo spegnimento: salvato per la ripresa")
+                self._deferred.append(job)
+                return None
+        # Svuotamento già concluso: checkpoint dedicato
+        checkpoint = self._write_checkpoint([job.to_checkpoint("deferred")])
+        with self._lock:
+            if self.last_drain is not None:
+                self.last_drain["abandoned"].append({"kind": kind, "state": "deferred", "checkpoint": checkpoint})
+        logger.warning(f"Lavoro {kind} ricevuto dopo lo spegnimento: salvato in {checkpoint}")
+        return None
+
+    def _run(self, job: Job, job_type: JobType):
+        job.started_at = time.time()
+        try:
+            with span(f"job {job.kind}", parent=job.trace_parent, **{
+                "job.id": job.id, "job.queue_seconds": round(job.started_at - job.submitted_at, 3)
+            }):
+                result = job_type.run(**job.kwargs)
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            logger.exception(f"Lavoro {job.kind} #{job.id} fallito")
+            return None
+        finally:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+        with self._lock:
+            self._stats["completed"] += 1
+        return result
+
+    def drain(self, timeout: float = BACKGROUND_DRAIN_TIMEOUT) -> dict:
+        """Smette di accettare lavori, attende quelli pendenti fino a `timeout` e salva i restanti."""
+        started = time.monotonic()
+        with self._lock:
+            self._accepting = False
+            pending = list(self._jobs.values())
+        if pending:
+            logger.info(f"Spegnimento: attendo {len(pending)} lavori in background (massimo {timeout}s)")
+        wait([job.future for job in pending], timeout=timeout)
+
+        abandoned = []
+        with self._lock:
+            for job in list(self._jobs.values()):
+                # cancel() riesce solo per i lavori non ancora avviati
+                state = "queued" if job.future.cancel() else "running"
+                if state == "queued":
+                    self._jobs.pop(job.id, None)
+                abandoned.append(job.to_checkpoint(state))
+            abandoned.extend(job.to_checkpoint("deferred") for job in self._deferred)
+            self._deferred.clear()
+            self._drained = True
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+        checkpoint = self._write_checkpoint(abandoned) if abandoned else None
+        self.last_drain = {
+            "seconds": round(time.monotonic() - started, 3),
+            "finished": len(pending) - sum(1 for job in abandoned if job["state"] != "deferred"),
+            "abandoned": [{"kind": job["kind"], "state": job["state"]} for job in abandoned],
+            "checkpoint": checkpoint,
+        }
+        if abandoned:
+            summary = ", ".join(f"{job['kind']} ({job['state']})" for job in abandoned)
+            logger.warning(f"Spegnimento: {len(abandoned)} lavori non completati, salvati in {checkpoint}: {summary}")
+        return self.last_drain
+
+    def _write_checkpoint(self, jobs: List[dict]) -> str:
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = os.path.join(self.checkpoint_dir, f"{os.getpid()}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.json")
+        with open(f"{path}.part", "w", encoding="utf-8") as f:
+            json.dump(jobs, f)
+        os.replace(f"{path}.part", path)
+        return path
+
+    def resume(self) -> int:
+        """Rimette in coda i lavori dei checkpoint lasciati dagli spegnimenti precedenti."""
+        with self._lock:
+            self._accepting = True
+            self._drained = False
+        if not os.path.isdir(self.checkpoint_dir):
+            return 0
+        resumed = 0
+        for name in sorted(os.listdir(self.checkpoint_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.checkpoint_dir, name)
+            claimed = f"{path}.{os.getpid()}.claimed"
+            try:
+                os.replace(path, claimed)  # un solo worker ottiene il file
+            except FileNotFoundError:
+                continue
+            with open(claimed, encoding="utf-8") as f:
+                jobs = json.load(f)
+            for job in jobs:
+                job_type = self._types.get(job["kind"])
+                if job_type is None:
+                    logger.error(f"Checkpoint {name}: tipo di lavoro sconosciuto {job['kind']}")
+                    continue
+                if job_type.done is not None and job_type.done(**job["kwargs"]):
+                    continue
+                self.submit(job["kind"], **job["kwargs"])
+                resumed += 1
+            os.remove(claimed)
+        if resumed:
+            with self._lock:
+                self._stats["resumed"] += resumed
+            logger.info(f"Ripresi {resumed} lavori in background da {self.checkpoint_dir}")
+        return resumed
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+            return {
+                "workers": self.workers,
+                "accepting": self._accepting,
+                "running": sum(1 for job in jobs if job.started_at is not None),
+                "queued": sum(1 for job in jobs if job.started_at is None),
+                **self._stats,
+                "last_drain": self.last_drain,
+            }
+
+
+background_jobs = BackgroundJobs(thread_name_prefix="html_processor")
@@ -0,0 +1,128 @@
+"""
+Benchmark dei profili di engine: throughput di scrittura e lettura concorrenti.
+
+Uso (dalla cartella backend):
+    python -m benchmarks.db_engine_profiles
+    python -m benchmarks.db_engine_profiles --server-url postgresql://user:pw@host/db
+
+Ogni writer apre una sessione per articolo e fa commit, come fanno gli endpoint
+e i job dell'executor; i reader interrogano articoli per id in parallelo.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from db.database import Base, create_db_engine
+from db.model import Article
+
+
+def _new_article() -> Article:
+    return Article(
+        id=str(uuid.uuid4()),
+        title="Benchmark",
+        excerpt="Benchmark excerpt",
+        content="Lorem ipsum " * 200,
+        authorId=None,
+        status="published",
+        publishDate=date.today(),
+        readTime=3,
+        likes=0,
+        views=0,
+        isLiked=False,
+        thumbnail="",
+        filename=f"{uuid.uuid4()}.html",
+        tags="",
+    )
+
+
+def run_profile(name: str, url: str, tuned: bool, writers: int, readers: int, ops: int) -> dict:
+    engine = create_db_engine(url, tuned=tuned)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    # Qualche riga iniziale per i reader
+    with Session() as db:
+        seeded = [_new_article() for _ in range(200)]
+        db.add_all(seeded)
+        db.commit()
+        ids = [a.id for a in seeded]
+
+    stats = {"writes": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def writer():
+        for _ in range(ops):
+            try:
+                with Session() as db:
+                    db.add(_new_article())
+                    db.commit()
+                with lock:
+                    stats["writes"] += 1
+            except OperationalError:
+                with lock:
+                    stats["errors"] += 1
+
+    def reader():
+        for _ in range(ops):
+            try:
+                with Session() as db:
+                    db.query(Article).filter(Article.id == random.choice(ids)).first()
+                with lock:
+                    stats["reads"] += 1
+            except OperationalError:
+                with lock:
+                    stats["errors"] += 1
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+
+    return {
+        "profile": name,
+        "writes/s": stats["writes"] / elapsed,
+        "reads/s": stats["reads"] / elapsed,
+        "errors": stats["errors"],
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200, help="operazioni per thread")
+    parser.add_argument("--server-url", default=None, help="URL di un DB server da confrontare (tabelle ricreate!)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profiles = [
+            ("sqlite-default", f"sqlite:///{os.path.join(tmp, 'default.db')}", False),
+            ("sqlite-wal", f"sqlite:///{os.path.join(tmp, 'wal.db')}", True),
+        ]
+        if args.server_url:
+            profiles.append(("server-default", args.server_url, False))
+            profiles.append(("server-pooled", args.server_url, True))
+
+        print(f"{'profile':<16}{'writes/s':>12}{'reads/s':>12}{'errors':>9}{'elapsed_s':>11}")
+        for name, url, tuned in profiles:
+            r = run_profile(name, url, tuned, args.writers, args.readers, args.ops)
+            print(f"{r['profile']:<16}{r['writes/s']:>12.1f}{r['reads/s']:>12.1f}{r['errors']:>9}{r['elapsed_s']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
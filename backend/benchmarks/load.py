@@ -0,0 +1,372 @@
+"""
+Generatore di carico con un mix di traffico realistico, per la pianificazione della
+capacità.
+
+Gli arrivi sono a ciclo aperto (processo di Poisson al tasso corrente): le nuove
+richieste partono anche se il server rallenta, come con utenti veri, quindi le code
+e i rifiuti diventano visibili invece di essere nascosti dal client. Ogni arrivo
+sceglie uno scenario secondo il mix:
+
+    feed      GET /articles/?limit=20, a volte seguito dalla pagina successiva
+    article   GET /articles/{id}
+    enhanced  GET /enhanced-articles/{id}/user/{user_id}          (chiama Gemini)
+    save      POST /save_article/ con un'immagine PNG              (chiama Gemini)
+    login     POST /api/login
+    tts       POST /text2speech/                                   (chiama ElevenLabs)
+
+Gli scenari marcati chiamano provider esterni a pagamento: per misurare solo il
+backend si possono escludere dal mix (es. --mix feed=80,article=15,login=5).
+
+Popolazione: --seed-users/--seed-articles creano utenti `loadtest-<n>@load.ai`
+(con configurazione e password --password) e articoli pubblicati direttamente nel
+database indicato da DATABASE_URL, come db/seed.py; sono idempotenti. Senza seed
+vengono usati gli utenti loadtest e gli articoli già presenti.
+
+Uso (dalla cartella backend, con il server avviato):
+    python -m benchmarks.load --seed-users 200 --seed-articles 1000 --rate 20 --duration 60
+    python -m benchmarks.load --ramp 0:5,60:50,120:50 --login-burst 30 --burst-every 20
+    python -m benchmarks.load --mix feed=70,article=20,login=10 --json report.json
+
+Il report riporta per route richieste, errori (5xx ed eccezioni), richieste
+rifiutate dal server (429/503), altri 4xx e percentili di latenza, più
+l'andamento per intervallo (tasso offerto, throughput, p95) per individuare il
+punto in cui la latenza inizia a salire.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+DEFAULT_MIX = "feed=60,article=20,enhanced=8,save=2,login=5,tts=5"
+SHED_STATUSES = {429, 503}
+
+
+@dataclass
+class Fixtures:
+    users: List[Tuple[str, str]]  # (id, email)
+    article_ids: List[str]
+    password: str
+
+
+@dataclass
+class RampProfile:
+    points: List[Tuple[float, float]]  # (secondi, richieste al secondo)
+
+    @classmethod
+    def parse(cls, spec: str) -> "RampProfile":
+        points = sorted((float(t), float(r)) for t, r in (item.split(":") for item in spec.split(",")))
+        return cls(points)
+
+    @property
+    def duration(self) -> float:
+        return self.points[-1][0]
+
+    def rate_at(self, t: float) -> float:
+        """Interpolazione lineare tra i punti del profilo."""
+        if t <= self.points[0][0]:
+            return self.points[0][1]
+        for (t0, r0), (t1, r1) in zip(self.points, self.points[1:]):
+            if t <= t1:
+                return r0 + (r1 - r0) * (t - t0) / (t1 - t0) if t1 > t0 else r1
+        return self.points[-1][1]
+
+
+@dataclass
+class Recorder:
+    interval: float
+    samples: List[Tuple[float, str, float, Optional[int], Optional[str]]] = field(default_factory=list)
+    offered: Counter = field(default_factory=Counter)  # arrivi per intervallo
+    dropped: int = 0  # arrivi scartati dal client per troppe richieste in corso
+
+    def arrival(self, t: float):
+        self.offered[int(t // self.interval)] += 1
+
+    def record(self, t: float, route: str, latency: float, status: Optional[int], error: Optional[str] = None):
+        self.samples.append((t, route, latency, status, error))
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))]
+
+
+def seed_fixtures(n_users: int, n_articles: int, password: str) -> Fixtures:
+    """Utenti e articoli di prova scritti direttamente nel database (DATABASE_URL)."""
+    from db.database import SessionLocal
+    from db.model import Article, Configuration, User
+
+    rng = random.Random(7)
+    hashed = User()
+    hashed.set_password(password)  # un solo hash bcrypt, stesso costo di quelli reali
+    with SessionLocal() as db:
+        existing = {email for (email,) in db.query(User.email).filter(User.email.like("loadtest-%"))}
+        for i in range(n_users):
+            email = f"loadtest-{i}@load.ai"
+            if email in existing:
+                continue
+            db.add(User(id=f"loadtest-u{i}", name=f"Lettore {i}", email=email, password=hashed.password,
+                        joinDate=date(2025, 1, 1) + timedelta(days=i % 365)))
+            db.add(Configuration(user_id=f"loadtest-u{i}", tone_preference=rng.choice(["formale", "informale"]),
+                                 age_preference=rng.randint(12, 70), interests="tecnologia,viaggi"))
+        db.flush()
+        existing_articles = {id_ for (id_,) in db.query(Article.id).filter(Article.id.like("loadtest-a%"))}
+        for i in range(n_articles):
+            if f"loadtest-a{i}" in existing_articles:
+                continue
+            db.add(Article(id=f"loadtest-a{i}", title=f"Articolo di prova {i}", excerpt="Estratto " * 10,
+                           content="Contenuto dell'articolo di prova. " * 80, authorId=f"loadtest-u{i % max(n_users, 1)}",
+                           status="published", publishDate=date(2025, 1, 1) + timedelta(days=i % 365), readTime=4,
+                           likes=0, views=0, isLiked=False, thumbnail="", filename=f"loadtest-a{i}.html",
+                           tags="tecnologia,viaggi"))
+        db.commit()
+    return load_fixtures(password)
+
+
+def load_fixtures(password: str) -> Fixtures:
+    from db.database import SessionLocal
+    from db.model import Article, User
+
+    with SessionLocal() as db:
+        users = db.query(User.id, User.email).filter(User.email.like("loadtest-%")).all()
+        article_ids = [id_ for (id_,) in db.query(Article.id).filter(Article.status == "published").limit(5000)]
+    return Fixtures([tuple(user) for user in users], article_ids, password)
+
+
+def png_bytes(rng: random.Random, size: int = 256) -> bytes:
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (size, size), rng.randbytes(size * size * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+# Scenari: ognuno esegue una o più richieste e registra ciascuna con il template della route
+async def scenario_feed(client, fixtures, rng, timed):
+    response = await timed("GET /articles/", client.get("/articles/", params={"status": "published", "limit": 20}))
+    cursor = response.headers.get("x-next-cursor") if response is not None else None
+    if cursor and rng.random() < 0.3:
+        await timed("GET /articles/ (page 2)", client.get("/articles/", params={"status": "published", "limit": 20, "cursor": cursor}))
+
+
+async def scenario_article(client, fixtures, rng, timed):
+    await timed("GET /articles/{id}", client.get(f"/articles/{rng.choice(fixtures.article_ids)}"))
+
+
+async def scenario_enhanced(client, fixtures, rng, timed):
+    user_id, _ = rng.choice(fixtures.users)
+    await timed("GET /enhanced-articles/{id}/user/{user_id}",
+                client.get(f"/enhanced-articles/{rng.choice(fixtures.article_ids)}/user/{user_id}"))
+
+
+async def scenario_save(client, fixtures, rng, timed):
+    user_id, _ = rng.choice(fixtures.users)
+    data = {"title": f"Bozza {rng.randint(0, 10**6)}", "content": "Testo della bozza. " * 60, "status": "draft",
+            "user_id": user_id}
+    files = [("images", ("cover.png", png_bytes(rng), "image/png"))]
+    await timed("POST /save_article/", client.post("/save_article/", data=data, files=files))
+
+
+async def scenario_login(client, fixtures, rng, timed):
+    _, email = rng.choice(fixtures.users)
+    await timed("POST /api/login", client.post("/api/login", json={"email": email, "password": fixtures.password}))
+
+
+async def scenario_tts(client, fixtures, rng, timed):
+    user_id, _ = rng.choice(fixtures.users)
+    body = {
+        "user": {"user_id": user_id, "name": "Lettore", "age": 30, "preferred_voice_gender": "female",
+                 "preferred_voice_style": "narration", "interests": ["viaggi"]},
+        "content": {"title": "Articolo", "original_text": "Una breve frase da leggere ad alta voce."},
+    }
+    await timed("POST /text2speech/", client.post("/text2speech/", json=body))
+
+
+SCENARIOS = {
+    "feed": scenario_feed,
+    "article": scenario_article,
+    "enhanced": scenario_enhanced,
+    "save": scenario_save,
+    "login": scenario_login,
+    "tts": scenario_tts,
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in spec.split(","))}
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Scenari sconosciuti nel mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+async def run_load(args, fixtures: Fixtures, profile: RampProfile) -> Recorder:
+    recorder = Recorder(args.interval)
+    rng = random.Random(args.random_seed)
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    in_flight = set()
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        async def timed(route: str, request) -> Optional[httpx.Response]:
+            t0 = loop.time()
+            try:
+                response = await request
+            except httpx.HTTPError as exc:
+                recorder.record(t0 - started, route, loop.time() - t0, None, type(exc).__name__)
+                return None
+            recorder.record(t0 - started, route, loop.time() - t0, response.status_code)
+            return response
+
+        def launch(name: str):
+            if len(in_flight) >= args.max_in_flight:
+                recorder.dropped += 1
+                return
+            recorder.arrival(loop.time() - started)
+            task = asyncio.create_task(SCENARIOS[name](client, fixtures, random.Random(rng.random()), timed))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        async def login_bursts():
+            while True:
+                await asyncio.sleep(args.burst_every)
+                for _ in range(args.login_burst):
+                    launch("login")
+
+        bursts = asyncio.create_task(login_bursts()) if args.login_burst else None
+        while (elapsed := loop.time() - started) < profile.duration:
+            rate = profile.rate_at(elapsed)
+            if rate <= 0:
+                await asyncio.sleep(0.1)
+                continue
+            await asyncio.sleep(rng.expovariate(rate))
+            launch(rng.choices(names, weights)[0])
+        if bursts is not None:
+            bursts.cancel()
+        if in_flight:
+            await asyncio.wait(in_flight, timeout=args.timeout)
+    return recorder
+
+
+def summarize(recorder: Recorder, duration: float) -> dict:
+    by_route: Dict[str, list] = defaultdict(list)
+    for sample in recorder.samples:
+        by_route[sample[1]].append(sample)
+
+    def stats(samples) -> dict:
+        latencies = sorted(s[2] * 1000 for s in samples)
+        statuses = Counter(s[3] for s in samples)
+        errors = sum(1 for s in samples if s[3] is None or s[3] >= 500 and s[3] not in SHED_STATUSES)
+        shed = sum(statuses[code] for code in SHED_STATUSES)
+        client_errors = sum(n for code, n in statuses.items() if code is not None and 400 <= code < 500
+                            and code not in SHED_STATUSES)
+        return {
+            "requests": len(samples),
+            "rps": len(samples) / duration if duration else None,
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "shed_rate": shed / len(samples) if samples else 0.0,
+            "client_errors": client_errors,
+            "p50_ms": percentile(latencies, 50),
+            "p90_ms": percentile(latencies, 90),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": latencies[-1] if latencies else None,
+            "statuses": {str(code): n for code, n in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        }
+
+    intervals = []
+    by_interval: Dict[int, list] = defaultdict(list)
+    for sample in recorder.samples:
+        by_interval[int(sample[0] // recorder.interval)].append(sample)
+    for index in sorted(set(by_interval) | set(recorder.offered)):
+        samples = by_interval[index]
+        interval_stats = stats(samples)
+        intervals.append({
+            "start_s": index * recorder.interval,
+            "offered_rps": recorder.offered[index] / recorder.interval,
+            "rps": len(samples) / recorder.interval,
+            "p95_ms": percentile(sorted(s[2] * 1000 for s in samples), 95),
+            "error_rate": interval_stats["error_rate"],
+            "shed_rate": interval_stats["shed_rate"],
+        })
+
+    return {
+        "duration_s": duration,
+        "dropped_by_client": recorder.dropped,
+        "total": stats(recorder.samples),
+        "routes": {route: stats(samples) for route, samples in sorted(by_route.items())},
+        "intervals": intervals,
+    }
+
+
+def _ms(value: Optional[float]) -> str:
+    return f"{value:8.1f}" if value is not None else f"{'-':>8}"
+
+
+def print_report(report: dict):
+    header = f"{'route':<44} {'req':>6} {'rps':>7} {'err%':>6} {'shed%':>6} {'4xx':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["routes"].items()) + [("TOTALE", report["total"])]
+    for route, s in rows:
+        print(f"{route:<44} {s['requests']:>6} {s['rps']:>7.1f} {s['error_rate'] * 100:>6.1f} {s['shed_rate'] * 100:>6.1f} "
+              f"{s['client_errors']:>5} {_ms(s['p50_ms'])} {_ms(s['p90_ms'])} {_ms(s['p99_ms'])} {_ms(s['max_ms'])}")
+    print(f"\nArrivi scartati dal client (oltre --max-in-flight): {report['dropped_by_client']}")
+    print(f"\n{'da (s)':>7} {'offerto':>8} {'rps':>7} {'p95 ms':>8} {'err%':>6} {'shed%':>6}")
+    for i in report["intervals"]:
+        print(f"{i['start_s']:>7.0f} {i['offered_rps']:>8.1f} {i['rps']:>7.1f} {_ms(i['p95_ms'])} "
+              f"{i['error_rate'] * 100:>6.1f} {i['shed_rate'] * 100:>6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rate", type=float, default=10, help="richieste al secondo (senza --ramp)")
+    parser.add_argument("--duration", type=float, default=60, help="secondi (senza --ramp)")
+    parser.add_argument("--ramp", help="profilo 'secondi:rps,...' interpolato linearmente, es. 0:5,60:50,120:50")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"pesi degli scenari (default {DEFAULT_MIX})")
+    parser.add_argument("--login-burst", type=int, default=0, help="login simultanei per ogni raffica")
+    parser.add_argument("--burst-every", type=float, default=30, help="secondi tra le raffiche di login")
+    parser.add_argument("--seed-users", type=int, default=0)
+    parser.add_argument("--seed-articles", type=int, default=0)
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--max-in-flight", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--interval", type=float, default=10, help="ampiezza degli intervalli del report, in secondi")
+    parser.add_argument("--random-seed", type=int, default=None)
+    parser.add_argument("--json", help="salva il report completo in questo file")
+    args = parser.parse_args()
+
+    profile = RampProfile.parse(args.ramp) if args.ramp else RampProfile([(0, args.rate), (args.duration, args.rate)])
+    if args.seed_users or args.seed_articles:
+        fixtures = seed_fixtures(args.seed_users, args.seed_articles, args.password)
+    else:
+        fixtures = load_fixtures(args.password)
+    if not fixtures.users or not fixtures.article_ids:
+        raise SystemExit("Nessun utente loadtest o articolo nel database: usare --seed-users/--seed-articles")
+    print(f"{len(fixtures.users)} utenti, {len(fixtures.article_ids)} articoli, {profile.duration:.0f}s di carico "
+          f"su {args.base_url}\n")
+
+    started = time.perf_counter()
+    recorder = asyncio.run(run_load(args, fixtures, profile))
+    report = summarize(recorder, time.perf_counter() - started)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
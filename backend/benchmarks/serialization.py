@@ -0,0 +1,120 @@
+"""
+Micro-benchmark della serializzazione delle liste: percorso predefinito di FastAPI
+(validazione del response_model, conversione a dict, json.dumps) contro lo stesso
+percorso con orjson e contro il TypeAdapter precompilato di serialization.py.
+
+Uso (dalla cartella backend):
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --rows 100 1000 --repeat 50
+
+Le righe sono oggetti ORM caricati da un database SQLite temporaneo con gli stessi
+eager load degli endpoint, quindi si misura solo la serializzazione.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy.orm import joinedload, selectinload, sessionmaker
+
+from db.database import Base, create_db_engine
+from db.model import Achievement, Article, Leaderboard, User, UserAchievement
+from db.schemas import ArticleOut, LeaderboardOut, UserOut
+from serialization import dump_list
+
+
+def seed(Session, n_rows: int):
+    start = date(2024, 1, 1)
+    with Session() as db:
+        achievements = [Achievement(id=f"a{i}", name=f"Achievement {i}", description="Descrizione", icon="*",
+                                    xpReward=50) for i in range(3)]
+        users = []
+        for i in range(n_rows):
+            user = User(id=f"u{i}", name=f"User {i}", email=f"user{i}@bench.ai", password="$2b$12$" + "x" * 53,
+                        level=3, xp=200, xpToNext=800, totalXp=2200, joinDate=start + timedelta(days=i % 365))
+            user.achievements = [UserAchievement(achievement=a, unlockedAt=start) for a in achievements[: i % 4]]
+            users.append(user)
+        articles = [
+            Article(id=str(uuid.uuid4()), title=f"Articolo {i}", excerpt="Estratto " * 10, content="Contenuto " * 300,
+                    author=users[i % len(users)], status="published", publishDate=start + timedelta(days=i % 365),
+                    readTime=3, likes=i, views=i * 10, isLiked=False, thumbnail="", filename=f"{i}.html",
+                    tags="tecnologia,scienza")
+            for i in range(n_rows)
+        ]
+        entries = [Leaderboard(name=u.name, level=u.level, totalXp=u.totalXp, articlesRead=5, streak=2, userId=u.id,
+                               rank=i + 1) for i, u in enumerate(users)]
+        db.add_all(achievements + users + articles + entries)
+        db.commit()
+
+
+def load_rows(Session, n_rows: int) -> dict:
+    user_achievements = selectinload(User.achievements).selectinload(UserAchievement.achievement)
+    db = Session()
+    return {
+        "articles": (ArticleOut, db.query(Article).options(
+            joinedload(Article.author).selectinload(User.achievements).selectinload(UserAchievement.achievement)
+        ).limit(n_rows).all()),
+        "users": (UserOut, db.query(User).options(user_achievements).limit(n_rows).all()),
+        "leaderboard": (LeaderboardOut, db.query(Leaderboard).limit(n_rows).all()),
+    }
+
+
+def fastapi_default(response_class):
+    def serialize(schema, rows) -> bytes:
+        field = create_model_field(name="Response", type_=List[schema], mode="serialization")
+        content = asyncio.run(serialize_response(field=field, response_content=rows))
+        return response_class(content).body
+    return serialize
+
+
+def type_adapter(schema, rows) -> bytes:
+    return dump_list(schema, rows)
+
+
+PATHS = {
+    "fastapi + json": fastapi_default(JSONResponse),
+    "fastapi + orjson": fastapi_default(ORJSONResponse),
+    "TypeAdapter": type_adapter,
+}
+
+
+def timeit(fn, schema, rows, repeat: int) -> float:
+    fn(schema, rows)  # riscaldamento (compilazione degli schemi)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(schema, rows)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    engine = create_db_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'serialization.db')}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    seed(Session, max(args.rows))
+
+    print(f"{'endpoint':<12} {'righe':>6} " + " ".join(f"{name:>18}" for name in PATHS) + f" {'speedup':>8}")
+    for n_rows in args.rows:
+        for endpoint, (schema, rows) in load_rows(Session, n_rows).items():
+            timings = {name: timeit(fn, schema, rows, args.repeat) for name, fn in PATHS.items()}
+            speedup = timings["fastapi + json"] / timings["TypeAdapter"]
+            print(f"{endpoint:<12} {n_rows:>6} " + " ".join(f"{ms:>15.2f} ms" for ms in timings.values())
+                  + f" {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Test di durata: carico costante per molti minuti, fallisce se la memoria del worker
+continua a crescere.
+
+Usa lo stesso generatore di benchmarks/load.py (per default solo scenari che non
+chiamano provider esterni) e intanto legge GET /memory/stats ogni --sample-every
+secondi (endpoint admin: serve ADMIN_TOKEN o --admin-token). Scartato il
+riscaldamento (--warmup), calcola per ogni processo la pendenza ai minimi quadrati
+di RSS e blocchi allocati: se supera le soglie il test termina con codice 1.
+
+Con --tracemalloc il tracciamento parte all'inizio del riscaldamento, così la sua
+contabilità si stabilizza prima della finestra valutata; uno snapshot a fine
+riscaldamento fa da base e alla fine vengono mostrate le righe la cui memoria è
+cresciuta di più.
+Meglio avviare il server con un solo worker: con più worker ogni lettura arriva a
+un processo diverso e i campioni sono separati per pid.
+
+Uso (dalla cartella backend, con il server avviato):
+    ADMIN_TOKEN=... python -m benchmarks.soak --duration 1800 --warmup 300 --rate 20
+    ADMIN_TOKEN=... python -m benchmarks.soak --duration 600 --tracemalloc --max-rss-growth-mb-per-hour 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.load import RampProfile, load_fixtures, print_report, run_load, seed_fixtures, summarize
+from memory import linear_slope
+
+DEFAULT_SOAK_MIX = "feed=70,article=20,login=10"
+
+
+async def admin_request(client: httpx.AsyncClient, method: str, path: str, token: str, **kwargs):
+    response = await client.request(method, path, headers={"X-Admin-Token": token}, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+
+async def poll_memory(client: httpx.AsyncClient, token: str, every: float, samples: list):
+    while True:
+        try:
+            samples.append((await admin_request(client, "GET", "/memory/stats", token))["current"])
+        except httpx.HTTPError as exc:
+            print(f"Lettura di /memory/stats fallita: {exc}", file=sys.stderr)
+        await asyncio.sleep(every)
+
+
+async def soak(args, fixtures) -> tuple:
+    samples = []
+    profile = RampProfile([(0, args.rate), (args.duration, args.rate)])
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        if args.tracemalloc:
+            # Avvia il tracciamento prima del carico: il suo costo cresce durante il riscaldamento, non dopo
+            await admin_request(client, "POST", "/admin/memory/snapshots", args.admin_token)
+        poller = asyncio.create_task(poll_memory(client, args.admin_token, args.sample_every, samples))
+        load = asyncio.create_task(run_load(args, fixtures, profile))
+        diff = None
+        if args.tracemalloc:
+            await asyncio.sleep(args.warmup)
+            snapshot = await admin_request(client, "POST", "/admin/memory/snapshots", args.admin_token)
+            print(f"Snapshot tracemalloc {snapshot['id']} a fine riscaldamento")
+        recorder = await load
+        poller.cancel()
+        samples.append((await admin_request(client, "GET", "/memory/stats", args.admin_token))["current"])
+        if args.tracemalloc:
+            diff = await admin_request(client, "GET", "/admin/memory/diff", args.admin_token,
+                                       params={"base": snapshot["id"], "top": args.top})
+            await admin_request(client, "DELETE", "/admin/memory/snapshots", args.admin_token)
+    return recorder, samples, diff
+
+
+def evaluate(samples: list, warmup_until: float, args) -> bool:
+    by_pid = defaultdict(list)
+    for sample in samples:
+        if sample["time"] >= warmup_until:
+            by_pid[sample["pid"]].append(sample)
+    ok = True
+    print(f"\n{'pid':>8} {'campioni':>8} {'RSS MB':>8} {'MB/ora':>8} {'blocchi':>9} {'blocchi/ora':>12}  esito")
+    for pid, pid_samples in sorted(by_pid.items()):
+        rss_slope = linear_slope([(s["time"], s["rss_bytes"] / 2**20) for s in pid_samples])
+        blocks_slope = linear_slope([(s["time"], s["allocated_blocks"]) for s in pid_samples])
+        rss_per_hour = rss_slope * 3600 if rss_slope is not None else None
+        blocks_per_hour = blocks_slope * 3600 if blocks_slope is not None else None
+        failed = [
+            name for name, value, limit in (
+                ("RSS", rss_per_hour, args.max_rss_growth_mb_per_hour),
+                ("blocchi", blocks_per_hour, args.max_blocks_growth_per_hour),
+            )
+            if value is not None and value > limit
+        ]
+        if len(pid_samples) < 3:
+            failed.append("campioni insufficienti")
+        ok = ok and not failed
+        last = pid_samples[-1]
+        print(f"{pid:>8} {len(pid_samples):>8} {last['rss_bytes'] / 2**20:>8.1f} "
+              f"{rss_per_hour if rss_per_hour is not None else float('nan'):>8.1f} "
+              f"{last['allocated_blocks']:>9} "
+              f"{blocks_per_hour if blocks_per_hour is not None else float('nan'):>12.0f}  "
+              f"{'crescita: ' + ', '.join(failed) if failed else 'ok'}")
+    return ok and bool(by_pid)
+
+
+def print_diff(diff: dict):
+    print(f"\nMemoria allocata dopo il riscaldamento: {diff['size_diff_bytes'] / 2**20:+.1f} MB "
+          f"({diff['count_diff']:+} blocchi) in {diff['seconds']:.0f}s")
+    for stat in diff["top"]:
+        print(f"{stat['size_diff_bytes'] / 1024:>+10.1f} KB {stat['count_diff']:>+8}  {stat['location']}  {stat.get('line', '')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=1800, help="secondi di carico")
+    parser.add_argument("--warmup", type=float, default=300, help="secondi iniziali esclusi dalla valutazione")
+    parser.add_argument("--rate", type=float, default=20, help="richieste al secondo")
+    parser.add_argument("--mix", default=DEFAULT_SOAK_MIX)
+    parser.add_argument("--sample-every", type=float, default=10)
+    parser.add_argument("--max-rss-growth-mb-per-hour", type=float, default=20)
+    parser.add_argument("--max-blocks-growth-per-hour", type=float, default=50000)
+    parser.add_argument("--seed-users", type=int, default=0)
+    parser.add_argument("--seed-articles", type=int, default=0)
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--admin-token", default=os.getenv("ADMIN_TOKEN"))
+    parser.add_argument("--tracemalloc", action="store_true", help="mostra le righe cresciute dopo il riscaldamento")
+    parser.add_argument("--top", type=int, default=15, help="righe del confronto tracemalloc")
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+    if args.warmup >= args.duration:
+        parser.error("--warmup deve essere minore di --duration")
+    if not args.admin_token:
+        parser.error("/memory/stats richiede ADMIN_TOKEN o --admin-token")
+    # Parametri di benchmarks.load non esposti qui
+    args.login_burst, args.burst_every, args.random_seed, args.interval = 0, 30, None, max(args.duration / 10, 1)
+
+    if args.seed_users or args.seed_articles:
+        fixtures = seed_fixtures(args.seed_users, args.seed_articles, args.password)
+    else:
+        fixtures = load_fixtures(args.password)
+    if not fixtures.users or not fixtures.article_ids:
+        raise SystemExit("Nessun utente loadtest o articolo nel database: usare --seed-users/--seed-articles")
+
+    started = asyncio.run(_server_time(args.base_url, args.admin_token))
+    recorder, samples, diff = asyncio.run(soak(args, fixtures))
+    print_report(summarize(recorder, args.duration))
+    ok = evaluate(samples, started + args.warmup, args)
+    if diff is not None:
+        print_diff(diff)
+    print("\nSOAK OK" if ok else "\nSOAK FALLITO: memoria in crescita oltre le soglie")
+    sys.exit(0 if ok else 1)
+
+
+async def _server_time(base_url: str, token: str) -> float:
+    """Orario del server (i campioni usano il suo orologio) all'inizio del test."""
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        return (await admin_request(client, "GET", "/memory/stats", token))["current"]["time"]
+
+
+if __name__ == "__main__":
+    main()
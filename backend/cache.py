@@ -0,0 +1,256 @@
+"""
+Cache read-through per le letture più frequenti (articoli, utenti, configurazioni,
+achievement).
+
+I valori sono le rappresentazioni JSON degli schemi di risposta (dict), salvati
+come byte: lo stesso formato va bene in memoria e in un backend condiviso tra
+worker. Gli handler di scrittura invalidano le chiavi che modificano subito dopo
+il commit; CACHE_TTL limita comunque la vita di una voce, anche nel caso in cui una
+lettura concorrente scriva in cache un valore letto prima del commit.
+
+Alcune modifiche toccano molte chiavi insieme (un achievement compare nel profilo
+di tutti gli utenti che lo hanno): per queste si usa un namespace con generazione.
+Le chiavi includono la generazione corrente e `invalidate_namespace` la incrementa,
+rendendo irraggiungibili tutte le voci precedenti senza doverle elencare.
+
+Configurazione:
+    CACHE_BACKEND=memory (default) | redis
+    CACHE_URL=redis://localhost:6379/0  (solo redis, richiede il pacchetto redis)
+    CACHE_MAX_ENTRIES=10000, CACHE_TTL=300, CACHE_ENABLED=1
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") != "0"
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+class MemoryBackend:
+    """LRU in processo con scadenza; le generazioni dei namespace non vengono mai espulse."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (scadenza, valore)
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] += 1
+            return self._counters[key]
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Backend condiviso tra worker; espulsione e memoria massima sono gestite da Redis."""
+
+    evictions = None  # visibili in INFO stats di Redis (evicted_keys)
+
+    def __init__(self, url: str = CACHE_URL, prefix: str = "fluidcontent:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + "gen:" + key)
+
+    def counter(self, key: str) -> int:
+        return int(self.client.get(self.prefix + "gen:" + key) or 0)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            if not key.startswith((self.prefix + "gen:").encode()):
+                self.client.delete(key)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class ReadThroughCache:
+    def __init__(self, backend, ttl: float = CACHE_TTL, enabled: bool = CACHE_ENABLED):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self._hits: Dict[str, int] = defaultdict(int)
+        self._misses: Dict[str, int] = defaultdict(int)
+        self._invalidations: Dict[str, int] = defaultdict(int)
+
+    def key(self, namespace: str, *parts: Any, generational: bool = False) -> str:
+        if generational:
+            try:
+                generation = self.backend.counter(namespace)
+            except Exception:
+                logger.exception("Lettura della generazione fallita")
+                generation = "unavailable"
+            parts = (generation,) + parts
+        return ":".join([namespace, *map(str, parts)])
+
+    def get(self, key: str) -> Optional[Any]:
+        namespace = key.split(":", 1)[0]
+        if not self.enabled:
+            return None
+        try:
+            raw = self.backend.get(key)
+        except Exception:
+            logger.exception("Lettura dalla cache fallita")
+            raw = None
+        if raw is None:
+            self._misses[namespace] += 1
+            return None
+        self._hits[namespace] += 1
+        return _loads(raw)
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(key, _dumps(value), self.ttl)
+        except Exception:
+            logger.exception("Scrittura nella cache fallita")
+
+    def get_or_load(self, key: str, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """Valore in cache o, se manca, quello del loader (che viene salvato se non è None)."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, *keys: str):
+        try:
+            self.backend.delete(*keys)
+        except Exception:
+            logger.exception("Invalidazione della cache fallita")
+        for key in keys:
+            self._invalidations[key.split(":", 1)[0]] += 1
+
+    def invalidate_namespace(self, namespace: str):
+        try:
+            self.backend.incr(namespace)
+        except Exception:
+            logger.exception("Invalidazione della cache fallita")
+        self._invalidations[namespace] += 1
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        namespaces = sorted(set(self._hits) | set(self._misses) | set(self._invalidations))
+        hits, misses = sum(self._hits.values()), sum(self._misses.values())
+        return {
+            "backend": type(self.backend).__name__,
+            "enabled": self.enabled,
+            "entries": self.backend.size(),
+            "evictions": self.backend.evictions,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else None,
+            "namespaces": {
+                namespace: {
+                    "hits": self._hits[namespace],
+                    "misses": self._misses[namespace],
+                    "invalidations": self._invalidations[namespace],
+                }
+                for namespace in namespaces
+            },
+        }
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    if name == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+
+entity_cache = ReadThroughCache(create_backend())
+
+
+# Chiavi delle entità, condivise da handler, flusher dei contatori e motore dei premi
+def article_key(article_id: str) -> str:
+    return entity_cache.key("article", article_id)
+
+
+def user_key(user_id: str) -> str:
+    # Generazionale: la modifica di un achievement invalida tutti i profili che lo includono
+    return entity_cache.key("user", user_id, generational=True)
+
+
+def configuration_key(user_id: str) -> str:
+    return entity_cache.key("configuration", "user", user_id)
+
+
+def achievements_page_key(*page: Any) -> str:
+    return entity_cache.key("achievements", *page, generational=True)
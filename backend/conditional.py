@@ -0,0 +1,87 @@
+"""
+GET condizionali: ETag, Last-Modified, 304 e Cache-Control per route.
+
+I validatori derivano dalle colonne updatedAt (aggiornate a ogni modifica della
+riga) e dagli id, non dal corpo della risposta: se la richiesta porta un
+If-None-Match (o If-Modified-Since) ancora valido, la risposta 304 viene
+restituita senza costruire né serializzare il corpo.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Iterable, Optional, Union
+
+from fastapi import Request
+from starlette.responses import Response
+
+# Policy per route: i dati personali restano nelle cache private del client
+CACHE_CONTROL = {
+    "article": "private, max-age=30, must-revalidate",
+    "articles_by_user": "private, max-age=30, must-revalidate",
+    "user": "private, no-cache",
+    "configuration": "private, no-cache",
+    "achievements": "public, max-age=300",
+    "tags": "public, max-age=300",
+    # Upload e derivati sono nominati con l'hash del contenuto
+    "image": "public, max-age=31536000, immutable",
+    "image_pending": "public, no-cache",
+    # Nomi legacy (non hash): il contenuto può cambiare, si rivalida con ETag
+    "image_mutable": "public, no-cache",
+}
+
+Timestamp = Union[datetime, str, None]
+
+
+def _as_datetime(value: Timestamp) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    # updatedAt è salvato in UTC senza fuso
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def make_etag(*parts) -> str:
+    """ETag forte a partire da id e versioni delle righe che compongono la risposta."""
+    digest = hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def last_modified(timestamps: Iterable[Timestamp]) -> Optional[datetime]:
+    values = [_as_datetime(value) for value in timestamps]
+    if not values or any(value is None for value in values):
+        return None  # righe senza versione: solo ETag
+    return max(values).replace(microsecond=0)
+
+
+def is_not_modified(request: Request, etag: str, modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match ha la precedenza; confronto debole come da RFC 9110
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and modified is not None:
+        try:
+            return modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def conditional_response(
+    request: Request,
+    etag: str,
+    modified: Optional[datetime],
+    cache_control: str,
+    build: Callable[[], Response],
+) -> Response:
+    """304 se il client ha già questa versione, altrimenti la risposta di `build` con i validatori."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if modified is not None:
+        headers["Last-Modified"] = format_datetime(modified, usegmt=True)
+    if is_not_modified(request, etag, modified):
+        return Response(status_code=304, headers=headers)
+    response = build()
+    response.headers.update(headers)
+    return response
@@ -0,0 +1,232 @@
+"""
+Motore di assegnazione di XP e achievement guidato dagli eventi.
+
+Gli eventi di attività (articoli letti, quiz completati, articoli pubblicati) vengono
+salvati in UserEvents con un eventId univoco: reinviare lo stesso evento non ha effetto.
+Un worker periodico li elabora a blocchi; per ogni blocco, in un'unica transazione:
+  1. prenota gli eventi non elaborati (la prima scrittura prende il lock su SQLite,
+     quindi due worker non possono elaborare lo stesso evento);
+  2. calcola con poche query aggregate i conteggi per utente e tipo di evento,
+     totali e per giorno, solo per gli utenti coinvolti;
+  3. valuta tutte le regole di Achievement in memoria e inserisce gli sblocchi nuovi;
+  4. aggiorna XP, livello e classifica degli utenti coinvolti.
+Se qualcosa fallisce la transazione viene annullata e gli eventi restano da elaborare.
+
+Elaborazione manuale (dalla cartella backend):
+    python -m db.awards
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Iterable, List
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from cache import entity_cache, user_key
+from db import leaderboard
+from db.database import SessionLocal
+from db.model import Achievement, User, UserAchievement, UserEvent
+
+logger = logging.getLogger(__name__)
+
+EVENT_XP = {
+    "article_read": 10,
+    "quiz_completed": 25,
+    "article_published": 50,
+}
+XP_PER_LEVEL = 1000  # stessa scala della web-ui: livello = totalXp // 1000 + 1
+
+AWARDS_BATCH_SIZE = int(os.getenv("AWARDS_BATCH_SIZE", "1000"))
+AWARDS_INTERVAL = float(os.getenv("AWARDS_INTERVAL", "5"))
+
+
+def default_event_id(event_type: str, user_id: str, article_id: str = None) -> str:
+    """
+    Un articolo letto/pubblicato conta una volta per utente. Senza articolo non c'è
+    niente da cui derivare un id stabile: il client deve inviare il proprio eventId,
+    altrimenti ogni reinvio verrebbe contato di nuovo.
+    """
+    if not article_id:
+        raise ValueError(f"eventId is required for {event_type} events without articleId")
+    return f"{event_type}:{user_id}:{article_id}"
+
+
+def _insert_ignore(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(UserEvent).on_conflict_do_nothing(index_elements=["eventId"])
+
+
+def record_events(db: Session, events: Iterable[dict]) -> int:
+    """
+    Salva gli eventi ignorando quelli già ricevuti (stesso eventId). Non fa commit.
+    Restituisce il numero di eventi nuovi. ValueError se un evento non ha né
+    eventId né articleId.
+    """
+    rows = []
+    for event in events:
+        rows.append({
+            "eventId": event.get("eventId") or default_event_id(event["type"], event["userId"], event.get("articleId")),
+            "userId": event["userId"],
+            "type": event["type"],
+            "articleId": event.get("articleId"),
+            "occurredAt": event.get("occurredAt") or datetime.utcnow(),
+        })
+    if not rows:
+        return 0
+    # Esecuzione Core: rowcount conta solo le righe effettivamente inserite
+    return db.connection().execute(_insert_ignore(db), rows).rowcount
+
+
+def apply_xp(user: User, gained: int):
+    user.totalXp = (user.totalXp or 0) + gained
+    user.level = user.totalXp // XP_PER_LEVEL + 1
+    user.xp = user.totalXp % XP_PER_LEVEL
+    user.xpToNext = user.level * XP_PER_LEVEL - user.totalXp
+
+
+def _streak(days: List[date]) -> int:
+    """Giorni consecutivi di lettura che terminano con il giorno più recente."""
+    streak = 0
+    expected = None
+    for day in sorted(days, reverse=True):
+        if expected is not None and day != expected:
+            break
+        streak += 1
+        expected = day - timedelta(days=1)
+    return streak
+
+
+def _as_date(value) -> date:
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def process_batch(db: Session, batch_size: int = AWARDS_BATCH_SIZE) -> dict:
+    """Elabora un blocco di eventi in un'unica transazione. Restituisce un riepilogo."""
+    batch_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+
+    pending_ids = (
+        db.query(UserEvent.id).filter(UserEvent.processedAt.is_(None)).order_by(UserEvent.id).limit(batch_size)
+    )
+    claimed = db.execute(
+        update(UserEvent)
+        .where(UserEvent.id.in_(pending_ids.scalar_subquery()), UserEvent.processedAt.is_(None))
+        .values(batchId=batch_id, processedAt=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        return {"events": 0, "users": 0, "achievements": 0}
+
+    events = db.query(UserEvent.userId, UserEvent.type, UserEvent.occurredAt).filter(UserEvent.batchId == batch_id).all()
+    user_ids = {event.userId for event in events}
+    batch_days = {event.occurredAt.date() for event in events}
+
+    gained = defaultdict(int)
+    articles_read = defaultdict(int)
+    for event in events:
+        gained[event.userId] += EVENT_XP.get(event.type, 0)
+        if event.type == "article_read":
+            articles_read[event.userId] += 1
+
+    # Conteggi aggregati per le regole: una query per i totali, una per i giorni del blocco
+    totals = {
+        (user_id, event_type): count
+        for user_id, event_type, count in db.query(UserEvent.userId, UserEvent.type, func.count())
+        .filter(UserEvent.userId.in_(user_ids))
+        .group_by(UserEvent.userId, UserEvent.type)
+    }
+    day = func.date(UserEvent.occurredAt)
+    best_day = defaultdict(int)
+    read_days = defaultdict(list)
+    for user_id, event_type, event_day, count in (
+        db.query(UserEvent.userId, UserEvent.type, day, func.count())
+        .filter(UserEvent.userId.in_(user_ids))
+        .group_by(UserEvent.userId, UserEvent.type, day)
+    ):
+        event_day = _as_date(event_day)
+        if event_day in batch_days:
+            best_day[(user_id, event_type)] = max(best_day[(user_id, event_type)], count)
+        if event_type == "article_read":
+            read_days[user_id].append(event_day)
+
+    rules = db.query(Achievement).filter(Achievement.metric.isnot(None), Achievement.threshold.isnot(None)).all()
+    unlocked = set(
+        db.query(UserAchievement.userId, UserAchievement.achievementId).filter(UserAchievement.userId.in_(user_ids))
+    )
+
+    awarded = []
+    today = now.date()
+    for user_id in user_ids:
+        for rule in rules:
+            if (user_id, rule.id) in unlocked:
+                continue
+            counts = best_day if rule.period == "day" else totals
+            if counts.get((user_id, rule.metric), 0) >= rule.threshold:
+                awarded.append(UserAchievement(userId=user_id, achievementId=rule.id, unlockedAt=today))
+                gained[user_id] += rule.xpReward
+    db.add_all(awarded)
+
+    users = db.query(User).filter(User.id.in_(user_ids)).with_for_update().all()
+    for user in users:
+        apply_xp(user, gained[user.id])
+        streak = _streak(read_days[user.id]) if user.id in read_days else None
+        leaderboard.sync_user(db, user, articles_read=articles_read[user.id], streak=streak)
+
+    db.commit()
+    entity_cache.invalidate(*(user_key(user.id) for user in users))
+    return {"events": claimed, "users": len(users), "achievements": len(awarded)}
+
+
+def process_pending(batch_size: int = AWARDS_BATCH_SIZE) -> dict:
+    """Elabora blocchi finché restano eventi in coda."""
+    total = {"events": 0, "users": 0, "achievements": 0}
+    while True:
+        with SessionLocal() as db:
+            summary = process_batch(db, batch_size)
+        for key in total:
+            total[key] += summary[key]
+        if summary["events"] < batch_size:
+            return total
+
+
+class AwardsWorker:
+    def __init__(self, interval: float = AWARDS_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                summary = process_pending()
+                if summary["events"]:
+                    logger.info(f"Eventi elaborati: {summary}")
+            except Exception:
+                logger.exception("Errore durante l'elaborazione degli eventi")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="awards_worker", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
+awards_worker = AwardsWorker()
+
+
+if __name__ == "__main__":
+    print(f"Eventi elaborati: {process_pending()}")
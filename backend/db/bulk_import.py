@@ -0,0 +1,150 @@
+"""
+Import massivo di articoli da NDJSON (un oggetto ArticleImport per riga).
+
+Il corpo della richiesta viene letto a blocchi e diviso in righe man mano, quindi
+in memoria c'è al più un batch di articoli. Ogni batch è inserito in una sola
+transazione, con un'unica query per verificare gli autori e una per i tag; se il
+commit del batch fallisce, i suoi record vengono reinseriti uno alla volta per
+isolare quelli non validi. Estrazione dei tag e generazione HTML, che chiamano
+l'LLM, non sono eseguite qui: `on_created` riceve gli articoli di ogni batch
+salvato e li affida ai worker in background.
+"""
+import json
+import os
+import uuid
+from datetime import date
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from db.awards import record_events
+from db.model import Article, User
+from db.schemas import ArticleImport
+from db.tags import sync_articles_tags
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+
+Record = Tuple[int, ArticleImport]  # (numero di riga, articolo)
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes], max_line_bytes: int = IMPORT_MAX_LINE_BYTES):
+    """
+    Restituisce (numero di riga, oggetto, errore) per ogni riga non vuota,
+    senza mai tenere in memoria più di una riga incompleta. Una riga oltre
+    `max_line_bytes` produce un errore e termina la lettura.
+    """
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield (line_number, *_parse_line(line))
+        if len(buffer) > max_line_bytes:
+            yield line_number + 1, None, f"Riga oltre il limite di {max_line_bytes} byte, import interrotto"
+            return
+    if buffer.strip():
+        yield (line_number + 1, *_parse_line(buffer))
+
+
+def _parse_line(line: bytes):
+    try:
+        return ArticleImport(**json.loads(line)), None
+    except json.JSONDecodeError as e:
+        return None, f"JSON non valido: {e.msg}"
+    except (TypeError, ValidationError) as e:
+        return None, str(e)
+
+
+def insert_batch(db: Session, records: List[Record]):
+    """Aggiunge al session gli articoli del batch. Non fa commit."""
+    author_ids = {record.authorId for _, record in records}
+    known_authors = {user_id for (user_id,) in db.query(User.id).filter(User.id.in_(author_ids))}
+
+    results, created = [], []
+    for line_number, record in records:
+        if record.authorId not in known_authors:
+            results.append({"line": line_number, "status": "error", "error": f"Autore {record.authorId} inesistente"})
+            continue
+        article = Article(
+            id=str(uuid.uuid4()),
+            title=record.title,
+            excerpt=record.excerpt if record.excerpt is not None else record.content[:100],
+            content=record.content,
+            authorId=record.authorId,
+            status=record.status,
+            publishDate=record.publishDate or date.today(),
+            readTime=record.readTime if record.readTime is not None else int(len(record.content) / 150),
+            likes=0,
+            views=0,
+            isLiked=False,
+            thumbnail=record.thumbnail or "",
+            filename=f"{uuid.uuid4()}.html",
+            tags=record.tags or "",
+        )
+        db.add(article)
+        created.append((article, record))
+        results.append({"line": line_number, "status": "created", "id": article.id})
+
+    sync_articles_tags(db, [article for article, record in created if record.tags])
+    record_events(db, [
+        {"type": "article_published", "userId": article.authorId, "articleId": article.id}
+        for article, _ in created if article.status == "published"
+    ])
+    return results, created
+
+
+async def _commit_batch(db: AsyncSession, records: List[Record]):
+    try:
+        results, created = await db.run_sync(insert_batch, records)
+        await db.commit()
+        return results, created
+    except Exception as e:
+        await db.rollback()
+        if len(records) == 1:
+            return [{"line": records[0][0], "status": "error", "error": str(getattr(e, "orig", e))}], []
+
+    # Il batch è fallito: si ripete un record alla volta per salvare quelli validi
+    results, created = [], []
+    for record in records:
+        record_results, record_created = await _commit_batch(db, [record])
+        results += record_results
+        created += record_created
+    return results, created
+
+
+async def import_articles(
+    db: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_created: Optional[Callable[[List[Tuple[Article, ArticleImport]]], None]] = None,
+) -> dict:
+    """Importa gli articoli dal flusso NDJSON. Restituisce riepilogo ed esito per riga."""
+    results: List[dict] = []
+    batch: List[Record] = []
+
+    async def flush():
+        batch_results, created = await _commit_batch(db, batch)
+        results.extend(batch_results)
+        if on_created and created:
+            on_created(created)
+        batch.clear()
+
+    async for line_number, record, error in iter_ndjson(chunks):
+        if error:
+            results.append({"line": line_number, "status": "error", "error": error})
+            continue
+        batch.append((line_number, record))
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+
+    results.sort(key=lambda result: result["line"])
+    created = sum(1 for result in results if result["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
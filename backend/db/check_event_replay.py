@@ -0,0 +1,99 @@
+"""
+Regressione dell'idempotenza degli eventi: invia due volte lo stesso batch a
+POST /events/ contro un database SQLite temporaneo, elabora la coda di db/awards.py
+dopo ogni invio e fallisce (exit code 1) se il secondo invio accetta eventi o
+cambia gli XP dell'utente. Verifica anche che l'endpoint rifiuti richieste senza
+token, eventi di un altro utente ed eventi senza né eventId né articleId.
+
+Uso (dalla cartella backend):
+    python -m db.check_event_replay
+"""
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+
+USER_ID, OTHER_USER_ID, ARTICLE_ID = "er-user", "er-other", "er-article"
+
+
+def seed(engine):
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO Users (id, name, email, password, level, xp, xpToNext, totalXp, joinDate) "
+            "VALUES (:id, :id, :email, 'x', 1, 0, 1000, 0, :joinDate)"),
+            [{"id": id_, "email": f"{id_}@bench.ai", "joinDate": date(2024, 1, 1)} for id_ in (USER_ID, OTHER_USER_ID)])
+        conn.execute(text(
+            "INSERT INTO Articles (id, title, excerpt, content, authorId, status, publishDate, readTime, likes, "
+            "views, isLiked, thumbnail, filename, tags) VALUES (:id, 'Articolo', 'Estratto', 'Contenuto', :authorId, "
+            "'published', :publishDate, 3, 0, 0, 0, '', 'er.html', '')"),
+            {"id": ARTICLE_ID, "authorId": OTHER_USER_ID, "publishDate": date(2024, 1, 1)})
+
+
+def total_xp(engine) -> int:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT totalXp FROM Users WHERE id = :id"), {"id": USER_ID}).scalar_one()
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    # L'engine dell'app è creato all'import: l'URL va impostato prima
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'replay.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from fastapi.testclient import TestClient
+    import main as app_module
+    from auth import issue_token
+    from db.awards import process_pending
+    from db.database import engine
+
+    seed(engine)
+    client = TestClient(app_module.app)
+    headers = {"Authorization": f"Bearer {issue_token(USER_ID)['access_token']}"}
+    occurred = datetime(2024, 1, 2, 10, 0).isoformat()
+    batch = [
+        {"userId": USER_ID, "type": "article_read", "articleId": ARTICLE_ID, "occurredAt": occurred},
+        {"userId": USER_ID, "type": "quiz_completed", "eventId": "er-quiz-1", "occurredAt": occurred},
+        {"userId": USER_ID, "type": "quiz_completed", "eventId": "er-quiz-2", "occurredAt": occurred},
+    ]
+
+    failures = []
+
+    def check(name: str, ok: bool, detail: str):
+        print(f"{'ok' if ok else 'FAIL':<6} {name}: {detail}")
+        if not ok:
+            failures.append(name)
+
+    responses, xp = [], []
+    for _ in range(2):
+        response = client.post("/events/", json=batch, headers=headers)
+        response.raise_for_status()
+        responses.append(response.json())
+        process_pending()
+        xp.append(total_xp(engine))
+    check("primo invio", responses[0]["accepted"] == len(batch) and xp[0] > 0,
+          f"{responses[0]['accepted']} eventi accettati, {xp[0]} XP")
+    check("reinvio", responses[1]["accepted"] == 0 and xp[1] == xp[0],
+          f"{responses[1]['accepted']} eventi accettati, XP {xp[0]} -> {xp[1]}")
+
+    status = client.post("/events/", json=batch).status_code
+    check("senza token", status == 401, f"HTTP {status}")
+    other = [{**batch[0], "userId": OTHER_USER_ID}]
+    status = client.post("/events/", json=other, headers=headers).status_code
+    check("evento di un altro utente", status == 403, f"HTTP {status}")
+    anonymous = [{"userId": USER_ID, "type": "quiz_completed"}]
+    status = client.post("/events/", json=anonymous, headers=headers).status_code
+    check("senza eventId né articleId", status == 422, f"HTTP {status}")
+    check("XP dopo le richieste rifiutate", total_xp(engine) == xp[0], f"{total_xp(engine)} XP")
+
+    if failures:
+        print(f"\n{len(failures)} controlli falliti.")
+        sys.exit(1)
+    print("\nEventi idempotenti: il reinvio non cambia gli XP.")
+
+
+if __name__ == "__main__":
+    main()
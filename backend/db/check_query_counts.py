@@ -0,0 +1,126 @@
+"""
+Regressione N+1: conta le query SQL emesse dagli endpoint di lista contro un
+database SQLite temporaneo e fallisce (exit code 1) se un endpoint supera il
+proprio budget o se il numero di query cresce con il numero di righe restituite.
+
+Ogni endpoint viene chiamato due volte, con un numero di righe diverso: con il
+caricamento eager (ARTICLE_AUTHOR_LOAD, USER_ACHIEVEMENTS_LOAD) le query sono le
+stesse; un lazy load per riga le fa crescere.
+
+Uso (dalla cartella backend):
+    python -m db.check_query_counts
+    python -m db.check_query_counts --rows 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+from datetime import date
+
+# Query massime per richiesta: lista + autori (join) + achievement degli autori (selectin)
+QUERY_BUDGETS = {
+    "/articles/": 3,
+    "/users/": 3,
+    "/articles/user/{id}": 4,  # più la query aggregata del validatore HTTP
+}
+ACHIEVEMENTS_PER_USER = 3
+
+
+def seed_achievements(engine, users):
+    """Qualche achievement per utente, perché il caricamento degli achievement venga esercitato."""
+    from sqlalchemy import text
+
+    achievement_ids = [f"qc-{i}" for i in range(ACHIEVEMENTS_PER_USER)]
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO Achievements (id, name, description, icon, xpReward) "
+            "VALUES (:id, :id, 'Controllo query', 'star', 10)"), [{"id": id_} for id_ in achievement_ids])
+        conn.execute(text(
+            "INSERT INTO UserAchievements (userId, achievementId, unlockedAt) VALUES (:userId, :achievementId, :unlockedAt)"),
+            [{"userId": u["id"], "achievementId": id_, "unlockedAt": date(2024, 1, 1)}
+             for u in users for id_ in achievement_ids])
+
+
+def seed_author(engine, user_id: str, n_articles: int):
+    """Articoli aggiuntivi per un solo autore, per /articles/user/{id} con molte righe."""
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO Articles (id, title, excerpt, content, authorId, status, publishDate, readTime, likes, "
+            "views, isLiked, thumbnail, filename, tags) VALUES (:id, 'Articolo', 'Estratto', 'Contenuto', :authorId, "
+            "'published', :publishDate, 3, 0, 0, 0, '', :filename, '')"),
+            [{"id": id_, "authorId": user_id, "publishDate": date(2024, 1, 1), "filename": f"{id_}.html"}
+             for id_ in (str(uuid.uuid4()) for _ in range(n_articles))])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200, help="righe restituite nella richiesta grande")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    # L'engine dell'app è creato all'import: l'URL va impostato prima
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'counts.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event, text
+    import main as app_module
+    from db.check_query_plans import seed_large_dataset
+    from db.database import engine, async_engine
+
+    users, _ = seed_large_dataset(engine, args.rows, args.rows * 2)
+    few_author, many_author = "qc-few", "qc-many"
+    authors = [{"id": id_, "email": f"{id_}@bench.ai", "joinDate": date(2024, 1, 1)} for id_ in (few_author, many_author)]
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO Users (id, name, email, password, level, xp, xpToNext, totalXp, joinDate) "
+            "VALUES (:id, :id, :email, 'x', 1, 0, 1000, 0, :joinDate)"), authors)
+    seed_achievements(engine, users + authors)
+    seed_author(engine, few_author, 2)
+    seed_author(engine, many_author, args.rows)
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+
+    client = TestClient(app_module.app)
+    cases = [
+        ("/articles/", ("/articles/", {"limit": args.rows // 2}), ("/articles/", {"limit": args.rows})),
+        ("/users/", ("/users/", {"limit": args.rows // 2}), ("/users/", {"limit": args.rows})),
+        ("/articles/user/{id}", (f"/articles/user/{few_author}", {}), (f"/articles/user/{many_author}", {})),
+    ]
+    failures = 0
+    for name, *requests in cases:
+        counts = []
+        for path, params in requests:
+            statements.clear()
+            response = client.get(path, params=params)
+            response.raise_for_status()
+            counts.append((len(response.json()), len(statements)))
+        (few_rows, few_queries), (many_rows, many_queries) = counts
+        budget = QUERY_BUDGETS[name]
+        problems = []
+        if max(few_queries, many_queries) > budget:
+            problems.append(f"oltre il budget di {budget}")
+        if many_queries > few_queries:
+            problems.append("cresce con le righe (N+1)")
+        status = "FAIL" if problems else "ok"
+        print(f"{status:<6} GET {name}: {few_queries} query con {few_rows} righe, "
+              f"{many_queries} con {many_rows} righe{' - ' + ', '.join(problems) if problems else ''}")
+        failures += bool(problems)
+
+    if failures:
+        print(f"\n{failures} endpoint oltre il numero di query atteso.")
+        sys.exit(1)
+    print("\nNumero di query costante e nel budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Regressione dei piani di query: esegue gli endpoint di lettura contro un database
+SQLite temporaneo popolato con un dataset ampio, cattura ogni SELECT emessa e
+ne verifica l'EXPLAIN QUERY PLAN. Fallisce (exit code 1) se una query scandisce
+un'intera tabella: scansione senza indice, oppure scansione di un indice in una
+query senza LIMIT (ad esempio un ORDER BY servito dall'indice sbagliato). Fallisce
+anche se una query con LIMIT ordina in una B-tree temporanea: per restituire una
+pagina legge e ordina tutte le righe che corrispondono al filtro.
+
+Uso (dalla cartella backend):
+    python -m db.check_query_plans
+    python -m db.check_query_plans --articles 200000 --users 20000
+
+Gli endpoint che chiamano un LLM (/process-content/, /enhanced-articles/...)
+non sono inclusi.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import uuid
+from datetime import date, timedelta
+from typing import Optional
+
+# "SCAN Articles", "SCAN TABLE Articles" (SQLite < 3.36) o "SCAN Articles USING INDEX ...";
+# non corrisponde a tabelle virtuali (FTS5), subquery materializzate o CONSTANT ROW
+TABLE_SCAN = re.compile(r"^SCAN (?:TABLE )?(?P<table>[^\s(]\S*)(?: AS \S+)?(?P<index> USING (?:COVERING )?INDEX .*)?$")
+HAS_LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+# "USE TEMP B-TREE FOR ORDER BY", anche "... FOR RIGHT PART OF ORDER BY" (ordinamento parziale)
+TEMP_SORT = re.compile(r"^USE TEMP B-TREE FOR (?:.* )?ORDER BY$")
+
+# Tabelle piccole e limitate per natura, che è accettabile leggere per intero
+ALLOWED_FULL_SCANS = {"Tags"}
+
+# Nomi distinti da quelli dei dati di seed
+TAG_NAMES = [f"bench-{name}" for name in ("tecnologia", "scienza", "salute", "viaggi", "sport", "cultura", "economia", "politica")]
+
+
+def seed_large_dataset(engine, n_users: int, n_articles: int):
+    from sqlalchemy import text
+
+    rng = random.Random(42)
+    start = date(2020, 1, 1)
+    users = [
+        {"id": f"u{i}", "name": f"User {i}", "email": f"user{i}@bench.ai", "password": "$2b$12$" + "x" * 53,
+         "level": 1, "xp": 0, "xpToNext": 1000, "totalXp": rng.randint(0, 10000),
+         "joinDate": start + timedelta(days=rng.randint(0, 1500))}
+        for i in range(n_users)
+    ]
+    tag_ids = {name: str(uuid.uuid4()) for name in TAG_NAMES}
+    articles, links = [], []
+    for i in range(n_articles):
+        tags = rng.sample(TAG_NAMES, 2)
+        article_id = str(uuid.uuid4())
+        articles.append({
+            "id": article_id, "title": f"Articolo {i}", "excerpt": "Estratto", "content": f"Contenuto {i} " * 20,
+            "authorId": f"u{rng.randrange(n_users)}", "status": rng.choice(["draft", "published"]),
+            "publishDate": start + timedelta(days=rng.randint(0, 1500)), "readTime": 3, "likes": 0,
+            "views": 0, "isLiked": False, "thumbnail": "", "filename": f"{article_id}.html", "tags": ",".join(tags),
+        })
+        links += [{"articleId": article_id, "tagId": tag_ids[name], "publishDate": articles[-1]["publishDate"]}
+                  for name in tags]
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO Users (id, name, email, password, level, xp, xpToNext, totalXp, joinDate) "
+            "VALUES (:id, :name, :email, :password, :level, :xp, :xpToNext, :totalXp, :joinDate)"), users)
+        conn.execute(text(
+            "INSERT INTO Configurations (id, user_id, age_preference) VALUES (:id, :user_id, 30)"),
+            [{"id": str(uuid.uuid4()), "user_id": u["id"]} for u in users])
+        conn.execute(text("INSERT INTO Tags (id, name) VALUES (:id, :name)"),
+                     [{"id": tag_id, "name": name} for name, tag_id in tag_ids.items()])
+        conn.execute(text(
+            "INSERT INTO Articles (id, title, excerpt, content, authorId, status, publishDate, readTime, likes, "
+            "views, isLiked, thumbnail, filename, tags) VALUES (:id, :title, :excerpt, :content, :authorId, "
+            ":status, :publishDate, :readTime, :likes, :views, :isLiked, :thumbnail, :filename, :tags)"), articles)
+        conn.execute(text(
+            "INSERT INTO ArticleTags (articleId, tagId, publishDate) VALUES (:articleId, :tagId, :publishDate)"), links)
+
+    from db.database import SessionLocal
+    from db.leaderboard import rebuild_leaderboard
+
+    with SessionLocal() as db:
+        rebuild_leaderboard(db)
+    return users, articles
+
+
+def is_full_scan(detail: str, statement: str) -> bool:
+    match = TABLE_SCAN.match(detail.strip())
+    if not match or match.group("table") in ALLOWED_FULL_SCANS:
+        return False
+    # Una scansione d'indice è accettabile solo se la query si ferma dopo LIMIT righe
+    return not (match.group("index") and HAS_LIMIT.search(statement))
+
+
+def is_sorted_page(detail: str, statement: str) -> bool:
+    """Pagina (query con LIMIT) ordinata dopo aver letto tutte le righe invece che servita da un indice."""
+    return bool(TEMP_SORT.match(detail.strip()) and HAS_LIMIT.search(statement))
+
+
+def plan_problem(plan: list, statement: str) -> Optional[str]:
+    if any(is_full_scan(detail, statement) for detail in plan):
+        return "FULL SCAN"
+    # L'ordine per rilevanza di FTS5 (bm25) non può venire da un indice: si ordinano solo i risultati del MATCH
+    full_text = any("VIRTUAL TABLE" in detail for detail in plan)
+    if not full_text and any(is_sorted_page(detail, statement) for detail in plan):
+        return "TEMP SORT"
+    return None
+
+
+def endpoint_requests(users, articles):
+    """Richieste rappresentative per ogni endpoint di lettura."""
+    user_id = users[len(users) // 2]["id"]
+    article_id = articles[len(articles) // 2]["id"]
+    return [
+        ("GET", "/users/", {}),
+        ("GET", f"/users/{user_id}", {}),
+        ("GET", "/achievements/", {}),
+        ("GET", "/achievements/a1", {}),
+        ("GET", "/userachievements/", {}),
+        ("GET", f"/userachievements/{user_id}/a1", {}),
+        ("GET", "/articles/", {"limit": 20}),
+        ("GET", "/articles/", {"limit": 20, "status": "published"}),
+        ("GET", f"/articles/{article_id}", {}),
+        ("GET", f"/articles/user/{user_id}", {}),
+        ("GET", "/articles/tags/", {"tags": "bench-scienza", "limit": 20}),
+        ("GET", "/articles/tags/", {"tags": "bench-scienza,bench-salute", "limit": 20}),
+        ("GET", "/articles/tags/", {"tags": "bench-scienza,bench-salute", "match": "all", "limit": 20}),
+        ("GET", "/articles/search/", {"q": "contenuto 42"}),
+        ("GET", "/tags/", {}),
+        ("GET", "/leaderboard/", {"limit": 20}),
+        ("GET", f"/leaderboard/user/{user_id}", {"radius": 5}),
+        ("GET", "/configurations/", {"limit": 20}),
+        ("GET", f"/configurations/user/{user_id}", {}),
+        ("POST", "/api/login", {"email": "nobody@bench.ai", "password": "x"}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--articles", type=int, default=50000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    # L'engine dell'app è creato all'import: l'URL va impostato prima
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'plans.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    import main as app_module
+    from db.database import engine, async_engine
+
+    print(f"Popolamento: {args.users} utenti, {args.articles} articoli...")
+    users, articles = seed_large_dataset(engine, args.users, args.articles)
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+
+    client = TestClient(app_module.app)
+    failures = 0
+    for method, path, params in endpoint_requests(users, articles):
+        captured.clear()
+        if method == "GET":
+            response = client.get(path, params=params)
+            # Anche la seconda pagina, che filtra per cursore
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor:
+                client.get(path, params={**params, "cursor": cursor})
+        else:
+            client.post(path, json=params)
+
+        statements = list(captured)
+        endpoint_failures = 0
+        with engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+                problem = plan_problem(plan, statement)
+                if problem:
+                    endpoint_failures += 1
+                    print(f"{problem:<10} {method} {path} {params}")
+                    print("    " + " ".join(statement.split()))
+                    for detail in plan:
+                        print(f"      {detail}")
+        if not endpoint_failures:
+            print(f"ok         {method} {path} {params} ({len(statements)} query)")
+        failures += endpoint_failures
+
+    if failures:
+        print(f"\n{failures} query con scansione completa o ordinamento non servito da un indice.")
+        sys.exit(1)
+    print("\nNessuna scansione completa né ordinamento temporaneo.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Contatori write-behind per visualizzazioni e like degli articoli.
+
+Gli incrementi vengono accumulati in memoria e scritti periodicamente in un'unica
+transazione con UPDATE relativi (views = views + n): più worker possono scrivere
+gli stessi articoli senza perdere aggiornamenti, perché nessuno sovrascrive il
+valore letto da un altro. Al flush fallito i delta tornano nel buffer.
+"""
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from sqlalchemy import bindparam, case, update
+
+from cache import article_key, entity_cache
+from db.database import engine
+from db.model import Article
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", "5"))
+# Oltre questo numero di articoli in attesa il flush viene anticipato
+COUNTER_MAX_PENDING = int(os.getenv("COUNTER_MAX_PENDING", "10000"))
+
+_new_likes = Article.likes + bindparam("likes_delta")
+_FLUSH_STATEMENT = (
+    update(Article)
+    .where(Article.id == bindparam("article_id"))
+    .values(
+        views=Article.views + bindparam("views_delta"),
+        likes=case((_new_likes < 0, 0), else_=_new_likes),
+    )
+)
+
+
+class WriteBehindCounters:
+    def __init__(self, bind=engine, interval: float = COUNTER_FLUSH_INTERVAL, max_pending: int = COUNTER_MAX_PENDING):
+        self.bind = bind
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = defaultdict(lambda: [0, 0])  # article_id -> [views, likes]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def increment(self, article_id: str, views: int = 0, likes: int = 0):
+        with self._lock:
+            delta = self._pending[article_id]
+            delta[0] += views
+            delta[1] += likes
+            overflow = len(self._pending) >= self.max_pending
+        if overflow:
+            self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """Scrive i delta accumulati in un'unica transazione. Restituisce gli articoli aggiornati."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, defaultdict(lambda: [0, 0])
+            rows = [
+                {"article_id": article_id, "views_delta": views, "likes_delta": likes}
+                for article_id, (views, likes) in batch.items()
+                if views or likes
+            ]
+            if not rows:
+                return 0
+            try:
+                with self.bind.begin() as conn:
+                    conn.execute(_FLUSH_STATEMENT, rows)
+            except Exception:
+                logger.exception(f"Flush dei contatori fallito, {len(rows)} articoli rimessi in coda")
+                for row in rows:
+                    self.increment(row["article_id"], row["views_delta"], row["likes_delta"])
+                raise
+            entity_cache.invalidate(*(article_key(row["article_id"]) for row in rows))
+            return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # già loggato, si riprova al prossimo giro
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="counters_flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ferma il flusher ed esegue l'ultimo flush (allo shutdown)."""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+article_counters = WriteBehindCounters()
@@ -1,15 +1,126 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./db/fluid_content.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./db/fluid_content.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Profilo SQLite: PRAGMA applicati a ogni nuova connessione
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # lettori e writer non si bloccano a vicenda
+    "synchronous": "NORMAL",  # sicuro con WAL, evita un fsync per ogni commit
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),  # negativo = KiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+# Profilo server (PostgreSQL, MySQL, ...): pool esplicito
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Driver asincroni usati dagli endpoint async def
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, tuned: bool = True):
+    """
+    Crea l'engine per l'URL indicato scegliendo il profilo in base al backend:
+    SQLite con WAL e PRAGMA ottimizzati, oppure un pool dimensionato per i DB server.
+    Con tuned=False si ottiene la configurazione di default (usata dal benchmark).
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        if tuned:
+            event.listen(engine, "connect", _apply_sqlite_pragmas)
+        return engine
+
+    if not tuned:
+        return create_engine(url)
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def to_async_url(url: str) -> str:
+    """Converte l'URL sincrono nell'equivalente con driver asincrono."""
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS[parsed.get_backend_name()]).render_as_string(hide_password=False)
+
+
+def create_async_db_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    """Engine asincrono con gli stessi profili di create_db_engine."""
+    async_url = os.getenv("ASYNC_DATABASE_URL") or to_async_url(url)
+    if make_url(async_url).get_backend_name() == "sqlite":
+        async_engine = create_async_engine(async_url)
+        event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        return async_engine
+    return create_async_engine(
+        async_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine()
+# expire_on_commit=False: dopo il commit gli oggetti restano leggibili senza I/O implicito
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+
+def ensure_columns(bind=engine):
+    """
+    create_all non modifica le tabelle già esistenti: aggiunge le colonne mancanti
+    (solo nullable, senza vincoli; gli indici li crea ensure_indexes).
+    """
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+
+def ensure_indexes(bind=engine):
+    """create_all non aggiunge indici alle tabelle già esistenti: crea quelli mancanti."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
 # Dependency FastAPI per il DB session
 def get_db():
     db = SessionLocal()
@@ -17,3 +128,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency FastAPI per gli endpoint async def: non blocca l'event loop
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
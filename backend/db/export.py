@@ -0,0 +1,170 @@
+"""
+Export massivo di articoli, utenti e contatori di engagement in NDJSON o Parquet.
+
+Le righe vengono lette con un cursore in streaming (yield_per) e scritte a blocchi
+di EXPORT_CHUNK_SIZE: in memoria c'è sempre un solo blocco, qualunque sia la
+dimensione del catalogo. Per Parquet ogni blocco diventa un row group, emesso non
+appena scritto. Gli iteratori sono sincroni: serviti da StreamingResponse girano
+nel threadpool e non bloccano l'event loop.
+
+Uso da riga di comando (dalla cartella backend):
+    python -m db.export articles --format parquet -o articles.parquet
+    python -m db.export engagement --since 2025-01-01 --status published -o engagement.ndjson
+"""
+import argparse
+import io
+import json
+import os
+import sys
+from datetime import date
+from typing import Iterator, Optional
+
+from sqlalchemy import Boolean, Date, Integer, select
+
+from db.database import engine
+from db.model import Article, User
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+# Colonne esportate e colonna data usata dai filtri since/until; le password e
+# le email degli utenti non vengono esportate
+DATASETS = {
+    "articles": {
+        "columns": [Article.id, Article.title, Article.excerpt, Article.content, Article.authorId, Article.status,
+                    Article.publishDate, Article.readTime, Article.thumbnail, Article.filename, Article.tags],
+        "date": Article.publishDate,
+        "status": Article.status,
+        "order": [Article.publishDate, Article.id],
+    },
+    "users": {
+        "columns": [User.id, User.name, User.avatar, User.level, User.xp, User.xpToNext, User.totalXp, User.joinDate],
+        "date": User.joinDate,
+        "status": None,
+        "order": [User.joinDate, User.id],
+    },
+    "engagement": {
+        "columns": [Article.id.label("articleId"), Article.authorId, Article.status, Article.publishDate,
+                    Article.views, Article.likes],
+        "date": Article.publishDate,
+        "status": Article.status,
+        "order": [Article.publishDate, Article.id],
+    },
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def build_query(dataset: str, since: Optional[date] = None, until: Optional[date] = None, status: Optional[str] = None):
+    spec = DATASETS[dataset]
+    query = select(*spec["columns"]).order_by(*spec["order"])
+    if since is not None:
+        query = query.where(spec["date"] >= since)
+    if until is not None:
+        query = query.where(spec["date"] <= until)
+    if status is not None:
+        if spec["status"] is None:
+            raise ValueError(f"Il dataset {dataset} non ha uno stato")
+        query = query.where(spec["status"] == status)
+    return query
+
+
+def iter_chunks(query, chunk_size: int = EXPORT_CHUNK_SIZE, bind=engine):
+    """Righe della query come liste di dict, al più chunk_size alla volta."""
+    with bind.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+
+def iter_ndjson(query, chunk_size: int = EXPORT_CHUNK_SIZE, bind=engine) -> Iterator[bytes]:
+    for rows in iter_chunks(query, chunk_size, bind):
+        yield "".join(json.dumps(row, default=_json_default, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+
+def arrow_schema(query):
+    import pyarrow as pa
+
+    types = []
+    for column in query.selected_columns:
+        if isinstance(column.type, Integer):
+            types.append((column.name, pa.int64()))
+        elif isinstance(column.type, Date):
+            types.append((column.name, pa.date32()))
+        elif isinstance(column.type, Boolean):
+            types.append((column.name, pa.bool_()))
+        else:
+            types.append((column.name, pa.string()))
+    return pa.schema(types)
+
+
+class _ChunkSink(io.RawIOBase):
+    """File in sola scrittura da cui si prelevano i byte scritti finora."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._buffer = bytes(self._buffer), bytearray()
+        return data
+
+
+def iter_parquet(query, chunk_size: int = EXPORT_CHUNK_SIZE, bind=engine) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(query)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in iter_chunks(query, chunk_size, bind):
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.drain()
+    yield sink.drain()  # footer
+
+
+def export(dataset: str, format: str = "ndjson", since: Optional[date] = None, until: Optional[date] = None,
+           status: Optional[str] = None, chunk_size: int = EXPORT_CHUNK_SIZE, bind=engine) -> Iterator[bytes]:
+    query = build_query(dataset, since, until, status)
+    if format == "parquet":
+        return iter_parquet(query, chunk_size, bind)
+    return iter_ndjson(query, chunk_size, bind)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("--format", choices=sorted(MEDIA_TYPES), default="ndjson")
+    parser.add_argument("--since", type=date.fromisoformat)
+    parser.add_argument("--until", type=date.fromisoformat)
+    parser.add_argument("--status")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("-o", "--output", help="file di destinazione (default: stdout)")
+    args = parser.parse_args()
+
+    chunks = export(args.dataset, args.format, args.since, args.until, args.status, args.chunk_size)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Classifica materializzata.
+
+Ogni voce di Leaderboard ha una posizione `rank` (1..N) salvata e indicizzata,
+quindi top-K, posizione di un utente e vicini sono letture su un intervallo
+dell'indice, senza ORDER BY su tutti gli utenti. Le voci collegate a un utente
+(userId) sono derivate da User (nome, avatar, livello, totalXp); articlesRead e
+streak sono contatori della classifica stessa.
+
+Quando il punteggio di una voce cambia, la voce viene spostata confrontandola con
+le voci adiacenti e solo le posizioni comprese tra la vecchia e la nuova vengono
+traslate di uno: il costo è proporzionale allo spostamento, non al numero di utenti.
+A parità di punteggio l'ordine esistente viene mantenuto (una nuova voce entra in
+fondo e supera solo chi ha un punteggio strettamente inferiore).
+
+La prima scrittura della transazione avviene prima di leggere le voci adiacenti,
+così su SQLite il lock di scrittura protegge lo spostamento da aggiornamenti concorrenti.
+"""
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from db.model import Leaderboard, User
+
+_WALK_BATCH = 64
+
+
+def score(entry) -> tuple:
+    """Chiave di ordinamento: più alta = posizione migliore."""
+    return (entry.totalXp or 0, entry.articlesRead or 0, entry.streak or 0)
+
+
+def _neighbours(db: Session, entry: Leaderboard, start: int, end: int, descending: bool):
+    rank_order = Leaderboard.rank.desc() if descending else Leaderboard.rank.asc()
+    return (
+        db.query(Leaderboard.rank, Leaderboard.totalXp, Leaderboard.articlesRead, Leaderboard.streak)
+        .filter(Leaderboard.rank.between(start, end), Leaderboard.id != entry.id)
+        .order_by(rank_order)
+        .all()
+    )
+
+
+def _reposition(db: Session, entry: Leaderboard):
+    current = entry.rank
+    target = current
+    entry_score = score(entry)
+
+    # Verso l'alto: supera le voci con punteggio strettamente inferiore
+    while target > 1:
+        rows = _neighbours(db, entry, max(1, target - _WALK_BATCH), target - 1, descending=True)
+        passed = 0
+        for row in rows:
+            if score(row) >= entry_score:
+                break
+            passed += 1
+        target -= passed
+        if passed < len(rows) or not rows:
+            break
+
+    if target < current:
+        db.query(Leaderboard).filter(
+            Leaderboard.rank >= target, Leaderboard.rank < current, Leaderboard.id != entry.id
+        ).update({Leaderboard.rank: Leaderboard.rank + 1}, synchronize_session=False)
+        entry.rank = target
+        return
+
+    # Verso il basso: lascia passare le voci con punteggio strettamente superiore
+    while True:
+        rows = _neighbours(db, entry, target + 1, target + _WALK_BATCH, descending=False)
+        passed = 0
+        for row in rows:
+            if score(row) <= entry_score:
+                break
+            passed += 1
+        target += passed
+        if passed < len(rows) or not rows:
+            break
+
+    if target > current:
+        db.query(Leaderboard).filter(
+            Leaderboard.rank > current, Leaderboard.rank <= target, Leaderboard.id != entry.id
+        ).update({Leaderboard.rank: Leaderboard.rank - 1}, synchronize_session=False)
+        entry.rank = target
+
+
+def _last_rank(db: Session) -> int:
+    return db.query(func.max(Leaderboard.rank)).scalar() or 0
+
+
+def add_entry(db: Session, entry: Leaderboard) -> Leaderboard:
+    """Inserisce una voce in fondo e la porta nella sua posizione. Non fa commit."""
+    db.add(entry)
+    db.flush()  # prima scrittura: prende il lock prima di leggere le posizioni
+    entry.rank = _last_rank(db) + 1
+    _reposition(db, entry)
+    return entry
+
+
+def update_entry(db: Session, entry: Leaderboard) -> Leaderboard:
+    """Da chiamare dopo aver modificato i campi del punteggio di una voce. Non fa commit."""
+    db.flush()
+    if entry.rank is None:
+        entry.rank = _last_rank(db) + 1
+    _reposition(db, entry)
+    return entry
+
+
+def remove_entry(db: Session, entry: Leaderboard):
+    """Elimina una voce e fa risalire di una posizione quelle sotto. Non fa commit."""
+    rank = entry.rank
+    db.delete(entry)
+    db.flush()
+    if rank is not None:
+        db.query(Leaderboard).filter(Leaderboard.rank > rank).update(
+            {Leaderboard.rank: Leaderboard.rank - 1}, synchronize_session=False
+        )
+
+
+def sync_user(db: Session, user: User, articles_read: int = 0, streak: Optional[int] = None) -> Leaderboard:
+    """
+    Allinea la voce di un utente ai suoi dati (creandola se manca) e ne aggiorna la
+    posizione. `articles_read` è un incremento, `streak` il nuovo valore. Non fa commit.
+    """
+    db.flush()  # assegna l'id ai nuovi utenti e prende il lock di scrittura
+    entry = db.query(Leaderboard).filter(Leaderboard.userId == user.id).first()
+    is_new = entry is None
+    if is_new:
+        entry = Leaderboard(userId=user.id, name=user.name, articlesRead=0, streak=0)
+    entry.name = user.name
+    entry.avatar = user.avatar
+    entry.level = user.level
+    entry.totalXp = user.totalXp
+    entry.articlesRead = (entry.articlesRead or 0) + articles_read
+    if streak is not None:
+        entry.streak = streak
+    return add_entry(db, entry) if is_new else update_entry(db, entry)
+
+
+def remove_user(db: Session, user_id: str):
+    entry = db.query(Leaderboard).filter(Leaderboard.userId == user_id).first()
+    if entry is not None:
+        remove_entry(db, entry)
+
+
+def rebuild_leaderboard(db: Session) -> int:
+    """
+    Ricalcolo completo: crea le voci mancanti per gli utenti, rimuove quelle di utenti
+    eliminati e riassegna tutte le posizioni. Usato all'avvio e come riparazione.
+    """
+    users = {user.id: user for user in db.query(User)}
+    entries = db.query(Leaderboard).all()
+    linked = set()
+    for entry in entries:
+        if entry.userId is None:
+            continue
+        user = users.get(entry.userId)
+        if user is None:
+            db.delete(entry)
+            continue
+        linked.add(user.id)
+        entry.name, entry.avatar, entry.level, entry.totalXp = user.name, user.avatar, user.level, user.totalXp
+    for user_id, user in users.items():
+        if user_id not in linked:
+            entry = Leaderboard(userId=user_id, name=user.name, avatar=user.avatar, level=user.level,
+                                totalXp=user.totalXp, articlesRead=0, streak=0)
+            db.add(entry)
+            entries.append(entry)
+
+    live = [entry for entry in entries if entry.userId is None or entry.userId in users]
+    # Ordinamento stabile: a parità di punteggio resta l'ordine precedente
+    live.sort(key=lambda e: e.rank if e.rank is not None else float("inf"))
+    live.sort(key=score, reverse=True)
+    for position, entry in enumerate(live, start=1):
+        entry.rank = position
+    db.commit()
+    return len(live)
+
+
+def around(db: Session, rank: int, radius: int) -> List[Leaderboard]:
+    return (
+        db.query(Leaderboard)
+        .filter(Leaderboard.rank.between(max(1, rank - radius), rank + radius))
+        .order_by(Leaderboard.rank)
+        .all()
+    )
@@ -1,14 +1,17 @@
-from sqlalchemy import Column, String, Integer, Boolean, Date, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, Date, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from db.database import Base
 import bcrypt
 import uuid
-from datetime import date
+from datetime import date, datetime
 
 
 # ORM MODELS
 class User(Base):
     __tablename__ = "Users"
+    __table_args__ = (
+        Index("ix_users_joinDate_id", "joinDate", "id"),  # paginazione keyset
+    )
     id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
@@ -19,6 +22,7 @@ class User(Base):
     xpToNext = Column(Integer, nullable=False, default=1000)  # Default value for xpToNext
     totalXp = Column(Integer, nullable=False, default=0)
     joinDate = Column(Date, nullable=False, default=date.today())
+    updatedAt = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)  # validatore HTTP
     configuration = relationship("Configuration", back_populates="user", uselist=False)
     achievements = relationship("UserAchievement", back_populates="user")
     articles = relationship("Article", back_populates="author")
@@ -42,6 +46,7 @@ class Configuration(Base):
     age_preference = Column(Integer, nullable=True)
     interests = Column(String, nullable=True) 
     user_id = Column(String, ForeignKey("Users.id"), nullable=False, unique=True)
+    updatedAt = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
     user =  relationship("User", back_populates="configuration",  uselist=False)
 
 
@@ -52,11 +57,19 @@ class Achievement(Base):
     description = Column(String, nullable=False)
     icon = Column(String, nullable=False)
     xpReward = Column(Integer, nullable=False)
+    # Regola di sblocco valutata da db/awards.py; senza metric l'achievement si assegna solo a mano
+    metric = Column(String, nullable=True)  # tipo di evento contato, es. "article_read"
+    threshold = Column(Integer, nullable=True)
+    period = Column(String, nullable=True)  # "total" (default) o "day"
     users = relationship("UserAchievement", back_populates="achievement")
 
 
 class UserAchievement(Base):
     __tablename__ = "UserAchievements"
+    __table_args__ = (
+        # La chiave primaria (userId, achievementId) copre solo le ricerche per utente
+        Index("ix_userachievements_achievementId_userId", "achievementId", "userId"),
+    )
     userId = Column(String, ForeignKey("Users.id"), primary_key=True)
     achievementId = Column(String, ForeignKey("Achievements.id"), primary_key=True)
     unlockedAt = Column(Date, nullable=False)
@@ -66,6 +79,11 @@ class UserAchievement(Base):
 
 class Article(Base):
     __tablename__ = "Articles"
+    __table_args__ = (
+        Index("ix_articles_publishDate_id", "publishDate", "id"),  # paginazione keyset del feed
+        Index("ix_articles_status_publishDate_id", "status", "publishDate", "id"),  # feed filtrato per stato
+        Index("ix_articles_authorId_publishDate_id", "authorId", "publishDate", "id"),  # articoli per autore
+    )
     id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
     title = Column(String, nullable=False)
     excerpt = Column(String, nullable=False)
@@ -79,11 +97,51 @@ class Article(Base):
     isLiked = Column(Boolean, nullable=False)
     thumbnail = Column(String)
     filename = Column(String, nullable=True)
+    updatedAt = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
     author = relationship("User", back_populates="articles")
-    tags = Column(String, nullable=True)  
+    tags = Column(String, nullable=True)  # stringa separata da virgole, mantenuta per compatibilità
+    tag_links = relationship("ArticleTag", back_populates="article", cascade="all, delete-orphan")
+
+class Tag(Base):
+    __tablename__ = "Tags"
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    name = Column(String, nullable=False, unique=True, index=True)
+    article_links = relationship("ArticleTag", back_populates="tag")
+
+class ArticleTag(Base):
+    __tablename__ = "ArticleTags"
+    __table_args__ = (
+        # Filtri per tag: dal tag agli articoli già nell'ordine del feed, senza toccare la tabella
+        Index("ix_articletags_tagId_publishDate_articleId", "tagId", "publishDate", "articleId"),
+    )
+    articleId = Column(String, ForeignKey("Articles.id"), primary_key=True)
+    tagId = Column(String, ForeignKey("Tags.id"), primary_key=True)
+    publishDate = Column(Date, nullable=True)  # copia di Article.publishDate, allineata da sync_article_tags
+
+    article = relationship("Article", back_populates="tag_links")
+    tag = relationship("Tag", back_populates="article_links")
+
+class UserEvent(Base):
+    __tablename__ = "UserEvents"
+    __table_args__ = (
+        Index("ix_userevents_processedAt_id", "processedAt", "id"),  # eventi da elaborare
+        Index("ix_userevents_userId_type_occurredAt", "userId", "type", "occurredAt"),  # conteggi per regola
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    eventId = Column(String, nullable=False, unique=True)  # chiave di idempotenza
+    userId = Column(String, ForeignKey("Users.id"), nullable=False)
+    type = Column(String, nullable=False)  # article_read, quiz_completed, article_published
+    articleId = Column(String, nullable=True)
+    occurredAt = Column(DateTime, nullable=False)
+    batchId = Column(String, nullable=True, index=True)
+    processedAt = Column(DateTime, nullable=True)
 
 class Leaderboard(Base):
     __tablename__ = "Leaderboard"
+    __table_args__ = (
+        Index("ix_leaderboard_rank_id", "rank", "id"),  # top-K e vicini in tempo logaritmico, pagine già ordinate
+        Index("ix_leaderboard_userId", "userId", unique=True),
+    )
     id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
     name = Column(String, nullable=False)
     avatar = Column(String)
@@ -91,3 +149,5 @@ class Leaderboard(Base):
     totalXp = Column(Integer)
     articlesRead = Column(Integer)
     streak = Column(Integer)
+    userId = Column(String, ForeignKey("Users.id"), nullable=True)  # None per le voci inserite a mano
+    rank = Column(Integer, nullable=True)  # posizione 1..N, mantenuta da db/leaderboard.py
@@ -0,0 +1,55 @@
+import base64
+import json
+from datetime import date
+from typing import List, Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+# Header con il cursore della pagina successiva: il corpo delle liste resta un array
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: list) -> str:
+    """Cursore opaco (base64 url-safe) con i valori delle chiavi dell'ultima riga."""
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: list) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("cursor length mismatch")
+        # Riporta i valori al tipo Python della colonna (es. Date salvata come stringa ISO)
+        return [
+            date.fromisoformat(v) if key.type.python_type is date and v is not None else v
+            for key, v in zip(keys, values)
+        ]
+    except (ValueError, TypeError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_paginate(query, keys: list, cursor: Optional[str], limit: int, response: Response, descending: bool = False, skip: int = 0) -> List:
+    """
+    Paginazione keyset: ordina per `keys` (che devono identificare univocamente la riga
+    ed essere coperte da un indice) e riparte dalla riga successiva al cursore.
+    Il costo di ogni pagina non dipende dalla sua profondità e inserimenti concorrenti
+    non causano righe saltate o duplicate.
+    Restituisce le righe e, se esiste una pagina successiva, ne scrive il cursore
+    nell'header NEXT_CURSOR_HEADER della risposta.
+    `skip` mantiene la compatibilità con i client che usano ancora l'offset.
+    """
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        position = tuple_(*keys)
+        query = query.filter(position < tuple_(*values) if descending else position > tuple_(*values))
+
+    query = query.order_by(*[key.desc() if descending else key.asc() for key in keys])
+    # Una riga in più per sapere se esiste una pagina successiva
+    rows = query.offset(skip).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+    return rows
@@ -1,7 +1,7 @@
 
-from typing import List, Optional
-from pydantic import BaseModel, EmailStr
-from datetime import date
+from typing import List, Optional, Literal
+from pydantic import BaseModel, ConfigDict, EmailStr
+from datetime import date, datetime
 
 # Pydantic Schemas
 class AchievementBase(BaseModel):
@@ -10,13 +10,15 @@ class AchievementBase(BaseModel):
     description: str
     icon: str
     xpReward: int
+    metric: Optional[str] = None
+    threshold: Optional[int] = None
+    period: Optional[Literal["total", "day"]] = None
 
 class AchievementCreate(AchievementBase):
     pass
 
 class AchievementOut(AchievementBase):
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class UserAchievementBase(BaseModel):
@@ -29,8 +31,7 @@ class UserAchievementCreate(UserAchievementBase):
 
 class UserAchievementOut(UserAchievementBase):
     achievement: Optional[AchievementOut] 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserBase(BaseModel):
     name: str
@@ -54,10 +55,11 @@ class UserUpdate(BaseModel):
 
 
 class UserOut(UserBase):
+    email: str  # già validata in ingresso: EmailStr in uscita costa più del resto della serializzazione
     achievements: List[UserAchievementOut] = []
+    updatedAt: Optional[datetime] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class TagBase(BaseModel):
     id: str
@@ -67,8 +69,7 @@ class TagCreate(TagBase):
     pass
 
 class TagOut(TagBase):
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ArticleBase(BaseModel):
@@ -96,10 +97,9 @@ class ArticleOut(ArticleBase):
     id: str
     author: Optional[UserOut]
     filename: str
+    updatedAt: Optional[datetime] = None
 
-    
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ArticleOutEnhanced(ArticleBase):
@@ -107,6 +107,37 @@ class ArticleOutEnhanced(ArticleBase):
     enhanced_content: object
     filename: str
 
+class ArticleImport(BaseModel):
+    """Riga dell'import NDJSON: i campi mancanti sono derivati dal contenuto."""
+    title: str
+    content: str
+    authorId: str
+    excerpt: Optional[str] = None  # default: primi 100 caratteri del contenuto
+    status: str = "draft"
+    publishDate: Optional[date] = None  # default: oggi
+    readTime: Optional[int] = None  # default: stimato dalla lunghezza del contenuto
+    thumbnail: Optional[str] = None
+    tags: Optional[str] = None  # se assente i tag vengono estratti in background
+
+class ArticleSearchResult(BaseModel):
+    id: str
+    title: str
+    excerpt: str
+    authorId: Optional[str]
+    status: str
+    publishDate: date
+    thumbnail: Optional[str]
+    tags: Optional[str]
+    snippet: str  # estratto con i termini trovati racchiusi in <mark>
+    score: float  # bm25, più alto = più rilevante
+
+class UserEventCreate(BaseModel):
+    eventId: Optional[str] = None  # se assente viene derivato da tipo, utente e articolo; obbligatorio senza articolo
+    userId: str  # deve coincidere con l'utente del token
+    type: Literal["article_read", "quiz_completed", "article_published"]
+    articleId: Optional[str] = None
+    occurredAt: Optional[datetime] = None
+
 class LeaderboardBase(BaseModel):
     id: str
     name: str
@@ -120,8 +151,15 @@ class LeaderboardCreate(LeaderboardBase):
     pass
 
 class LeaderboardOut(LeaderboardBase):
-    class Config:
-        orm_mode = True
+    userId: Optional[str] = None
+    rank: Optional[int] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class LeaderboardPosition(BaseModel):
+    rank: int
+    entry: LeaderboardOut
+    around: List[LeaderboardOut]
 
 
 # Pydantic schemas for Configuration
@@ -138,6 +176,6 @@ class ConfigurationCreate(ConfigurationBase):
 class ConfigurationOut(ConfigurationBase):
     id: str
     user_id: str
+    updatedAt: Optional[datetime] = None
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Ricerca full-text sugli articoli con SQLite FTS5.
+
+L'indice ArticleSearch contiene titolo, excerpt, contenuto e tag ed è aggiornato
+da trigger su Articles, quindi resta allineato a ogni INSERT/UPDATE/DELETE
+(da qualsiasi sessione, sincrona o asincrona). Gli articoli hanno id stringa e il
+rowid implicito di Articles può cambiare con VACUUM: ArticleSearchIds assegna a
+ogni articolo un rowid INTEGER PRIMARY KEY stabile usato dall'indice.
+
+Ricostruzione completa (dalla cartella backend):
+    python -m db.search rebuild
+"""
+import re
+import sys
+from typing import List, Optional
+
+from sqlalchemy import Float, Integer, column, text
+from sqlalchemy.orm import Session
+
+from db.pagination import decode_cursor, encode_cursor
+
+SEARCH_TABLE = "ArticleSearch"
+SEARCH_IDS_TABLE = "ArticleSearchIds"
+
+_SEARCH_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_IDS_TABLE} (
+        rowid INTEGER PRIMARY KEY,
+        articleId VARCHAR NOT NULL UNIQUE
+    )""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        title, excerpt, content, tags,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS articles_search_ai AFTER INSERT ON Articles BEGIN
+        INSERT INTO {SEARCH_IDS_TABLE} (articleId) VALUES (new.id);
+        INSERT INTO {SEARCH_TABLE} (rowid, title, excerpt, content, tags)
+            SELECT rowid, new.title, new.excerpt, new.content, coalesce(new.tags, '')
+            FROM {SEARCH_IDS_TABLE} WHERE articleId = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS articles_search_au
+        AFTER UPDATE OF id, title, excerpt, content, tags ON Articles BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = (SELECT rowid FROM {SEARCH_IDS_TABLE} WHERE articleId = old.id);
+        UPDATE {SEARCH_IDS_TABLE} SET articleId = new.id WHERE articleId = old.id;
+        INSERT INTO {SEARCH_TABLE} (rowid, title, excerpt, content, tags)
+            SELECT rowid, new.title, new.excerpt, new.content, coalesce(new.tags, '')
+            FROM {SEARCH_IDS_TABLE} WHERE articleId = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS articles_search_ad AFTER DELETE ON Articles BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = (SELECT rowid FROM {SEARCH_IDS_TABLE} WHERE articleId = old.id);
+        DELETE FROM {SEARCH_IDS_TABLE} WHERE articleId = old.id;
+    END""",
+]
+
+# Chiavi del cursore: (punteggio bm25, rowid), in ordine crescente (bm25 più basso = più rilevante)
+_CURSOR_KEYS = [column("rank", Float), column("rowid", Integer)]
+
+
+def is_search_supported(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def ensure_search_index(bind) -> bool:
+    """Crea indice e trigger se mancano; al primo avvio indicizza gli articoli esistenti."""
+    if not is_search_supported(bind):
+        return False
+    with bind.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SEARCH_TABLE}
+        ).first()
+        for statement in _SEARCH_DDL:
+            conn.execute(text(statement))
+        if not exists:
+            _rebuild(conn)
+    return True
+
+
+def rebuild_search_index(bind) -> int:
+    """Ricostruisce da zero l'indice a partire da Articles. Restituisce gli articoli indicizzati."""
+    with bind.begin() as conn:
+        for statement in _SEARCH_DDL:
+            conn.execute(text(statement))
+        return _rebuild(conn)
+
+
+def _rebuild(conn) -> int:
+    conn.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    conn.execute(text(f"DELETE FROM {SEARCH_IDS_TABLE}"))
+    conn.execute(text(f"INSERT INTO {SEARCH_IDS_TABLE} (articleId) SELECT id FROM Articles"))
+    conn.execute(text(f"""
+        INSERT INTO {SEARCH_TABLE} (rowid, title, excerpt, content, tags)
+        SELECT s.rowid, a.title, a.excerpt, a.content, coalesce(a.tags, '')
+        FROM {SEARCH_IDS_TABLE} s JOIN Articles a ON a.id = s.articleId
+    """))
+    conn.execute(text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')"))
+    return conn.execute(text(f"SELECT count(*) FROM {SEARCH_IDS_TABLE}")).scalar()
+
+
+def to_match_expression(query: str) -> Optional[str]:
+    """
+    Converte il testo dell'utente in un'espressione FTS5 sicura: ogni parola è
+    quotata (niente errori di sintassi su apici o operatori) e l'ultima è un
+    prefisso, per la ricerca durante la digitazione.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_articles(db: Session, query: str, limit: int, cursor: Optional[str] = None):
+    """
+    Restituisce (risultati, next_cursor) ordinati per rilevanza, con snippet evidenziato.
+    """
+    match = to_match_expression(query)
+    if match is None:
+        return [], None
+
+    params = {"match": match, "limit": limit + 1}
+    after = ""
+    if cursor:
+        params["rank"], params["rowid"] = decode_cursor(cursor, _CURSOR_KEYS)
+        after = f"AND ({SEARCH_TABLE}.rank, {SEARCH_TABLE}.rowid) > (:rank, :rowid)"
+
+    rows = db.execute(text(f"""
+        SELECT a.id, a.title, a.excerpt, a.authorId, a.status, a.publishDate, a.thumbnail, a.tags,
+               snippet({SEARCH_TABLE}, -1, '<mark>', '</mark>', '…', 24) AS snippet,
+               {SEARCH_TABLE}.rank AS rank, {SEARCH_TABLE}.rowid AS rowid
+        FROM {SEARCH_TABLE}
+        JOIN {SEARCH_IDS_TABLE} s ON s.rowid = {SEARCH_TABLE}.rowid
+        JOIN Articles a ON a.id = s.articleId
+        WHERE {SEARCH_TABLE} MATCH :match {after}
+        ORDER BY {SEARCH_TABLE}.rank, {SEARCH_TABLE}.rowid
+        LIMIT :limit
+    """), params).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]["rank"], rows[-1]["rowid"]])
+    results: List[dict] = [
+        {**{k: v for k, v in row.items() if k not in ("rank", "rowid")}, "score": -row["rank"]}
+        for row in rows
+    ]
+    return results, next_cursor
+
+
+if __name__ == "__main__":
+    from db.database import engine
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("Uso: python -m db.search rebuild")
+        sys.exit(1)
+    if not is_search_supported(engine):
+        print("La ricerca full-text richiede SQLite (FTS5).")
+        sys.exit(1)
+    print(f"Articoli indicizzati: {rebuild_search_index(engine)}")
@@ -106,8 +106,10 @@ def seed():
 
     # Achievements
     achievements = [
-        Achievement(id='1', name='First Steps', description='Read your first article', icon='📖', xpReward=50),
-        Achievement(id='2', name='Speed Reader', description='Read 10 articles in one day', icon='⚡', xpReward=200)
+        Achievement(id='1', name='First Steps', description='Read your first article', icon='📖', xpReward=50,
+                    metric='article_read', threshold=1, period='total'),
+        Achievement(id='2', name='Speed Reader', description='Read 10 articles in one day', icon='⚡', xpReward=200,
+                    metric='article_read', threshold=10, period='day')
     ]
     db.add_all(achievements)
 
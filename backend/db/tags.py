@@ -0,0 +1,140 @@
+import uuid
+from typing import Iterable, List, Optional
+
+from sqlalchemy import exists, select, tuple_, union, update
+from sqlalchemy.orm import Session, aliased
+
+from db.model import Article, ArticleTag, Tag
+from db.pagination import decode_cursor, encode_cursor
+
+
+def normalize_tag(name: str) -> str:
+    return " ".join(name.strip().lower().split())
+
+
+def parse_tags(values: Optional[Iterable[str]]) -> List[str]:
+    """
+    Normalizza una lista di tag (o di stringhe separate da virgole),
+    rimuovendo vuoti e duplicati e mantenendo l'ordine.
+    """
+    names = []
+    for value in values or []:
+        for part in value.split(","):
+            name = normalize_tag(part)
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def _insert_tags_ignore(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(Tag).on_conflict_do_nothing(index_elements=["name"])
+
+
+def get_or_create_tags(db: Session, names: List[str]) -> List[Tag]:
+    """
+    Tag con i nomi indicati, creando quelli mancanti. INSERT ... ON CONFLICT DO
+    NOTHING e poi rilettura: due richieste concorrenti con lo stesso tag nuovo non
+    violano il vincolo unico su Tag.name. Non fa commit.
+    """
+    if not names:
+        return []
+    existing = {tag.name: tag for tag in db.query(Tag).filter(Tag.name.in_(names))}
+    missing = [name for name in names if name not in existing]
+    if missing:
+        db.execute(_insert_tags_ignore(db), [{"id": str(uuid.uuid4()), "name": name} for name in missing])
+        existing.update((tag.name, tag) for tag in db.query(Tag).filter(Tag.name.in_(missing)))
+    return [existing[name] for name in names]
+
+
+def sync_article_tags(db: Session, article: Article):
+    """
+    Allinea le righe di ArticleTags alla stringa `article.tags`, che resta
+    la forma esposta nelle risposte. Non fa commit.
+    """
+    sync_articles_tags(db, [article])
+
+
+def sync_articles_tags(db: Session, articles: List[Article]):
+    """Come sync_article_tags per più articoli, con un'unica query sui tag."""
+    names_by_article = [(article, parse_tags([article.tags] if article.tags else [])) for article in articles]
+    all_names = list(dict.fromkeys(name for _, names in names_by_article for name in names))
+    tags = {tag.name: tag for tag in get_or_create_tags(db, all_names)}
+    for article, names in names_by_article:
+        article.tags = ",".join(names)
+        article.tag_links = [ArticleTag(tag=tags[name], publishDate=article.publishDate) for name in names]
+
+
+def tagged_article_page(db: Session, names: List[str], match_all: bool, limit: int, cursor: Optional[str] = None):
+    """
+    Restituisce (id, next_cursor): una pagina degli articoli con almeno uno
+    (match_all=False) o tutti (match_all=True) i tag indicati, dal più recente,
+    con lo stesso cursore (publishDate, id) del feed.
+
+    Ogni tag è un intervallo dell'indice (tagId, publishDate, articleId) già
+    ordinato: con più tag gli intervalli vengono fusi (UNION), con match_all si
+    percorre il primo e si verificano gli altri sulla chiave primaria. In nessun
+    caso serve ordinare tutti gli articoli del tag per restituirne `limit`.
+    """
+    tag_ids = [tag_id for (tag_id,) in db.query(Tag.id).filter(Tag.name.in_(names))]
+    if not tag_ids or (match_all and len(tag_ids) < len(names)):
+        return [], None  # nessun tag esistente, o almeno un tag mancante con match_all
+
+    keys = [ArticleTag.publishDate, ArticleTag.articleId]
+    after = decode_cursor(cursor, keys) if cursor else None
+
+    def tag_range(tag_id: str, also: List[str] = ()):
+        query = select(*keys).where(ArticleTag.tagId == tag_id)
+        if after is not None:
+            query = query.where(tuple_(*keys) < tuple_(*after))
+        for other_id in also:
+            other = aliased(ArticleTag)
+            query = query.where(exists().where(other.articleId == ArticleTag.articleId, other.tagId == other_id))
+        return query
+
+    if match_all or len(tag_ids) == 1:
+        query = tag_range(tag_ids[0], tag_ids[1:]).order_by(*[key.desc() for key in keys])
+    else:
+        merged = union(*[tag_range(tag_id) for tag_id in tag_ids])
+        query = merged.order_by(*[merged.selected_columns[key.key].desc() for key in keys])
+    # Una riga in più per sapere se esiste una pagina successiva
+    rows = db.execute(query.limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(list(rows[-1]))
+    return [article_id for _, article_id in rows], next_cursor
+
+
+def migrate_article_tags(db: Session) -> int:
+    """
+    Migrazione dei tag salvati come stringa: crea le righe di Tags/ArticleTags
+    per gli articoli che non le hanno ancora e copia publishDate nelle righe
+    create prima che la colonna esistesse. Idempotente.
+    """
+    db.execute(
+        update(ArticleTag)
+        .where(ArticleTag.publishDate.is_(None))
+        .values(publishDate=select(Article.publishDate).where(Article.id == ArticleTag.articleId).scalar_subquery())
+    )
+    pending = (
+        db.query(Article)
+        .outerjoin(ArticleTag, ArticleTag.articleId == Article.id)
+        .filter(Article.tags.isnot(None), Article.tags != "", ArticleTag.articleId.is_(None))
+        .all()
+    )
+    for article in pending:
+        sync_article_tags(db, article)
+    db.commit()
+    return len(pending)
+
+
+if __name__ == "__main__":
+    from db.database import SessionLocal
+
+    with SessionLocal() as session:
+        print(f"Articoli migrati: {migrate_article_tags(session)}")
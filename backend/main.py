@@ -2,10 +2,12 @@ import json
 import os
 import uvicorn
 import pathlib
-from fastapi import FastAPI, HTTPException, Body, Depends, UploadFile, File, Form, status, BackgroundTasks
-from typing import List
+from fastapi import FastAPI, HTTPException, Body, Depends, UploadFile, File, Form, status, BackgroundTasks, Query, Response, Request
+from typing import List, Optional, Literal
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload, joinedload, noload
+from sqlalchemy.ext.asyncio import AsyncSession
 from db.model import *
 from db.schemas import (
     UserCreate, UserUpdate, UserOut, 
@@ -13,31 +15,83 @@ from db.schemas import (
     ConfigurationOut, ConfigurationCreate,
     ConfigurationBase, ArticleOutEnhanced,
     AchievementCreate, ArticleCreate, ArticleOut, 
-    LeaderboardOut, LeaderboardCreate)
-from db.database import get_db, engine, Base
+    LeaderboardOut, LeaderboardCreate, LeaderboardPosition, TagOut, ArticleSearchResult,
+    UserEventCreate)
+from db.database import get_db, get_async_db, engine, async_engine, Base, ensure_columns, ensure_indexes, SessionLocal
+from db.pagination import keyset_paginate, NEXT_CURSOR_HEADER
+from db.search import ensure_search_index, is_search_supported, search_articles
+from db import leaderboard
+from db.counters import article_counters
+from db.awards import awards_worker, record_events
+from db.bulk_import import import_articles
+from db import export as data_export
+from serialization import DefaultResponse, serialize_list, to_jsonable
+from cache import entity_cache, article_key, user_key, configuration_key, achievements_page_key
+from conditional import CACHE_CONTROL, conditional_response, last_modified, make_etag
+from auth import get_current_user_id, issue_token, password_verifier, require_admin
+from uploads import (
+    UPLOAD_SECURITY_HEADERS, UploadSizeLimitMiddleware, is_content_addressed, raster_media_type, resolve_upload,
+    store_upload
+)
+from thumbnails import find_derivative, image_pipeline
+from admission import AdmissionSlot, AdmittedStreamingResponse, admission, admission_slot, admission_stats
+from background import background_jobs
+import profiler
+import memory
+from memory import memory_sampler
+from tracing import TracingMiddleware, exporter as span_exporter, instrument_engine, span
 from db.seed import seed
+from db.tags import sync_article_tags, migrate_article_tags, tagged_article_page, parse_tags
 from models import (
     ProcessRequest, UserProfile, ContentInput, ErrorResponse,
     SignupRequest, LoginRequest
 )
 from ai_core import process_request, extract_tags, ArticleInput, HTMLOutput, generate_html_content
-from datetime import date
+from datetime import date, datetime
 import aiofiles
 import logging
 import asyncio
 from text_to_speech import generate_audio_for_user
-from fastapi.responses import StreamingResponse, FileResponse
-from concurrent.futures import ThreadPoolExecutor
+from fastapi.responses import StreamingResponse, FileResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    span_exporter.start()
+    background_jobs.resume()  # lavori lasciati a metà dallo spegnimento precedente
+    article_counters.start()
+    awards_worker.start()
+    password_verifier.start()
+    image_pipeline.start()
+    memory_sampler.start()
+    yield
+    # Shutdown: prima i lavori di generazione (entro BACKGROUND_DRAIN_TIMEOUT), poi i contatori ancora in memoria
+    await asyncio.to_thread(background_jobs.drain)
+    article_counters.stop()
+    awards_worker.stop()
+    password_verifier.stop()
+    image_pipeline.stop()
+    memory_sampler.stop()
+    span_exporter.stop()
 
 # --- Inizializzazione dell'app FastAPI ---
 app = FastAPI(
     title="FluidContent AI Backend",
     description="API per elaborare e adattare contenuti usando Gemini AI.",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=DefaultResponse,
+    lifespan=lifespan
 )
 
 Base.metadata.create_all(bind=engine)
+ensure_columns()
+ensure_indexes()
 seed()
+with SessionLocal() as _db:
+    migrate_article_tags(_db)
+    leaderboard.rebuild_leaderboard(_db)
+ensure_search_index(engine)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -45,15 +99,56 @@ logger = logging.getLogger(__name__)
 logger.info(f"Tabelle create: {list(Base.metadata.tables.keys())}")
 
 OUTPUT_HTML_DIR = "generated_html_files" # Relativo alla directory
-FILE_DIRECTORY = "uploads"
 
+# Strategie di caricamento delle relazioni serializzate negli schemi di output.
+# Senza di esse ogni livello (autore -> achievements -> achievement) è lazy e
+# una lista di N righe genera N query per livello; con AsyncSession il lazy
+# loading non è proprio disponibile.
+# UserOut.achievements[].achievement: due SELECT ... IN per tutta la pagina
+USER_ACHIEVEMENTS_LOAD = selectinload(User.achievements).selectinload(UserAchievement.achievement)
+# ArticleOut.author: many-to-one in JOIN, poi gli achievement dell'autore in batch
+ARTICLE_AUTHOR_LOAD = joinedload(Article.author).selectinload(User.achievements).selectinload(UserAchievement.achievement)
+
+
+# Letture in cache (cache.py): i valori sono le risposte già serializzate. Un articolo
+# è salvato senza autore e composto con la voce dell'utente, così la modifica di un
+# profilo non richiede di invalidare tutti i suoi articoli.
+def cached_user(db: Session, user_id: str) -> Optional[dict]:
+    def load():
+        user = db.query(User).options(USER_ACHIEVEMENTS_LOAD).filter(User.id == user_id).first()
+        return to_jsonable(UserOut, user) if user else None
+    return entity_cache.get_or_load(user_key(user_id), load)
+
+def cached_article(db: Session, article_id: str) -> Optional[dict]:
+    def load():
+        article = db.query(Article).options(noload(Article.author)).filter(Article.id == article_id).first()
+        return to_jsonable(ArticleOut, article) if article else None
+    article = entity_cache.get_or_load(article_key(article_id), load)
+    if article is None:
+        return None
+    return {**article, "author": cached_user(db, article["authorId"]) if article["authorId"] else None}
+
+def cached_configuration(db: Session, user_id: str) -> Optional[dict]:
+    def load():
+        config = db.query(Configuration).filter(Configuration.user_id == user_id).first()
+        return to_jsonable(ConfigurationOut, config) if config else None
+    return entity_cache.get_or_load(configuration_key(user_id), load)
+
+# Prima di CORS, così anche i 413 portano gli header CORS
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/save_article/"])
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # or use specific origin for security
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Last-Modified", "traceparent"],
 )
+app.add_middleware(profiler.ProfileRequestMiddleware)
+# Ultimo aggiunto, quindi il più esterno: lo span radice copre anche CORS e i limiti di upload
+app.add_middleware(TracingMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 
 # Auth
 @app.post("/api/signup")
@@ -81,18 +176,23 @@ def signup(data: SignupRequest, db: Session = Depends(get_db)):
     )
     conf_id = create_configuration(configuration, db).id
 
-    return {"user": {"id": getUser.id, "email": data.email, "name": data.name}, "configuration": {"id": conf_id}}
+    return {
+        "user": {"id": getUser.id, "email": data.email, "name": data.name},
+        "configuration": {"id": conf_id},
+        **issue_token(getUser.id)
+    }
 
 @app.post("/api/login")
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter_by(email=data.email).first()
+async def login(data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).where(User.email == data.email))).scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
     
-    if not user.check_password(data.password):
+    # bcrypt nel pool di processi dedicato: non blocca l'event loop né gli altri worker
+    if not await password_verifier.verify(data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
@@ -109,28 +209,45 @@ def login(data: LoginRequest, db: Session = Depends(get_db)):
             "xpToNext": user.xpToNext,
             "totalXp": user.totalXp,
             "joinDate": user.joinDate.isoformat()
-        }
+        },
+        **issue_token(user.id)
     }
 
+# Sessione: il token di /api/login sostituisce un nuovo login (verifica HMAC, niente bcrypt)
+@app.get("/api/session", response_model=UserOut)
+def read_session(user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    user = cached_user(db, user_id)
+    if not user:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "User not found")
+    return DefaultResponse(user)
+
+@app.post("/api/session/refresh")
+def refresh_session(user_id: str = Depends(get_current_user_id)):
+    return issue_token(user_id)
+
+@app.get("/auth/stats", dependencies=[Depends(require_admin)])
+def auth_stats():
+    return password_verifier.stats()
+
 # Others
-@app.post("/save_article/", status_code=status.HTTP_201_CREATED)
+@app.post("/save_article/", status_code=status.HTTP_201_CREATED, dependencies=[Depends(admission("llm"))])
 async def save_article(
     title: str = Form(...),
     content: str = Form(...),
     status: str = Form(...),  # e.g., 'draft', 'published'
     user_id: str = Form(...),
     images: List[UploadFile] = File(default=[]),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
 
-    # TODO - save in DB
-    os.makedirs(FILE_DIRECTORY, exist_ok=True)
+    # Copia a blocchi con hash: il nome su disco è il contenuto, non il nome del client
     image_to_save = ""
     for image in images:
-        contents = await image.read()
-        with open(f"{FILE_DIRECTORY}/{image.filename}", "wb") as f:
-            f.write(contents)
-            image_to_save = image.filename
+        stored = await store_upload(image)
+        logger.info(f"Immagine {image.filename!r} salvata come {stored.filename} ({stored.size} byte, nuova: {stored.created})")
+        image_to_save = stored.filename
+        if stored.created:
+            image_pipeline.submit(stored.filename)  # derivati WebP nel pool di processi
 
     logger.info(f"status: {status}")
     await create_article(ArticleCreate(
@@ -159,12 +276,14 @@ async def read_root():
 @app.post(
     "/process-content/",
     # response_model=ProcessedContent,
-    responses={500: {"model": ErrorResponse}, 400: {"model": ErrorResponse}}
+    responses={500: {"model": ErrorResponse}, 400: {"model": ErrorResponse}, 429: {"model": ErrorResponse}},
+    dependencies=[Depends(admission("llm"))]
 )
 async def process_content_endpoint(request_data: ProcessRequest = Body(...)):
     if not request_data:
         raise HTTPException(status_code=400, detail="Request data not provided.")
-    response = process_request(request_data)
+    # Chiamata sincrona a Gemini: in un thread, per non fermare l'event loop
+    response = await run_in_threadpool(process_request, request_data)
     # Deserializza la stringa JSON in un dizionario Python
     try:
         response_data_dict = json.loads(response.text)
@@ -182,21 +301,27 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     new_user = User(**user.dict())
     new_user.set_password(user.password)  # Hash the password
     db.add(new_user)
+    leaderboard.sync_user(db, new_user)
     db.commit()
     db.refresh(new_user)
     return new_user
 
 @app.get("/users/", response_model=List[UserOut])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+def read_users(response: Response, cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000), skip: int = Query(0, ge=0, deprecated=True), db: Session = Depends(get_db)):
+    users = keyset_paginate(
+        db.query(User).options(USER_ACHIEVEMENTS_LOAD), [User.joinDate, User.id], cursor, limit, response, skip=skip
+    )
+    return serialize_list(UserOut, users, response.headers)
 
 @app.get("/users/{user_id}", response_model=UserOut)
-def read_user(user_id: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+def read_user(user_id: str, request: Request, db: Session = Depends(get_db)):
+    user = cached_user(db, user_id)
     if not user:
         raise HTTPException(404, "User not found")
-    return user
+    return conditional_response(
+        request, make_etag(user_id, user["updatedAt"]), last_modified([user["updatedAt"]]),
+        CACHE_CONTROL["user"], lambda: DefaultResponse(user)
+    )
 
 @app.put("/users/{user_id}", response_model=UserOut)
 def update_user(user_id: str, user: UserUpdate, db: Session = Depends(get_db)):
@@ -208,7 +333,9 @@ def update_user(user_id: str, user: UserUpdate, db: Session = Depends(get_db)):
 
     for key, value in user_data.items():
         setattr(db_user, key, value)
+    leaderboard.sync_user(db, db_user)
     db.commit()
+    entity_cache.invalidate(user_key(user_id))
     db.refresh(db_user)
     return db_user
 
@@ -217,10 +344,20 @@ def delete_user(user_id: str, db: Session = Depends(get_db)):
     db_user = db.query(User).filter(User.id == user_id).first()
     if not db_user:
         raise HTTPException(404, "User not found")
+    leaderboard.remove_user(db, user_id)
     db.delete(db_user)
     db.commit()
+    entity_cache.invalidate(user_key(user_id))
     return {"detail": "User deleted"}
 
+# I profili utente includono gli achievement: le loro modifiche aggiornano la versione
+# (updatedAt) degli utenti coinvolti, che fa da validatore HTTP
+def achievement_holders(db: Session, achievement_id: str):
+    return select(UserAchievement.userId).where(UserAchievement.achievementId == achievement_id)
+
+def touch_users(db: Session, user_ids):
+    db.query(User).filter(User.id.in_(user_ids)).update({User.updatedAt: datetime.utcnow()}, synchronize_session=False)
+
 # CRUD Achievements
 @app.post("/achievements/", response_model=AchievementOut)
 def create_achievement(achievement: AchievementCreate, db: Session = Depends(get_db)):
@@ -230,12 +367,22 @@ def create_achievement(achievement: AchievementCreate, db: Session = Depends(get
     new_ach = Achievement(**achievement.dict())
     db.add(new_ach)
     db.commit()
+    entity_cache.invalidate_namespace("achievements")
     db.refresh(new_ach)
     return new_ach
 
 @app.get("/achievements/", response_model=List[AchievementOut])
-def read_achievements(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(Achievement).offset(skip).limit(limit).all()
+def read_achievements(response: Response, cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000), skip: int = Query(0, ge=0, deprecated=True), db: Session = Depends(get_db)):
+    def load():
+        page = Response()
+        achievements = keyset_paginate(db.query(Achievement), [Achievement.id], cursor, limit, page, skip=skip)
+        return {"items": to_jsonable(List[AchievementOut], achievements), "next": page.headers.get(NEXT_CURSOR_HEADER)}
+
+    page = entity_cache.get_or_load(achievements_page_key(cursor, limit, skip), load)
+    headers = {"Cache-Control": CACHE_CONTROL["achievements"]}
+    if page["next"]:
+        headers[NEXT_CURSOR_HEADER] = page["next"]
+    return DefaultResponse(page["items"], headers=headers)
 
 @app.get("/achievements/{achievement_id}", response_model=AchievementOut)
 def read_achievement(achievement_id: str, db: Session = Depends(get_db)):
@@ -251,7 +398,11 @@ def update_achievement(achievement_id: str, achievement: AchievementCreate, db:
         raise HTTPException(404, "Achievement not found")
     for key, value in achievement.dict().items():
         setattr(db_ach, key, value)
+    touch_users(db, achievement_holders(db, achievement_id))
     db.commit()
+    # Gli achievement sono inclusi nei profili utente
+    entity_cache.invalidate_namespace("achievements")
+    entity_cache.invalidate_namespace("user")
     db.refresh(db_ach)
     return db_ach
 
@@ -260,8 +411,11 @@ def delete_achievement(achievement_id: str, db: Session = Depends(get_db)):
     db_ach = db.query(Achievement).filter(Achievement.id == achievement_id).first()
     if not db_ach:
         raise HTTPException(404, "Achievement not found")
+    touch_users(db, achievement_holders(db, achievement_id))
     db.delete(db_ach)
     db.commit()
+    entity_cache.invalidate_namespace("achievements")
+    entity_cache.invalidate_namespace("user")
     return {"detail": "Achievement deleted"}
 
 # CRUD UserAchievements
@@ -275,13 +429,19 @@ def create_userachievement(ua: UserAchievementCreate, db: Session = Depends(get_
         raise HTTPException(400, "UserAchievement already exists")
     new_ua = UserAchievement(**ua.dict())
     db.add(new_ua)
+    touch_users(db, [ua.userId])
     db.commit()
+    entity_cache.invalidate(user_key(ua.userId))
     db.refresh(new_ua)
     return new_ua
 
 @app.get("/userachievements/", response_model=List[UserAchievementOut])
-def read_userachievements(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(UserAchievement).offset(skip).limit(limit).all()
+def read_userachievements(response: Response, cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000), skip: int = Query(0, ge=0, deprecated=True), db: Session = Depends(get_db)):
+    user_achievements = keyset_paginate(
+        db.query(UserAchievement).options(joinedload(UserAchievement.achievement)),
+        [UserAchievement.userId, UserAchievement.achievementId], cursor, limit, response, skip=skip
+    )
+    return serialize_list(UserAchievementOut, user_achievements, response.headers)
 
 @app.get("/userachievements/{user_id}/{achievement_id}", response_model=UserAchievementOut)
 def read_userachievement(user_id: str, achievement_id: str, db: Session = Depends(get_db)):
@@ -302,22 +462,40 @@ def delete_userachievement(user_id: str, achievement_id: str, db: Session = Depe
     if not ua:
         raise HTTPException(404, "UserAchievement not found")
     db.delete(ua)
+    touch_users(db, [user_id])
     db.commit()
+    entity_cache.invalidate(user_key(user_id))
     return {"detail": "UserAchievement deleted"}
 
 # CRUD Articles
-# Crea un ThreadPoolExecutor globale
-executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="html_processor")
+# Lavori in background (background.py): argomenti JSON, così possono essere salvati allo spegnimento
+def article_html_job(request: dict, filename: str):
+    run_safe_process_content_to_html(ProcessRequest.model_validate(request), filename)
+
+def article_html_exists(request: dict, filename: str) -> bool:
+    return os.path.exists(os.path.join(OUTPUT_HTML_DIR, filename))
+
+def article_tags_job(article_id: str, title: str, content: str):
+    run_safe_tag_article(article_id, title, content)
+
+def article_tags_exist(article_id: str, title: str, content: str) -> bool:
+    # Tag già salvati, o articolo eliminato nel frattempo: non c'è niente da estrarre
+    with SessionLocal() as session:
+        article = session.get(Article, article_id)
+        return article is None or bool(article.tags)
 
-@app.post("/articles/", response_model=ArticleOut)
-async def create_article(article: ArticleCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+background_jobs.register("article_html", article_html_job, done=article_html_exists)
+background_jobs.register("article_tags", article_tags_job, done=article_tags_exist)
+
+@app.post("/articles/", response_model=ArticleOut, dependencies=[Depends(admission("llm"))])
+async def create_article(article: ArticleCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
 
     article_input= ArticleInput(
         article_text=article.content,
         article_title=article.title
     )
 
-    article_tags = extract_tags(article_input)
+    article_tags = await run_in_threadpool(extract_tags, article_input)
 
     generated_filename = f"{uuid.uuid4()}.html"
     logger.info(f"Filename generato: {generated_filename}")
@@ -337,8 +515,16 @@ async def create_article(article: ArticleCreate, background_tasks: BackgroundTas
     )
 
     db.add(new_article)
-    db.commit()
-    db.refresh(new_article)
+    await db.run_sync(lambda session: sync_article_tags(session, new_article))
+    if article.status == "published" and article.authorId:
+        await db.flush()  # assegna l'id all'articolo
+        await db.run_sync(lambda session: record_events(session, [
+            {"type": "article_published", "userId": article.authorId, "articleId": new_article.id}
+        ]))
+    await db.commit()
+    new_article = (await db.execute(
+        select(Article).options(ARTICLE_AUTHOR_LOAD).where(Article.id == new_article.id)
+    )).scalar_one()
 
     process_content_to_html_request = ProcessRequest(
         profile=UserProfile(
@@ -355,47 +541,71 @@ async def create_article(article: ArticleCreate, background_tasks: BackgroundTas
         )
     )
     
-    # Fire-and-forget con gestione errori - usando ThreadPoolExecutor
-    executor.submit(
-        run_safe_process_content_to_html,
-        process_content_to_html_request,
-        generated_filename
+    # Fire-and-forget con gestione errori, nei lavori in background
+    background_jobs.submit(
+        "article_html",
+        request=process_content_to_html_request.model_dump(mode="json"),
+        filename=generated_filename
     )
     return new_article
 
 
+@app.post("/articles/import/", dependencies=[Depends(require_admin)])
+async def import_articles_ndjson(request: Request, generate_html: bool = True, db: AsyncSession = Depends(get_async_db)):
+    """
+    Import massivo da NDJSON (application/x-ndjson), un articolo per riga.
+    Gli articoli sono salvati a batch; tag mancanti e HTML vengono generati in background.
+    """
+    def schedule_background_work(created):
+        for new_article, record in created:
+            if not record.tags:
+                background_jobs.submit(
+                    "article_tags", article_id=new_article.id, title=new_article.title, content=new_article.content
+                )
+            if generate_html:
+                background_jobs.submit(
+                    "article_html",
+                    request=ProcessRequest(
+                        profile=UserProfile(user_id=new_article.authorId, name="", age=0, interests=[], preferences={}),
+                        content=ContentInput(
+                            title=new_article.title,
+                            description=new_article.excerpt,
+                            original_text=new_article.content
+                        )
+                    ).model_dump(mode="json"),
+                    filename=new_article.filename
+                )
+
+    summary = await import_articles(db, request.stream(), on_created=schedule_background_work)
+    logger.info(f"Import NDJSON: {summary['created']} articoli creati, {summary['failed']} errori")
+    return summary
+
+
+def run_safe_tag_article(article_id: str, title: str, content: str):
+    """Estrae i tag di un articolo importato senza tag e li salva."""
+    try:
+        article_tags = extract_tags(ArticleInput(article_text=content, article_title=title))
+        with SessionLocal() as session:
+            db_article = session.get(Article, article_id)
+            if db_article is None:
+                return
+            db_article.tags = ",".join(article_tags.tags)
+            sync_article_tags(session, db_article)
+            session.commit()
+        entity_cache.invalidate(article_key(article_id))
+    except Exception as e:
+        logger.error(f"Errore durante l'estrazione dei tag per l'articolo {article_id}: {str(e)}", exc_info=True)
+
+
 def run_safe_process_content_to_html(request: ProcessRequest, generated_filename: str):
     """Wrapper sincrono che esegue il task asincrono in un thread dedicato"""
     try:
         logger.info(f"Avvio elaborazione HTML in thread separato per file: {generated_filename}")
-        
-        # Crea un nuovo event loop per questo thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # Esegui il task asincrono
-            result = loop.run_until_complete(safe_process_content_to_html(request, generated_filename))
-            logger.info(f"Thread completato con successo per file: {generated_filename}")
-            return result
-        except Exception as e:
-            logger.error(f"Errore durante l'esecuzione asincrona per file {generated_filename}: {str(e)}", exc_info=True)
-            raise
-        finally:
-            # Pulisci il loop
-            try:
-                # Cancella tutti i task pending
-                pending = asyncio.all_tasks(loop)
-                for task in pending:
-                    task.cancel()
-                
-                if pending:
-                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
-            except Exception as cleanup_error:
-                logger.warning(f"Errore durante cleanup del loop: {cleanup_error}")
-            finally:
-                loop.close()
-                
+        # asyncio.run chiude anche generatori asincroni ed executor di default del loop
+        # (usato da aiofiles) e non lascia il loop chiuso associato al thread
+        result = asyncio.run(safe_process_content_to_html(request, generated_filename))
+        logger.info(f"Thread completato con successo per file: {generated_filename}")
+        return result
     except Exception as e:
         logger.error(f"Errore nel wrapper sincrono per file {generated_filename}: {str(e)}", exc_info=True)
 
@@ -434,8 +644,11 @@ async def process_content_to_html(request: ProcessRequest, generated_filename: s
         # Salvataggio file
         file_path = os.path.join(OUTPUT_HTML_DIR, generated_filename)
         try:
-            async with aiofiles.open(file_path, mode="w", encoding="utf-8") as f:
-                await f.write(generated_html_content)
+            with span("file.write", **{"file.path": file_path, "file.bytes": len(generated_html_content)}):
+                # File temporaneo e rename: un file parziale non deve far risultare il lavoro completato
+                async with aiofiles.open(f"{file_path}.part", mode="w", encoding="utf-8") as f:
+                    await f.write(generated_html_content)
+                os.replace(f"{file_path}.part", file_path)
             logger.info(f"File HTML salvato con successo in: {file_path}")
         except Exception as e:
             logger.error(f"Errore durante il salvataggio del file HTML in '{file_path}': {e}")
@@ -453,73 +666,172 @@ async def process_content_to_html(request: ProcessRequest, generated_filename: s
         logger.error(f"Errore in process_content_to_html: {str(e)}")
         raise
 @app.get("/articles/", response_model=List[ArticleOut])
-def read_articles(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(Article).offset(skip).limit(limit).all()
+def read_articles(response: Response, status: Optional[str] = None, cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000), skip: int = Query(0, ge=0, deprecated=True), db: Session = Depends(get_db)):
+    # Feed: dal più recente, (publishDate, id) è stabile anche con nuovi inserimenti
+    query = db.query(Article).options(ARTICLE_AUTHOR_LOAD)
+    if status:
+        query = query.filter(Article.status == status)
+    articles = keyset_paginate(
+        query, [Article.publishDate, Article.id], cursor, limit, response, descending=True, skip=skip
+    )
+    return serialize_list(ArticleOut, articles, response.headers)
 
 
-@app.get("/enhanced-articles/{article_id}/user/{user_id}", response_model=ArticleOutEnhanced)
-async def asyncread_article(article_id: str, user_id: str, db: Session = Depends(get_db)):
-    article = db.query(Article).filter(Article.id == article_id).first()
+@app.get("/articles/tags/", response_model=List[ArticleOut])
+def read_articles_by_tags(
+    response: Response,
+    tags: List[str] = Query(..., description="Tag da cercare, ripetuti o separati da virgole"),
+    match: Literal["any", "all"] = "any",
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    names = parse_tags(tags)
+    if not names:
+        raise HTTPException(status_code=400, detail="No tags provided")
+    article_ids, next_cursor = tagged_article_page(db, names, match == "all", limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    by_id = {article.id: article for article in
+             db.query(Article).options(ARTICLE_AUTHOR_LOAD).filter(Article.id.in_(article_ids))}
+    return serialize_list(ArticleOut, [by_id[id_] for id_ in article_ids if id_ in by_id], response.headers)
+
+@app.get("/articles/search/", response_model=List[ArticleSearchResult])
+def search_articles_endpoint(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    if not is_search_supported(engine):
+        raise HTTPException(status_code=501, detail="Full-text search requires SQLite FTS5")
+    results, next_cursor = search_articles(db, q, limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return results
+
+@app.get("/tags/", response_model=List[TagOut])
+def read_tags(db: Session = Depends(get_db)):
+    response = serialize_list(TagOut, db.query(Tag).order_by(Tag.name).all())
+    response.headers["Cache-Control"] = CACHE_CONTROL["tags"]
+    return response
+
+@app.get("/enhanced-articles/{article_id}/user/{user_id}", response_model=ArticleOutEnhanced, dependencies=[Depends(admission("llm"))])
+async def asyncread_article(article_id: str, user_id: str, db: AsyncSession = Depends(get_async_db)):
+    # Le tre letture passano dalla cache; in caso di miss il loader usa la sessione sincrona
+    article, configuration, user = await db.run_sync(lambda session: (
+        cached_article(session, article_id),
+        cached_configuration(session, user_id),
+        cached_user(session, user_id)
+    ))
     if not article:
         raise HTTPException(404, "Article not found")
-    configuration = db.query(Configuration).filter(Configuration.user_id == user_id).first()
-    user = db.query(User).filter(User.id == user_id).first()
+    if not user or not configuration:
+        raise HTTPException(404, "User configuration not found")
+    # La connessione non serve durante la chiamata a Gemini
+    await db.close()
 
     request_data = ProcessRequest(
         profile=UserProfile(
-            user_id=user.id,
-            name=user.name,
-            age=configuration.age_preference,
-            interests = configuration.interests.split(",") if configuration.interests is not None else [],
+            user_id=user_id,
+            name=user["name"],
+            age=configuration["age_preference"],
+            interests = configuration["interests"].split(",") if configuration["interests"] is not None else [],
             preferences={"lingua": "italiano",
-            "stile": configuration.tone_preference}
+            "stile": configuration["tone_preference"]}
         ),
         content=ContentInput(
-            title=article.title,
-            description=article.excerpt,
-            original_text=article.content
+            title=article["title"],
+            description=article["excerpt"],
+            original_text=article["content"]
         )
     )
     return {
-        "id": article.id,
-        "title": article.title,
-        "excerpt": article.excerpt,
-        "content": article.content,
-        "authorId": article.authorId,
-        "publishDate": article.publishDate,
-        "readTime": article.readTime,
-        "status": article.status,
-        "likes": article.likes,
-        "views": article.views,
-        "isLiked": article.isLiked,
-        "thumbnail": article.thumbnail,
-        "author": article.author,
-        "filename": article.filename,
-        "tags": article.tags,
+        **article,
         "enhanced_content": await process_content_endpoint(request_data)
     }
 
 
 @app.get("/articles/{article_id}", response_model=ArticleOut)
-def read_article(article_id: str, db: Session = Depends(get_db)):
-    article = db.query(Article).filter(Article.id == article_id).first()
+def read_article(article_id: str, request: Request, db: Session = Depends(get_db)):
+    article = cached_article(db, article_id)
     if not article:
         raise HTTPException(404, "Article not found")
-    return article
+    # La risposta include l'autore: cambia anche quando cambia il suo profilo
+    versions = [article["updatedAt"]] + ([article["author"]["updatedAt"]] if article["author"] else [])
+    return conditional_response(
+        request, make_etag(article_id, *versions), last_modified(versions),
+        CACHE_CONTROL["article"], lambda: DefaultResponse(article)
+    )
 
 @app.get("/articles/user/{user_id}", response_model=List[ArticleOut])
-def read_article(user_id: str, db: Session = Depends(get_db)):
-    article = db.query(Article).filter(Article.authorId == user_id).all()
-    if not article:
+def read_article(user_id: str, request: Request, db: Session = Depends(get_db)):
+    # Validatore da un'unica query aggregata: numero di articoli, ultima modifica, profilo dell'autore
+    count, articles_updated, author_updated = db.query(
+        func.count(Article.id),
+        func.max(Article.updatedAt),
+        select(User.updatedAt).where(User.id == user_id).scalar_subquery()
+    ).filter(Article.authorId == user_id).one()
+    if not count:
         raise HTTPException(404, "Article not found")
-    return article
+
+    def build():
+        articles = db.query(Article).options(ARTICLE_AUTHOR_LOAD).filter(Article.authorId == user_id).order_by(
+            Article.publishDate.desc(), Article.id.desc()
+        ).all()
+        return serialize_list(ArticleOut, articles)
+
+    return conditional_response(
+        request, make_etag(user_id, count, articles_updated, author_updated),
+        last_modified([articles_updated, author_updated]), CACHE_CONTROL["articles_by_user"], build
+    )
+
+# Contatori: bufferizzati in memoria e scritti in batch da db/counters.py
+@app.post("/articles/{article_id}/view", status_code=status.HTTP_202_ACCEPTED)
+def view_article(article_id: str):
+    article_counters.increment(article_id, views=1)
+    return {"status": "queued"}
+
+@app.post("/articles/{article_id}/like", status_code=status.HTTP_202_ACCEPTED)
+def like_article(article_id: str):
+    article_counters.increment(article_id, likes=1)
+    return {"status": "queued"}
+
+@app.delete("/articles/{article_id}/like", status_code=status.HTTP_202_ACCEPTED)
+def unlike_article(article_id: str):
+    article_counters.increment(article_id, likes=-1)
+    return {"status": "queued"}
+
+# Eventi di attività: XP e achievement sono assegnati in batch da db/awards.py
+@app.post("/events/", status_code=status.HTTP_202_ACCEPTED)
+def create_events(events: List[UserEventCreate], user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    if any(event.userId != user_id for event in events):
+        raise HTTPException(status_code=403, detail="Events can only be recorded for the authenticated user")
+    if any(not event.eventId and not event.articleId for event in events):
+        # Senza articolo l'id non è derivabile: un reinvio del batch assegnerebbe di nuovo gli XP
+        raise HTTPException(status_code=422, detail="eventId is required for events without articleId")
+    accepted = record_events(db, [event.dict() for event in events])
+    db.commit()
+    return {"accepted": accepted, "duplicates": len(events) - accepted}
 
 @app.put("/articles/{article_id}", response_model=ArticleOut)
 def update_article(article_id: str, article: ArticleCreate, db: Session = Depends(get_db)):
     db_article = db.query(Article).filter(Article.id == article_id).first()
     if not db_article:
         raise HTTPException(404, "Article not found")
+    was_published = db_article.status == "published"
+    old_tags, old_publish_date = db_article.tags, db_article.publishDate
+    # views e likes restano ai contatori write-behind (db/counters.py): un valore assoluto cancellerebbe i delta
+    for key, value in article.dict(exclude={"views", "likes"}).items():
+        setattr(db_article, key, value)
+    # ArticleTags tiene una copia di publishDate: va riallineata anche quando cambia solo la data
+    if db_article.tags != old_tags or db_article.publishDate != old_publish_date:
+        sync_article_tags(db, db_article)
+    if db_article.status == "published" and not was_published and db_article.authorId:
+        record_events(db, [{"type": "article_published", "userId": db_article.authorId, "articleId": article_id}])
     db.commit()
+    entity_cache.invalidate(article_key(article_id))
     db.refresh(db_article)
     return db_article
 
@@ -530,6 +842,7 @@ def delete_article(article_id: str, db: Session = Depends(get_db)):
         raise HTTPException(404, "Article not found")
     db.delete(db_article)
     db.commit()
+    entity_cache.invalidate(article_key(article_id))
     return {"detail": "Article deleted"}
 
 # CRUD Leaderboard
@@ -539,14 +852,23 @@ def create_leaderboard(lb: LeaderboardCreate, db: Session = Depends(get_db)):
     if db_lb:
         raise HTTPException(400, "Leaderboard entry already exists")
     new_lb = Leaderboard(**lb.dict())
-    db.add(new_lb)
+    leaderboard.add_entry(db, new_lb)
     db.commit()
     db.refresh(new_lb)
     return new_lb
 
 @app.get("/leaderboard/", response_model=List[LeaderboardOut])
-def read_leaderboard(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(Leaderboard).offset(skip).limit(limit).all()
+def read_leaderboard(response: Response, cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000), skip: int = Query(0, ge=0, deprecated=True), db: Session = Depends(get_db)):
+    # Top-K: intervallo iniziale dell'indice su rank, nessun ordinamento a runtime
+    entries = keyset_paginate(db.query(Leaderboard), [Leaderboard.rank, Leaderboard.id], cursor, limit, response, skip=skip)
+    return serialize_list(LeaderboardOut, entries, response.headers)
+
+@app.get("/leaderboard/user/{user_id}", response_model=LeaderboardPosition)
+def read_leaderboard_position(user_id: str, radius: int = Query(5, ge=0, le=50), db: Session = Depends(get_db)):
+    entry = db.query(Leaderboard).filter(Leaderboard.userId == user_id).first()
+    if not entry:
+        raise HTTPException(404, "Leaderboard entry not found")
+    return {"rank": entry.rank, "entry": entry, "around": leaderboard.around(db, entry.rank, radius)}
 
 @app.get("/leaderboard/{lb_id}", response_model=LeaderboardOut)
 def read_leaderboard_entry(lb_id: str, db: Session = Depends(get_db)):
@@ -562,6 +884,7 @@ def update_leaderboard(lb_id: str, lb: LeaderboardCreate, db: Session = Depends(
         raise HTTPException(404, "Leaderboard entry not found")
     for key, value in lb.dict().items():
         setattr(db_lb, key, value)
+    leaderboard.update_entry(db, db_lb)
     db.commit()
     db.refresh(db_lb)
     return db_lb
@@ -571,7 +894,7 @@ def delete_leaderboard(lb_id: str, db: Session = Depends(get_db)):
     db_lb = db.query(Leaderboard).filter(Leaderboard.id == lb_id).first()
     if not db_lb:
         raise HTTPException(404, "Leaderboard entry not found")
-    db.delete(db_lb)
+    leaderboard.remove_entry(db, db_lb)
     db.commit()
     return {"detail": "Leaderboard entry deleted"}
 
@@ -584,12 +907,14 @@ def create_configuration(config: ConfigurationCreate, db: Session = Depends(get_
     new_config = Configuration(**config.dict())
     db.add(new_config)
     db.commit()
+    entity_cache.invalidate(configuration_key(config.user_id))
     db.refresh(new_config)
     return new_config
 
 @app.get("/configurations/", response_model=List[ConfigurationOut])
-def read_configurations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(Configuration).offset(skip).limit(limit).all()
+def read_configurations(response: Response, cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000), skip: int = Query(0, ge=0, deprecated=True), db: Session = Depends(get_db)):
+    configurations = keyset_paginate(db.query(Configuration), [Configuration.id], cursor, limit, response, skip=skip)
+    return serialize_list(ConfigurationOut, configurations, response.headers)
 
 @app.get("/configurations/{config_id}", response_model=ConfigurationOut)
 def read_configuration(config_id: str, db: Session = Depends(get_db)):
@@ -599,11 +924,14 @@ def read_configuration(config_id: str, db: Session = Depends(get_db)):
     return config
 
 @app.get("/configurations/user/{user_id}", response_model=ConfigurationOut)
-def read_configuration(user_id: str, db: Session = Depends(get_db)):
-    config = db.query(Configuration).filter(Configuration.user_id == user_id).first()
+def read_configuration(user_id: str, request: Request, db: Session = Depends(get_db)):
+    config = cached_configuration(db, user_id)
     if not config:
         raise HTTPException(status_code=404, detail="Configuration not found")
-    return config
+    return conditional_response(
+        request, make_etag(config["id"], config["updatedAt"]), last_modified([config["updatedAt"]]),
+        CACHE_CONTROL["configuration"], lambda: DefaultResponse(config)
+    )
 
 @app.put("/configurations/{config_id}", response_model=ConfigurationOut)
 def update_configuration(config_id: str, config_in: ConfigurationBase, db: Session = Depends(get_db)):
@@ -613,6 +941,7 @@ def update_configuration(config_id: str, config_in: ConfigurationBase, db: Sessi
     for key, value in config_in.dict(exclude_unset=True).items():
         setattr(config, key, value)
     db.commit()
+    entity_cache.invalidate(configuration_key(config.user_id))
     db.refresh(config)
     return config
 
@@ -624,6 +953,7 @@ def update_configuration(user_id: str, config_in: ConfigurationBase, db: Session
     for key, value in config_in.dict(exclude_unset=True).items():
         setattr(config, key, value)
     db.commit()
+    entity_cache.invalidate(configuration_key(config.user_id))
     db.refresh(config)
     return config
 
@@ -634,10 +964,11 @@ def delete_configuration(config_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Configuration not found")
     db.delete(config)
     db.commit()
+    entity_cache.invalidate(configuration_key(config.user_id))
     return {"detail": "Configuration deleted"}
 
 
-@app.get("/text2speech/", response_model=object)
+@app.get("/text2speech/", response_model=object, dependencies=[Depends(admission("tts"))])
 def text2speech():
 
     user1_profile = UserProfile(
@@ -654,7 +985,7 @@ def text2speech():
     return generate_audio_for_user(user1_profile, content1)
 
 @app.post("/text2speech/")
-def text2speech(request: object = Body(...)):
+def text2speech(request: object = Body(...), slot: AdmissionSlot = Depends(admission_slot("tts"))):
 
     user_profile = UserProfile(
     user_id=request["user"]["user_id"], name=request["user"]["name"], age=request["user"]["age"],
@@ -668,20 +999,46 @@ def text2speech(request: object = Body(...)):
     )
     result = generate_audio_for_user(user_profile, content_input)
     audio_stream = result["stream"] 
-    return StreamingResponse(audio_stream, media_type="audio/mpeg")
+    # La sintesi avviene mentre il corpo viene inviato: il posto "tts" resta occupato fino alla fine
+    return AdmittedStreamingResponse(slot, audio_stream, media_type="audio/mpeg")
 
 
 
 @app.get("/download/{filename}")
 def download_file(filename: str):
-    safe_path = pathlib.Path(FILE_DIRECTORY).joinpath(filename).resolve()
-    base_dir = pathlib.Path(FILE_DIRECTORY).resolve()
-
-    if not safe_path.exists() or not safe_path.is_file() or base_dir not in safe_path.parents:
-        raise HTTPException(status_code=404, detail="File non trovato o accesso non consentito")
-
+    safe_path = resolve_upload(filename)
     return FileResponse(path=safe_path, filename=safe_path.name, media_type='application/octet-stream')
 
+@app.get("/images/stats")
+def image_pipeline_stats():
+    return image_pipeline.stats()
+
+# Immagini caricate con derivati WebP: ?w=640 restituisce il derivato più piccolo
+# largo almeno 640px. I file sono indirizzati per contenuto, quindi immutabili.
+def original_image_response(source: pathlib.Path, filename: str, cache_control: str) -> FileResponse:
+    headers = {"Cache-Control": cache_control, **UPLOAD_SECURITY_HEADERS}
+    media_type = raster_media_type(filename)
+    if media_type is None:
+        # Non raster (es. SVG caricati prima dell'allow-list): mai inline
+        return FileResponse(source, media_type="application/octet-stream", filename=source.name, headers=headers)
+    return FileResponse(source, media_type=media_type, headers=headers)
+
+@app.get("/images/{filename}")
+def read_image(filename: str, w: Optional[int] = Query(None, ge=1, le=4096)):
+    source = resolve_upload(filename)
+    # Cache immutabile solo per i nomi derivati dal contenuto
+    cache_control = CACHE_CONTROL["image" if is_content_addressed(filename) else "image_mutable"]
+    if w is not None:
+        derivative, ready = find_derivative(filename, w)
+        if derivative is not None:
+            return FileResponse(
+                derivative, media_type="image/webp", headers={"Cache-Control": cache_control, **UPLOAD_SECURITY_HEADERS}
+            )
+        if not ready:
+            # Derivati ancora in elaborazione: l'originale non va tenuto in cache a lungo
+            return original_image_response(source, filename, CACHE_CONTROL["image_pending"])
+    return original_image_response(source, filename, cache_control)
+
 @app.get("/downloadHTML/{filename}")
 def download_file(filename: str):
     safe_path = pathlib.Path(OUTPUT_HTML_DIR).joinpath(filename).resolve()
@@ -695,6 +1052,85 @@ def download_file(filename: str):
         media_type="text/html",
         headers={"Content-Disposition": "inline"}  # Mostra il file nell'iframe
     )
+
+# Export per analytics: letto e inviato a blocchi, senza caricare tutto in memoria
+@app.get("/export/{dataset}", dependencies=[Depends(require_admin)])
+def export_dataset(
+    dataset: Literal["articles", "users", "engagement"],
+    format: Literal["ndjson", "parquet"] = "ndjson",
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    status: Optional[str] = None
+):
+    try:
+        chunks = data_export.export(dataset, format, since, until, status)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return StreamingResponse(
+        chunks,
+        media_type=data_export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{format}"'}
+    )
+
+@app.get("/background/stats")
+def read_background_stats():
+    return background_jobs.stats()
+
+@app.get("/admission/stats")
+def read_admission_stats():
+    return admission_stats()
+
+# Profilo a campionamento del processo (profiler.py), in formato collapsed per i flame graph
+@app.post("/admin/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def run_profile(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(profiler.PROFILER_INTERVAL_MS, ge=1, le=1000),
+    idle: bool = False
+):
+    profiler.acquire()
+    try:
+        profile = profiler.SamplingProfiler(interval_ms, include_idle=idle)
+        profile.start()
+        await asyncio.sleep(seconds)  # l'event loop continua a servire le richieste mentre viene campionato
+        await asyncio.to_thread(profile.stop)
+    finally:
+        profiler.release()
+    return PlainTextResponse(profile.collapsed(), headers=profile.headers())
+
+@app.get("/admin/profile/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+def read_profile(profile_id: str):
+    return profiler.load_profile(profile_id)
+
+# Memoria del worker (memory.py): RSS e oggetti campionati, confronti tracemalloc
+@app.get("/memory/stats", dependencies=[Depends(require_admin)])
+def read_memory_stats():
+    return memory_sampler.stats()
+
+@app.post("/admin/memory/snapshots", dependencies=[Depends(require_admin)])
+async def take_memory_snapshot():
+    return await asyncio.to_thread(memory.take_snapshot)
+
+@app.get("/admin/memory/snapshots", dependencies=[Depends(require_admin)])
+def read_memory_snapshots():
+    return memory.list_snapshots()
+
+@app.get("/admin/memory/diff", dependencies=[Depends(require_admin)])
+async def diff_memory_snapshots(
+    base: int,
+    target: Optional[int] = Query(None, description="Snapshot di confronto; se assente lo stato attuale"),
+    group_by: Literal["lineno", "filename"] = "lineno",
+    top: int = Query(25, ge=1, le=500)
+):
+    return await asyncio.to_thread(memory.diff_snapshots, base, target, group_by, top)
+
+@app.delete("/admin/memory/snapshots", dependencies=[Depends(require_admin)])
+def stop_memory_tracing():
+    return memory.stop_tracing()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return entity_cache.stats()
+
 # Per eseguire l'app con Uvicorn (se esegui questo file direttamente)
 if __name__ == "__main__":
     logger.info(f"Avvio Uvicorn su host 0.0.0.0 e porta 8000...")
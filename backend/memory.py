@@ -0,0 +1,244 @@
+"""
+Strumentazione della memoria per i worker che restano attivi a lungo.
+
+- Campionamento periodico (MEMORY_SAMPLE_INTERVAL secondi) di RSS, blocchi allocati
+  dall'allocatore di Python e thread attivi, con uno storico limitato e la pendenza
+  della crescita, esposti da GET /memory/stats (solo admin). Niente gc.get_objects():
+  da un altro thread prende riferimenti a tuple ancora in costruzione e fa fallire
+  le richieste in corso con SystemError.
+- Snapshot tracemalloc su richiesta (endpoint /admin/memory/...): il primo snapshot
+  avvia il tracciamento, i confronti successivi mostrano dove cresce la memoria
+  allocata, raggruppata per modulo o per riga. Il tracciamento rallenta le
+  allocazioni, quindi resta spento finché non serve e si ferma con
+  DELETE /admin/memory/snapshots.
+
+benchmarks/soak.py usa queste metriche per far fallire un test di durata in caso di
+crescita non limitata.
+"""
+import gc
+import itertools
+import linecache
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+MEMORY_SAMPLE_INTERVAL = float(os.getenv("MEMORY_SAMPLE_INTERVAL", "30"))
+MEMORY_HISTORY = int(os.getenv("MEMORY_HISTORY", "240"))  # 2 ore con l'intervallo di default
+MEMORY_TRACEMALLOC_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "1"))
+MEMORY_MAX_SNAPSHOTS = int(os.getenv("MEMORY_MAX_SNAPSHOTS", "4"))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# Allocazioni di tracemalloc stesso e dell'import system, rumore nei confronti
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def rss_bytes() -> int:
+    """RSS corrente; dove /proc non esiste ripiega sul picco riportato da getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def linear_slope(points: List[Tuple[float, float]]) -> Optional[float]:
+    """Pendenza ai minimi quadrati di (x, y); None con meno di due punti distinti."""
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+
+def take_sample() -> dict:
+    return {
+        "time": time.time(),
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        # Contatore mantenuto dall'allocatore: costo costante, nessuna visita dell'heap
+        "allocated_blocks": sys.getallocatedblocks(),
+        "gc_counts": gc.get_count(),
+        "threads": threading.active_count(),
+        "traced_bytes": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+    }
+
+
+class MemorySampler:
+    def __init__(self, interval: float = MEMORY_SAMPLE_INTERVAL, history: int = MEMORY_HISTORY):
+        self.interval = interval
+        self.samples: Deque[dict] = deque(maxlen=history)
+        self.first: Optional[dict] = None
+        self.peak_rss = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self) -> dict:
+        sample = take_sample()
+        with self._lock:
+            self.samples.append(sample)
+            if self.first is None:
+                self.first = sample
+            self.peak_rss = max(self.peak_rss, sample["rss_bytes"])
+        return sample
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("Campionamento della memoria fallito")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self.sample()
+            self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        current = take_sample()  # sempre aggiornato, non entra nello storico
+        with self._lock:
+            samples = list(self.samples)
+            first = self.first
+        rss_slope = linear_slope([(s["time"], s["rss_bytes"]) for s in samples])
+        blocks_slope = linear_slope([(s["time"], s["allocated_blocks"]) for s in samples])
+        return {
+            "interval_seconds": self.interval,
+            "current": current,
+            "since_start": {
+                "seconds": round(current["time"] - first["time"], 1) if first else None,
+                "rss_bytes": current["rss_bytes"] - first["rss_bytes"] if first else None,
+                "allocated_blocks": current["allocated_blocks"] - first["allocated_blocks"] if first else None,
+            },
+            "peak_rss_bytes": max(self.peak_rss, current["rss_bytes"]),
+            # Pendenza sullo storico: positiva e stabile nel tempo indica una perdita
+            "rss_growth_bytes_per_hour": rss_slope * 3600 if rss_slope is not None else None,
+            "allocated_blocks_growth_per_hour": blocks_slope * 3600 if blocks_slope is not None else None,
+            "samples": samples,
+        }
+
+
+memory_sampler = MemorySampler()
+
+
+# Snapshot tracemalloc, numerati nell'ordine in cui sono stati presi
+_snapshots: "OrderedDict[int, Tuple[float, tracemalloc.Snapshot]]" = OrderedDict()
+_snapshot_ids = itertools.count(1)
+_snapshot_lock = threading.Lock()
+
+
+def take_snapshot() -> dict:
+    """Avvia tracemalloc se necessario e salva uno snapshot; i più vecchi oltre MEMORY_MAX_SNAPSHOTS vengono scartati."""
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(MEMORY_TRACEMALLOC_FRAMES)
+        logger.info(f"tracemalloc avviato ({MEMORY_TRACEMALLOC_FRAMES} frame per allocazione)")
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    with _snapshot_lock:
+        snapshot_id = next(_snapshot_ids)
+        _snapshots[snapshot_id] = (time.time(), snapshot)
+        while len(_snapshots) > MEMORY_MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    traced, peak = tracemalloc.get_traced_memory()
+    return {
+        "id": snapshot_id,
+        # Se il tracciamento parte ora lo snapshot è quasi vuoto: serve da base per i confronti
+        "started_tracing": started_tracing,
+        "traced_bytes": traced,
+        "traced_peak_bytes": peak,
+    }
+
+
+def list_snapshots() -> dict:
+    with _snapshot_lock:
+        snapshots = [
+            {"id": snapshot_id, "time": taken_at, "traces": len(snapshot.traces)}
+            for snapshot_id, (taken_at, snapshot) in _snapshots.items()
+        ]
+    return {"tracing": tracemalloc.is_tracing(), "snapshots": snapshots}
+
+
+def _get_snapshot(snapshot_id: int) -> Tuple[float, tracemalloc.Snapshot]:
+    with _snapshot_lock:
+        entry = _snapshots.get(snapshot_id)
+    if entry is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"Snapshot {snapshot_id} not found")
+    return entry
+
+
+def _location(frame: tracemalloc.Frame, group_by: str) -> dict:
+    filename = frame.filename
+    cwd = os.getcwd()
+    if filename.startswith(cwd + os.sep):
+        filename = os.path.relpath(filename, cwd)
+    if group_by == "filename":
+        return {"location": filename}
+    return {"location": f"{filename}:{frame.lineno}", "line": linecache.getline(frame.filename, frame.lineno).strip()}
+
+
+def diff_snapshots(base_id: int, target_id: Optional[int] = None, group_by: str = "lineno", top: int = 25) -> dict:
+    """Differenza tra due snapshot (o tra `base_id` e lo stato attuale), ordinata per crescita."""
+    base_time, base = _get_snapshot(base_id)
+    if target_id is not None:
+        target_time, target = _get_snapshot(target_id)
+    else:
+        if not tracemalloc.is_tracing():
+            raise HTTPException(status.HTTP_409_CONFLICT, "tracemalloc is not running")
+        target_time, target = time.time(), tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    stats = target.compare_to(base, group_by)
+    return {
+        "base": base_id,
+        "target": target_id,
+        "seconds": round(target_time - base_time, 1),
+        "group_by": group_by,
+        "size_diff_bytes": sum(stat.size_diff for stat in stats),
+        "count_diff": sum(stat.count_diff for stat in stats),
+        "top": [
+            {
+                **_location(stat.traceback[0], group_by),
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+            }
+            for stat in stats[:top]
+        ],
+    }
+
+
+def stop_tracing() -> dict:
+    """Ferma tracemalloc e libera gli snapshot salvati."""
+    with _snapshot_lock:
+        dropped = len(_snapshots)
+        _snapshots.clear()
+    was_tracing = tracemalloc.is_tracing()
+    tracemalloc.stop()
+    if was_tracing:
+        logger.info("tracemalloc fermato")
+    return {"stopped": was_tracing, "snapshots_dropped": dropped}
@@ -0,0 +1,188 @@
+"""
+Profiler a campionamento per il processo in esecuzione.
+
+Un thread dedicato legge a intervalli regolari lo stack di tutti gli altri thread
+(sys._current_frames): event loop, threadpool di FastAPI, lavori in background,
+flusher. Il processo non viene strumentato, quindi il costo dipende solo dalla
+frequenza di campionamento (PROFILER_INTERVAL_MS, 10 ms di default) e resta
+basso anche sul traffico reale; la frazione di tempo spesa a campionare è
+riportata con il risultato.
+
+Output in formato "collapsed" (una riga `thread;funzione;...;funzione conteggio`),
+letto da flamegraph.pl, speedscope e inferno.
+
+Due modalità:
+- POST /admin/profile?seconds=10: profilo di tutto il processo per un tempo fissato.
+- Header `X-Profile: 1` (con X-Admin-Token) su una richiesta qualsiasi: campiona il
+  processo mentre quella richiesta è in corso e salva il risultato, leggibile da
+  GET /admin/profile/{id} con l'id restituito in X-Profile-Id. Le richieste
+  concorrenti compaiono nello stesso profilo.
+
+Un solo profilo alla volta; per default gli stack dei thread inattivi (in attesa
+su lock, code o select) sono esclusi.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict
+
+from fastapi import HTTPException, status
+
+from auth import is_admin_token
+
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+# Le singole richieste durano poco: campionamento più fitto per il profilo mirato
+PROFILER_REQUEST_INTERVAL_MS = float(os.getenv("PROFILER_REQUEST_INTERVAL_MS", "1"))
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_DIR = os.getenv("PROFILER_DIR", "profiles")
+
+# Funzioni foglia che indicano un thread in attesa
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+_busy = threading.Lock()
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS, include_idle: bool = False):
+        self.interval = interval_ms / 1000
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self.started = self.stopped = None
+        self._labels: Dict[object, str] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = os.path.basename(code.co_filename)
+            label = self._labels[code] = f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+        return label
+
+    def _is_idle(self, frame) -> bool:
+        return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_LEAVES
+
+    def _sample(self, own_ident: int):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident or (not self.include_idle and self._is_idle(frame)):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            thread_name = self._thread_names.get(ident)
+            if thread_name is None:
+                self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+                thread_name = self._thread_names.get(ident, str(ident))
+            stack.append(thread_name)
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            started = time.perf_counter()
+            self._sample(own_ident)
+            self.sampling_seconds += time.perf_counter() - started
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        self._thread.join()
+        self.stopped = time.perf_counter()
+        return self
+
+    @property
+    def overhead(self) -> float:
+        """Frazione del tempo di un core spesa a campionare."""
+        elapsed = (self.stopped or time.perf_counter()) - self.started
+        return self.sampling_seconds / elapsed if elapsed else 0.0
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def headers(self) -> dict:
+        return {"X-Profile-Samples": str(self.samples), "X-Profile-Overhead": f"{self.overhead:.4f}"}
+
+
+def acquire():
+    """Riserva il profiler; 409 se un altro profilo è già in corso."""
+    if not _busy.acquire(blocking=False):
+        raise HTTPException(status.HTTP_409_CONFLICT, "Another profile is already running")
+
+
+def release():
+    _busy.release()
+
+
+def new_profile_id() -> str:
+    return f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+
+def save_profile(profile: SamplingProfiler, profile_id: str):
+    os.makedirs(PROFILER_DIR, exist_ok=True)
+    with open(os.path.join(PROFILER_DIR, f"{profile_id}.collapsed"), "w", encoding="utf-8") as f:
+        f.write(profile.collapsed())
+
+
+def load_profile(profile_id: str) -> str:
+    base_dir = os.path.realpath(PROFILER_DIR)
+    path = os.path.realpath(os.path.join(base_dir, f"{profile_id}.collapsed"))
+    if os.path.dirname(path) != base_dir or not os.path.isfile(path):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Profile not found")
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+class ProfileRequestMiddleware:
+    """Profilo mirato: richieste con `X-Profile: 1` e un X-Admin-Token valido."""
+
+    def __init__(self, app, interval_ms: float = PROFILER_REQUEST_INTERVAL_MS):
+        self.app = app
+        self.interval_ms = interval_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") not in (b"1", b"true") or not is_admin_token(
+            headers.get(b"x-admin-token", b"").decode("latin-1") or None
+        ):
+            await self.app(scope, receive, send)
+            return
+        if not _busy.acquire(blocking=False):
+            await self.app(scope, receive, send)  # profiler occupato: la richiesta procede senza profilo
+            return
+
+        profile = SamplingProfiler(self.interval_ms)
+        profile_id = new_profile_id()  # noto prima della risposta
+        profile.start()
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.stop()
+            _busy.release()
+            save_profile(profile, profile_id)
@@ -1,15 +1,21 @@
 from elevenlabs import ElevenLabs, save
 from dotenv import load_dotenv
 import os
-from typing import List, Dict, Any, Optional, Literal
+import re
+import hashlib
+import tempfile
+import unicodedata
+from typing import List, Dict, Any, Optional, Literal, Iterator
 from pathlib import Path
 from pydantic import BaseModel, Field
+from tracing import span
 
 # Carica le variabili d'ambiente dal file .env
 load_dotenv()
 
 # --- CONFIGURATION: OUTPUT DIRECTORY ---
 AUDIO_OUTPUT_DIRECTORY = "generated_audio" # Name of the folder to save audio files
+SEGMENT_CACHE_DIRECTORY = os.path.join(AUDIO_OUTPUT_DIRECTORY, "segments") # Per-sentence audio cache
 
 class UserProfile(BaseModel):
     user_id: str
@@ -95,6 +101,188 @@ def select_voice_id(profile: UserProfile) -> str:
     return VOICE_PROFILES["default"]
 
 
+# --- SENTENCE-LEVEL SEGMENT CACHE ---
+# Output formats whose segments can be joined by plain byte concatenation.
+# MP3 is a sequence of self-contained frames (the ID3 tags and the Xing/Info
+# header frame of every segment after the first must go), PCM and u-law are
+# headerless sample streams.
+_CONCATENABLE_FORMAT_PREFIXES = ("mp3_", "pcm_", "ulaw_")
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?\u2026])\s+|\n+")
+
+
+def normalize_sentence(sentence: str) -> str:
+    """
+    Normalizes a sentence for cache lookup without changing how it is spoken:
+    Unicode NFC and collapsed whitespace.
+    """
+    return " ".join(unicodedata.normalize("NFC", sentence).split())
+
+
+def split_sentences(text: str) -> List[str]:
+    """Splits text into normalized, non-empty sentences."""
+    sentences = (normalize_sentence(part) for part in _SENTENCE_BOUNDARY.split(text))
+    return [sentence for sentence in sentences if sentence]
+
+
+def segment_cache_path(
+    sentence: str,
+    voice_id: str,
+    model_id: str,
+    output_format: str,
+    cache_directory: str = SEGMENT_CACHE_DIRECTORY,
+    previous_text: str = "",
+    next_text: str = "",
+) -> Path:
+    """
+    Returns the cache file for a normalized sentence rendered with the given
+    voice/model/format. The neighbouring sentences are part of the key, because
+    they are passed to the model as context and change the prosody.
+    """
+    key = hashlib.sha256(
+        f"{model_id}\0{output_format}\0{previous_text}\0{sentence}\0{next_text}".encode("utf-8")
+    ).hexdigest()
+    extension = output_format.split("_", 1)[0]
+    return Path(cache_directory) / voice_id / output_format / f"{key}.{extension}"
+
+
+def strip_mp3_tags(data: bytes) -> bytes:
+    """
+    Removes a leading ID3v2 tag and a trailing ID3v1 tag so that MP3 segments
+    can be concatenated into a single valid stream of frames.
+    """
+    if len(data) >= 10 and data[:3] == b"ID3":
+        # Tag size is a 28-bit syncsafe integer, excluding the 10-byte header
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        if data[5] & 0x10:  # footer present
+            size += 10
+        data = data[10 + size:]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+
+# Layer III bitrates (kbps) by bitrate index, for MPEG-1 and for MPEG-2/2.5
+_MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def strip_mp3_info_frame(data: bytes) -> bytes:
+    """
+    Removes the leading Xing/Info (or VBRI) header frame written by the encoder.
+    It describes only its own segment, so in the middle of a concatenated stream
+    it would be decoded as a silent frame with bogus length information.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] & 0xE0 != 0xE0:
+        return data
+    version_bits = (data[1] >> 3) & 0x03  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer_bits = (data[1] >> 1) & 0x03  # 1 = Layer III
+    bitrate_index = data[2] >> 4
+    sample_rate_index = (data[2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return data
+    mpeg1 = version_bits == 3
+    bitrate = _MP3_BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][sample_rate_index]
+    padding = (data[2] >> 1) & 0x01
+    frame_length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+
+    mono = (data[3] >> 6) == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing_offset = 4 + side_info
+    if data[xing_offset:xing_offset + 4] in (b"Xing", b"Info") or data[36:40] == b"VBRI":
+        return data[frame_length:]
+    return data
+
+
+def _synthesize_segment(
+    client: ElevenLabs,
+    sentence: str,
+    voice_id: str,
+    model_id: str,
+    output_format: str,
+    previous_text: str = "",
+    next_text: str = "",
+) -> bytes:
+    with span("elevenlabs.text_to_speech", kind="client", **{"tts.model": model_id, "tts.characters": len(sentence)}):
+        # Neighbouring sentences as context: prosody stays continuous across segment boundaries
+        audio_stream = client.text_to_speech.convert(
+            voice_id=voice_id,
+            output_format=output_format,
+            text=sentence,
+            model_id=model_id,
+            previous_text=previous_text or None,
+            next_text=next_text or None,
+        )
+        return b"".join(audio_stream)
+
+
+def _write_segment(cache_path: Path, segment: bytes):
+    """
+    Atomic write: concurrent readers never see a truncated segment. The temp file
+    is unique per call, so two requests caching the same sentence do not collide;
+    a failed write only loses the cache entry, the segment is already in memory.
+    """
+    tmp_name = None
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=cache_path.parent, prefix=f"{cache_path.name}.", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(segment)
+        os.replace(tmp_name, cache_path)
+    except OSError as e:
+        print(f"TTS segment cache: could not store {cache_path.name}: {e}")
+        if tmp_name is not None and os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
+def synthesize_with_segment_cache(
+    client: ElevenLabs,
+    text: str,
+    voice_id: str,
+    model_id: str,
+    output_format: str,
+    cache_directory: str = SEGMENT_CACHE_DIRECTORY,
+) -> Iterator[bytes]:
+    """
+    Yields the audio for `text` one sentence at a time, reading each sentence
+    from the segment cache when available and synthesizing (and caching) it otherwise.
+    Segments are yielded lazily, so playback can start after the first sentence.
+    Each sentence is synthesized with its neighbours as context; a cached segment
+    is reused only when the neighbours match too.
+    """
+    is_mp3 = output_format.startswith("mp3_")
+    cached_chars = 0
+    synthesized_chars = 0
+
+    sentences = split_sentences(text)
+    for index, sentence in enumerate(sentences):
+        previous_text = sentences[index - 1] if index > 0 else ""
+        next_text = sentences[index + 1] if index + 1 < len(sentences) else ""
+        cache_path = segment_cache_path(
+            sentence, voice_id, model_id, output_format, cache_directory, previous_text, next_text
+        )
+        if cache_path.is_file():
+            segment = cache_path.read_bytes()
+            cached_chars += len(sentence)
+        else:
+            segment = _synthesize_segment(client, sentence, voice_id, model_id, output_format, previous_text, next_text)
+            if is_mp3:
+                segment = strip_mp3_tags(segment)
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            _write_segment(cache_path, segment)
+            synthesized_chars += len(sentence)
+        if is_mp3 and index > 0:
+            segment = strip_mp3_info_frame(segment)
+        yield segment
+
+    print(f"TTS segment cache: {cached_chars} chars from cache, {synthesized_chars} chars synthesized")
+
+# --- END SEGMENT CACHE ---
+
+
 def generate_audio_for_user(
     user_profile: UserProfile,
     content: ContentInput,
@@ -102,12 +290,15 @@ def generate_audio_for_user(
     base_filename: str = "output.mp3", # Just the filename, not the path
     output_directory: str = AUDIO_OUTPUT_DIRECTORY, # Use the configured directory
     model_id: str = "eleven_multilingual_v2",
-    output_format: str = "mp3_44100_128"
+    output_format: str = "mp3_44100_128",
+    use_segment_cache: bool = True,
 ) -> object:
     """
     Generates audio for the given user profile and content, saving it to a file
     within the specified output directory.
     Returns the full path to the saved audio file.
+    When `use_segment_cache` is set and the output format can be concatenated,
+    the narration is assembled from cached per-sentence segments.
     """
     selected_voice_id = select_voice_id(user_profile)
     print(f"User: {user_profile.name or user_profile.user_id}, Age: {user_profile.age}, Preferred Gender: {user_profile.preferred_voice_gender}, Preferred Style: {user_profile.preferred_voice_style}")
@@ -122,12 +313,23 @@ def generate_audio_for_user(
     full_output_path = output_dir_path / base_filename
 
     try:
-        audio_stream = client.text_to_speech.convert(
-            voice_id=selected_voice_id,
-            output_format=output_format,
-            text=content.original_text,
-            model_id=model_id,
-        )
+        if use_segment_cache and output_format.startswith(_CONCATENABLE_FORMAT_PREFIXES):
+            audio_stream = synthesize_with_segment_cache(
+                client,
+                content.original_text,
+                voice_id=selected_voice_id,
+                model_id=model_id,
+                output_format=output_format,
+            )
+        else:
+            # Stream: lo span copre l'apertura della richiesta, non la lettura dell'audio
+            with span("elevenlabs.text_to_speech", kind="client", **{"tts.model": model_id, "tts.streaming": True}):
+                audio_stream = client.text_to_speech.convert(
+                    voice_id=selected_voice_id,
+                    output_format=output_format,
+                    text=content.original_text,
+                    model_id=model_id,
+                )
 
         # save(audio_stream, str(full_output_path)) # save expects a string path
         print(f"Audio successfully saved to {full_output_path}")
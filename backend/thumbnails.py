@@ -0,0 +1,208 @@
+"""
+Derivati delle immagini caricate: copie ridimensionate in WebP a larghezze standard.
+
+Dopo l'upload (uploads.store_upload) l'immagine originale viene passata a un pool di
+processi dedicato (IMAGE_WORKERS), fuori dal percorso della richiesta: decodifica e
+ricodifica con Pillow sono lavoro di CPU che non deve fermare l'event loop né
+competere con il GIL del worker che serve le API.
+
+Per ogni larghezza di IMAGE_WIDTHS viene scritto `derivatives/<chiave>-<larghezza>.webp`
+(senza ingrandire: le larghezze oltre l'originale si fermano alla prima, salvata alla
+dimensione originale) e per ultimo il manifest `<chiave>.json` con le larghezze
+prodotte. Il manifest indica che l'elaborazione è conclusa: senza di esso
+l'endpoint serve l'originale con una policy di cache breve, e si potrà riprovare
+più avanti. Con il manifest i derivati sono immutabili, perché la chiave è
+l'hash del contenuto originale.
+
+Derivati per upload già presenti: python -m thumbnails [--force]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from uploads import UPLOAD_DIR, is_content_addressed
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WIDTHS = tuple(sorted(int(w) for w in os.getenv("IMAGE_WIDTHS", "320,640,1280").split(",")))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+DERIVATIVE_DIR = os.getenv("IMAGE_DERIVATIVE_DIR", os.path.join(UPLOAD_DIR, "derivatives"))
+
+
+def derivative_key(filename: str) -> str:
+    # Per i nomi legacy anche l'estensione, altrimenti foto.jpg e foto.png condividono i derivati
+    return pathlib.Path(filename).stem if is_content_addressed(filename) else filename
+
+
+def _manifest_path(directory: str, key: str) -> str:
+    return os.path.join(directory, f"{key}.json")
+
+
+def _write_atomic(path: str, write):
+    temp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def render_derivatives(source: str, directory: str, key: str, widths: Sequence[int], quality: int) -> List[int]:
+    """Eseguita nei processi del pool: scrive i WebP e il manifest, restituisce le larghezze prodotte."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    os.makedirs(directory, exist_ok=True)
+    produced = []
+    try:
+        with Image.open(source) as image:
+            if getattr(image, "is_animated", False):
+                logger.info(f"{source}: immagine animata, nessun derivato")
+            else:
+                # JPEG: decodifica direttamente a una scala ridotta, se basta per la larghezza massima
+                image.draft("RGB", (max(widths), max(widths)))
+                image = ImageOps.exif_transpose(image)
+                image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+                for width in widths:
+                    target = min(width, image.width)
+                    resized = image if target == image.width else image.resize(
+                        (target, max(1, round(image.height * target / image.width))), Image.Resampling.LANCZOS
+                    )
+                    _write_atomic(
+                        os.path.join(directory, f"{key}-{width}.webp"),
+                        lambda path: resized.save(path, "WEBP", quality=quality, method=4),
+                    )
+                    produced.append(width)
+                    if target == image.width:
+                        break  # le larghezze successive sarebbero identiche
+    except UnidentifiedImageError:
+        # Formati che Pillow non decodifica: resta solo l'originale
+        logger.info(f"{source}: formato non supportato, nessun derivato")
+        produced = []
+    except Exception:
+        logger.exception(f"Derivati non generati per {source}")
+        produced = []
+
+    def write_manifest(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"source": os.path.basename(source), "widths": produced}, f)
+
+    _write_atomic(_manifest_path(directory, key), write_manifest)
+    return produced
+
+
+def read_manifest(filename: str, directory: str = DERIVATIVE_DIR) -> Optional[dict]:
+    try:
+        with open(_manifest_path(directory, derivative_key(filename)), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def find_derivative(filename: str, width: int, directory: str = DERIVATIVE_DIR) -> Tuple[Optional[pathlib.Path], bool]:
+    """
+    (percorso, pronto): il derivato più piccolo largo almeno `width` (o il più grande
+    disponibile); `pronto` è False finché l'elaborazione non è conclusa.
+    """
+    manifest = read_manifest(filename, directory)
+    if manifest is None:
+        return None, False
+    widths = manifest["widths"]
+    if not widths:
+        return None, True
+    chosen = next((w for w in widths if w >= width), widths[-1])
+    return pathlib.Path(directory, f"{derivative_key(filename)}-{chosen}.webp"), True
+
+
+class ImagePipeline:
+    def __init__(self, workers: int = IMAGE_WORKERS, widths: Sequence[int] = IMAGE_WIDTHS,
+                 quality: int = IMAGE_WEBP_QUALITY, directory: str = DERIVATIVE_DIR):
+        self.workers = workers
+        self.widths = tuple(widths)
+        self.quality = quality
+        self.directory = directory
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"processed": 0, "failed": 0, "total_seconds": 0.0}
+
+    def start(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn, come per bcrypt: i processi non ereditano i thread del server
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            # Le elaborazioni in corso terminano; quelle in coda si recuperano con la CLI
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, filename: str, source_directory: str = UPLOAD_DIR) -> Future:
+        self.start()
+        source = os.path.join(source_directory, filename)
+        started = time.perf_counter()
+        with self._lock:
+            self._pending += 1
+            future = self._pool.submit(
+                render_derivatives, source, self.directory, derivative_key(filename), self.widths, self.quality
+            )
+
+        def done(f: Future):
+            with self._lock:
+                self._pending -= 1
+                self._stats["total_seconds"] += time.perf_counter() - started
+                if f.cancelled() or f.exception() is not None:
+                    self._stats["failed"] += 1
+                else:
+                    self._stats["processed"] += 1
+            if not f.cancelled() and f.exception() is not None:
+                logger.error(f"Derivati di {filename} falliti: {f.exception()}")
+
+        future.add_done_callback(done)
+        return future
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = self._stats["processed"] + self._stats["failed"]
+            return {
+                "workers": self.workers,
+                "widths": list(self.widths),
+                "pending": self._pending,
+                **self._stats,
+                "avg_seconds": self._stats["total_seconds"] / done if done else None,
+            }
+
+
+image_pipeline = ImagePipeline()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera i derivati WebP delle immagini già caricate.")
+    parser.add_argument("--force", action="store_true", help="rigenera anche le immagini che hanno già un manifest")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    filenames = [
+        entry.name for entry in os.scandir(UPLOAD_DIR)
+        if entry.is_file() and not entry.name.startswith(".") and (args.force or read_manifest(entry.name) is None)
+    ]
+    futures = [image_pipeline.submit(filename) for filename in filenames]
+    for filename, future in zip(filenames, futures):
+        logger.info(f"{filename}: larghezze {future.result()}")
+    image_pipeline.stop()
+    print(image_pipeline.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Tracing leggero per richieste, query, chiamate ai provider e lavori in background.
+
+Ogni richiesta HTTP apre uno span radice (TracingMiddleware); gli span figli sono
+creati con `span(...)` e seguono il contesto corrente tramite contextvars, quindi
+attraversano await, run_in_threadpool e le sessioni async di SQLAlchemy. Le query
+sono tracciate con gli eventi dell'engine (`instrument_engine`). I lavori in
+background catturano il contesto al momento dell'invio (`current_context`) e lo
+usano come padre, così compaiono nella traccia della richiesta che li ha creati.
+
+Se la richiesta porta un header W3C `traceparent`, la traccia lo prosegue; la
+risposta riporta sempre `traceparent` con l'id della traccia.
+
+Gli span chiusi vengono scritti da un thread dedicato in TRACING_FILE, una riga per
+batch nel formato OTLP/JSON (lo stesso del file exporter del collector
+OpenTelemetry), quindi non serve nessun collector per raccoglierli; il file viene
+ruotato oltre TRACING_MAX_BYTES. La coda verso il thread contiene al più
+TRACING_QUEUE_SIZE span: se il thread non tiene il passo (o non è avviato, come
+negli script che importano l'app senza lifespan) gli span in più vengono scartati
+e contati, invece di accumularsi in memoria.
+
+Il tracing è spento per default. Configurazione: TRACING_ENABLED=1,
+TRACING_FILE=traces.jsonl, TRACING_SAMPLE_RATE=1.0, TRACING_MAX_BYTES=50 MiB,
+TRACING_QUEUE_SIZE=10000
+
+Richieste più lente e dove hanno speso il tempo: python -m tracing --top 10
+"""
+import argparse
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "1.0"))
+TRACING_MAX_BYTES = int(os.getenv("TRACING_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACING_QUEUE_SIZE = int(os.getenv("TRACING_QUEUE_SIZE", "10000"))
+SERVICE_NAME = "fluidcontent-backend"
+
+MAX_STATEMENT_LENGTH = 1000
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Valori OTLP di SpanKind e StatusCode
+_KINDS = {"internal": 1, "server": 2, "client": 3}
+_STATUS_OK, _STATUS_ERROR = 1, 2
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: Optional[str]
+    kind: str = "internal"
+    attributes: Dict[str, object] = field(default_factory=dict)
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    error: Optional[str] = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, exc: BaseException):
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        if self.context.sampled:
+            exporter.export(self)
+
+    def to_otlp(self) -> dict:
+        otlp = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": _KINDS[self.kind],
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": _STATUS_ERROR, "message": self.error} if self.error else {"code": _STATUS_OK},
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_context() -> Optional[SpanContext]:
+    """Contesto dello span corrente, da passare a lavori eseguiti altrove (es. in background)."""
+    current = _current.get()
+    return current.context if current is not None else None
+
+
+def start_span(name: str, parent: Optional[SpanContext] = None, kind: str = "internal", **attributes) -> Optional[Span]:
+    if not TRACING_ENABLED:
+        return None
+    if parent is None:
+        current = _current.get()
+        parent = current.context if current is not None else None
+    if parent is not None:
+        context = SpanContext(parent.trace_id, secrets.token_hex(8), parent.sampled)
+    else:
+        context = SpanContext(secrets.token_hex(16), secrets.token_hex(8), random.random() < TRACING_SAMPLE_RATE)
+    return Span(name, context, parent.span_id if parent else None, kind, attributes)
+
+
+@contextmanager
+def span(name: str, parent: Optional[SpanContext] = None, kind: str = "internal", **attributes) -> Iterator[Optional[Span]]:
+    """Span figlio dello span corrente (o di `parent`); registra l'eccezione se il blocco fallisce."""
+    current = start_span(name, parent, kind, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.record_error(exc)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    match = _TRACEPARENT.match(header or "")
+    if match is None:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return SpanContext(trace_id, span_id, sampled=bool(int(flags, 16) & 1))
+
+
+def format_traceparent(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+
+class TracingMiddleware:
+    """Span radice per ogni richiesta HTTP, con il template della route come nome."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        root = start_span(f"{scope['method']} {scope['path']}", parent, kind="server",
+                          **{"http.method": scope["method"], "http.target": scope["path"]})
+        token = _current.set(root)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (b"traceparent", format_traceparent(root.context).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as exc:
+            root.record_error(exc)
+            raise
+        finally:
+            _current.reset(token)
+            # FastAPI aggiunge la route allo scope durante il routing
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                root.name = f"{scope['method']} {route.path}"
+                root.set_attribute("http.route", route.path)
+            if root.attributes.get("http.status_code", 200) >= 500 and root.error is None:
+                root.error = f"HTTP {root.attributes['http.status_code']}"
+            root.end()
+
+
+def instrument_engine(engine):
+    """Uno span per ogni statement eseguito dall'engine (sincrono, o `sync_engine` di quello async)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is None:
+            return  # query fuori da una traccia (es. flusher dei contatori)
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        query_span = start_span(f"db {operation}", kind="client", **{
+            "db.system": engine.dialect.name,
+            "db.statement": statement[:MAX_STATEMENT_LENGTH],
+            "db.executemany": executemany,
+        })
+        if context is not None:
+            context._trace_span = query_span
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        query_span = getattr(context, "_trace_span", None)
+        if query_span is not None:
+            if cursor is not None and cursor.rowcount is not None and cursor.rowcount >= 0:
+                query_span.set_attribute("db.rowcount", cursor.rowcount)
+            query_span.end()
+            context._trace_span = None
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        context = exception_context.execution_context
+        query_span = getattr(context, "_trace_span", None)
+        if query_span is not None:
+            query_span.record_error(exception_context.original_exception)
+            query_span.end()
+            context._trace_span = None
+
+
+class FileSpanExporter:
+    """Scrive gli span chiusi in un file JSON lines (OTLP/JSON) da un thread separato."""
+
+    def __init__(self, path: str = TRACING_FILE, max_bytes: int = TRACING_MAX_BYTES,
+                 batch_size: int = 512, interval: float = 1.0, queue_size: int = TRACING_QUEUE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.interval = interval
+        self.exported = 0
+        self.dropped = 0
+        self._reported_drops = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def export(self, finished: Span):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1  # letto solo per il log: un conteggio approssimato tra thread va bene
+
+    def start(self):
+        if self._thread is None and TRACING_ENABLED:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        spans: List[Span] = []
+        while True:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if self.dropped > self._reported_drops:
+            logger.warning(f"Coda delle tracce piena: {self.dropped - self._reported_drops} span scartati")
+            self._reported_drops = self.dropped
+        for start in range(0, len(spans), self.batch_size):
+            self._write(spans[start:start + self.batch_size])
+
+    def _write(self, spans: List[Span]):
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [s.to_otlp() for s in spans]}],
+        }]}, separators=(",", ":"))
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.exported += len(spans)
+        except OSError:
+            logger.exception("Scrittura delle tracce fallita")
+
+
+exporter = FileSpanExporter()
+
+
+def load_traces(path: str) -> Dict[str, List[dict]]:
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for otlp_span in scope["spans"]:
+                        traces[otlp_span["traceId"]].append(otlp_span)
+    return traces
+
+
+def _duration_ms(otlp_span: dict) -> float:
+    return (int(otlp_span["endTimeUnixNano"]) - int(otlp_span["startTimeUnixNano"])) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Richieste più lente nel file delle tracce, con il tempo per tipo di span.")
+    parser.add_argument("--file", default=TRACING_FILE)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    roots = []
+    for spans in load_traces(args.file).values():
+        for root in (s for s in spans if s.get("kind") == _KINDS["server"]):
+            roots.append((root, spans))
+    roots.sort(key=lambda item: _duration_ms(item[0]), reverse=True)
+
+    for root, spans in roots[:args.top]:
+        print(f"{_duration_ms(root):9.1f} ms  {root['name']}  trace={root['traceId']}")
+        breakdown: Dict[str, List[float]] = defaultdict(list)
+        for child in spans:
+            if child is not root:
+                name = child["name"].split(" ", 1)[0] if child["name"].startswith("db ") else child["name"]
+                breakdown[name].append(_duration_ms(child))
+        for name, durations in sorted(breakdown.items(), key=lambda item: -sum(item[1])):
+            print(f"{'':12}{sum(durations):9.1f} ms  {name} x{len(durations)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Archiviazione delle immagini caricate, indirizzata per contenuto.
+
+Ogni file viene letto a blocchi da UploadFile e scritto su disco con aiofiles
+mentre se ne calcola lo SHA-256, senza mai tenerlo interamente in memoria. Il
+nome definitivo è `<sha256><estensione>`: lo stesso contenuto caricato due volte
+occupa un solo file, e nomi uguali scelti dai client non si sovrascrivono più.
+
+Limiti:
+- UPLOAD_MAX_BYTES per singolo file, verificato durante la copia (413).
+- UPLOAD_MAX_REQUEST_BYTES per l'intera richiesta sulle route di upload, applicato
+  da UploadSizeLimitMiddleware prima del parsing del form: subito sul
+  Content-Length dichiarato e, se manca o è falso, contando i byte ricevuti.
+
+Configurazione: UPLOAD_DIR=uploads, UPLOAD_MAX_BYTES=10 MiB,
+UPLOAD_MAX_REQUEST_BYTES=40 MiB, UPLOAD_CHUNK_SIZE=1 MiB
+"""
+import hashlib
+import logging
+import os
+import pathlib
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile, status
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(40 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Tipi immagine accettati, solo raster. Niente SVG: può contenere script e verrebbe
+# servito dall'origine dell'API
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+}
+
+# Tipi serviti inline da /images; il resto (file precedenti all'allow-list) solo come download
+RASTER_MEDIA_TYPES = {**{ext: media_type for media_type, ext in IMAGE_EXTENSIONS.items()}, ".jpeg": "image/jpeg"}
+
+# Per ogni file caricato dagli utenti: niente sniffing del tipo e nessuno script eseguibile
+UPLOAD_SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "Content-Security-Policy": "default-src 'none'; sandbox",
+}
+
+_CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9+]+)?$")
+
+
+@dataclass
+class StoredFile:
+    filename: str  # nome su disco, `<sha256><estensione>`
+    sha256: str
+    size: int
+    created: bool  # False se lo stesso contenuto era già presente
+
+
+def _extension(upload: UploadFile) -> str:
+    content_type = (upload.content_type or "").split(";")[0].strip().lower()
+    if content_type not in IMAGE_EXTENSIONS:
+        raise HTTPException(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f"Unsupported file type: {content_type or 'unknown'}")
+    return IMAGE_EXTENSIONS[content_type]
+
+
+async def store_upload(upload: UploadFile, directory: str = UPLOAD_DIR, max_bytes: int = UPLOAD_MAX_BYTES) -> StoredFile:
+    """Copia `upload` in `directory` a blocchi e lo salva con il suo hash come nome."""
+    extension = _extension(upload)
+    await aiofiles.os.makedirs(directory, exist_ok=True)
+    # File temporaneo nella stessa cartella, così il rename finale è atomico
+    temp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        f"File {upload.filename!r} exceeds {max_bytes} bytes",
+                    )
+                digest.update(chunk)
+                await f.write(chunk)
+        sha256 = digest.hexdigest()
+        filename = f"{sha256}{extension}"
+        final_path = os.path.join(directory, filename)
+        if await aiofiles.os.path.exists(final_path):
+            await aiofiles.os.remove(temp_path)
+            return StoredFile(filename, sha256, size, created=False)
+        await aiofiles.os.replace(temp_path, final_path)
+        return StoredFile(filename, sha256, size, created=True)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def is_content_addressed(filename: str) -> bool:
+    """Vero per i file salvati da store_upload (gli upload precedenti usano il nome del client)."""
+    return _CONTENT_ADDRESSED.match(filename) is not None
+
+
+def raster_media_type(filename: str) -> Optional[str]:
+    return RASTER_MEDIA_TYPES.get(os.path.splitext(filename)[1].lower())
+
+
+def resolve_upload(filename: str, directory: str = UPLOAD_DIR) -> pathlib.Path:
+    """Percorso di un file caricato, o 404 se non esiste o esce dalla cartella."""
+    base_dir = pathlib.Path(directory).resolve()
+    path = base_dir.joinpath(filename).resolve()
+    if base_dir not in path.parents or not path.is_file():
+        raise HTTPException(status_code=404, detail="File non trovato o accesso non consentito")
+    return path
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rifiuta con 413 le richieste verso `paths` il cui corpo supera `max_bytes`,
+    prima che il form multipart venga letto e salvato su file temporanei.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Propagata dal parsing del form e convertita in risposta da FastAPI
+                    raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _detail(self) -> str:
+        return f"Request body exceeds {self.max_bytes} bytes"
+
+    async def _reject(self, scope, receive, send):
+        logger.info(f"Upload rifiutato su {scope['path']}: oltre {self.max_bytes} byte")
+        response = JSONResponse({"detail": self._detail()}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                headers={"Connection": "close"})
+        await response(scope, receive, send)
@@ -190,7 +190,9 @@ const openExternalResource = () => {
         {/* Article Header */}
         <div className="mb-8">
           <img 
-            src={isValidUrl(article.thumbnail) ? article.thumbnail : import.meta.env.VITE_API_URL + "/download/"+ article.thumbnail}
+            src={isValidUrl(article.thumbnail) ? article.thumbnail : import.meta.env.VITE_API_URL + "/images/" + article.thumbnail + "?w=1280"}
+            srcSet={isValidUrl(article.thumbnail) ? undefined : [640, 1280].map((w) => `${import.meta.env.VITE_API_URL}/images/${article.thumbnail}?w=${w} ${w}w`).join(", ")}
+            sizes="(min-width: 1024px) 1024px, 100vw"
             alt={article.title}
             className="w-full h-64 md:h-80 rounded-lg object-cover mb-6"
           />
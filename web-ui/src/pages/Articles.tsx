@@ -54,6 +54,11 @@ function isValidUrl(value) {
   }
 }
 
+// Derivato WebP dell'immagine caricata, largo almeno `width` pixel
+function imageUrl(filename: string, width: number) {
+  return `${import.meta.env.VITE_API_URL}/images/${filename}?w=${width}`;
+}
+
   
 // allTags ora sono i nomi unici dei tag
 const allTags = [...new Set(articles.flatMap(article => article.tags.map(tag => tag)))];
@@ -196,7 +201,11 @@ const toggleTag = (tagName: string) => {
             <Card key={article.id} className="p-6 hover-lift">
               <div className="flex flex-col md:flex-row gap-6">
                 <img 
-                  src={isValidUrl(article.thumbnail) ? article.thumbnail : import.meta.env.VITE_API_URL + "/download/"+ article.thumbnail}
+                  src={isValidUrl(article.thumbnail) ? article.thumbnail : imageUrl(article.thumbnail, 640)}
+                  srcSet={isValidUrl(article.thumbnail) ? undefined : `${imageUrl(article.thumbnail, 320)} 320w, ${imageUrl(article.thumbnail, 640)} 640w`}
+                  sizes="(min-width: 768px) 192px, 100vw"
+                  loading="lazy"
+                  decoding="async"
                   alt={article.title}
                   className="w-full md:w-48 h-32 rounded-lg object-cover"
                 />